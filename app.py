@@ -1,25 +1,50 @@
 import streamlit as st 
-import google.generativeai as genai
-from gtts import gTTS
-import os
-from datetime import datetime
-import uuid
-from streamlit_webrtc import webrtc_streamer
-import speech_recognition as sr
-import queue
-import threading
-import av
-import numpy as np
-import base64
-import re
-
-GOOGLE_API_KEY = ""
-genai.configure(api_key=GOOGLE_API_KEY)
-gemini = genai.GenerativeModel("gemini-1.5-flash")
+
+from common.chat_stream import stream_reply
+from common.chat_view import render_history
+from common.description_cache import description_cache
+from common.image_input import ImageInput
+from common.image_prep import PrepConfig, preprocess
+from common.scratch import scratch
+from common.services import (
+    follow_up_suggestions, get_model, new_conversation, prefetch_follow_ups, resume_conversation, save_image, speak,
+    strip_markdown, text_to_speech, upload_image_to_gemini, voice_input,
+)
+from common.tracing import render_panel, tracer
+
+# Times this script run; render_panel() at the bottom of the page ends it
+run_span = tracer.begin("page.run")
+
+gemini = get_model("gemini-1.5-flash")
+
+# Downscale photos before they are uploaded; set to None to send originals
+IMAGE_PREP = PrepConfig(max_side=1536, format="JPEG", quality=85)
+
+# Answer repeated questions about the same image from the shared response cache (False opts out)
+RESPONSE_CACHE = True
+
+# Follow-up questions answered and spoken in the background after the analysis, when the
+# server runs with PREFETCH=1 (0 turns it off for this page)
+FOLLOW_UPS = 3
+
+# Sweeps orphaned scratch files and temp files older versions left in the working directory
+scratch.start()
+
+# Number of recent chat messages rendered on every rerun; older ones are collapsed
+HISTORY_WINDOW = 10
 
 # Streamlit app title
 st.title("Image Q&A")
 
+if "chat_history" not in st.session_state:
+    # Resumes this tab's saved conversation, if any, without calling the model; the
+    # history is kept compact and moves to disk once it outgrows the session's budget
+    saved, st.session_state.chat_history, st.session_state.chat = resume_conversation(gemini, RESPONSE_CACHE)
+    if saved and saved.image_file is not None:
+        st.session_state.uploaded_file = saved.image_digest
+        st.session_state.sample_file = saved.image_file
+        st.session_state.analysis_result = saved.description
+
 if "uploaded_file" not in st.session_state:
     st.session_state.uploaded_file = None
 
@@ -29,91 +54,21 @@ if "sample_file" not in st.session_state:
 if "analysis_result" not in st.session_state:
     st.session_state.analysis_result = None 
 
-if "chat" not in st.session_state:
-    st.session_state.chat = None 
-
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
-
-def process_audio(frame):
-    """Process audio frames."""
-    return av.AudioFrame.from_ndarray(
-        frame.to_ndarray(), 
-        layout="mono"
-    )
-
-class AudioProcessor:
-    def __init__(self):
-        self.recognizer = sr.Recognizer()
-        self.transcript_queue = queue.Queue()
-        self.is_recording = False
-
-    def recv(self, frame):
-        """Receive and process audio frames."""
-        if self.is_recording:
-            try:
-                # Convert audio frame to text
-                audio_data = frame.to_ndarray().tobytes()
-                audio = sr.AudioData(audio_data, sample_rate=16000, sample_width=2)
-                text = self.recognizer.recognize_google(audio)
-                self.transcript_queue.put(text)
-            except Exception as e:
-                pass
-        return frame
-
-# Utility function to save files with a safe name
-def save_file(file):
-    file_id = str(uuid.uuid4())  # Generate a unique ID for each file
-    file_path = f"{file_id}_{file.name}"
-    with open(file_path, "wb") as f:
-        f.write(file.getbuffer())
-    return file_path
-
-# Function to clean Markdown syntax for plain text
-def strip_markdown(text):
-    """
-    Removes Markdown syntax, leaving plain text.
-    """
-    # Remove Markdown patterns such as **text**, *text*, _text_, `text`
-    text = re.sub(r"[*_`~]", "", text)
-    return text
-
-# Function to convert text to speech
-def text_to_speech(text, autoplay=True):
+# Function to render one chat history message
+def render_message(index, item, recent):
     """
-    Converts text to speech and displays an audio player.
-    Args:
-        text (str): Text to convert to speech
-        autoplay (bool): Whether to autoplay the audio
+    Renders a (speaker, message) pair from the chat history.
+    Audio is only prepared for recent messages.
     """
-    # Clean Markdown from the text
-    # Remove Markdown patterns
-    plain_text = re.sub(r"[*_`~]", "", text)
-    
-    # Generate unique filename using timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    audio_file_path = f"audio_{timestamp}.mp3"
-    
-    # Create audio file
-    tts = gTTS(text=plain_text, lang='en')
-    tts.save(audio_file_path)
-    
-    # Read audio file
-    with open(audio_file_path, 'rb') as audio_file:
-        audio_bytes = audio_file.read()
-    
-    # Convert to base64 for HTML embedding
-    audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
-    
-    if autoplay:
-        st.markdown(f"""
-            <audio autoplay="true" controls>
-                <source src="data:audio/mp3;base64,{audio_base64}" type="audio/mp3">
-            </audio>
-            """, unsafe_allow_html=True)
-    
-    # Clean up the temporary file
-    os.remove(audio_file_path)
+    speaker, message = item
+    with st.chat_message(speaker):
+        if speaker == "assistant":
+            st.markdown(message)  
+        else:
+            st.write(strip_markdown(message))  
+        
+        if speaker == "assistant" and recent:
+            text_to_speech(message, autoplay=False)
 
 # Section to upload or capture an image
 st.header("Upload or Capture an Image")
@@ -122,87 +77,96 @@ option = st.radio("Select an Option", ["Upload Image", "Capture Image"])
 if option == "Upload Image":
     uploaded_file = st.file_uploader("Upload your image file", type=["jpg", "png", "jpeg"])
     if uploaded_file:
-        file_path = save_file(uploaded_file)
+        # Keep the image in memory and track it by its content
+        image_input, prep_stats = preprocess(ImageInput.from_upload(uploaded_file), IMAGE_PREP)
 
-        if st.session_state.uploaded_file != file_path:
-            st.session_state.uploaded_file = file_path
-            sample_file = genai.upload_file(path=file_path, display_name=uploaded_file.name)
+        if st.session_state.uploaded_file != image_input.digest:
+            st.session_state.uploaded_file = image_input.digest
+            sample_file = upload_image_to_gemini(image_input)
             st.session_state.sample_file = sample_file
 
-            st.session_state.analysis_result = gemini.generate_content([sample_file, "What is in the image?"])
+            # Keep only the description text; it is shared across sessions through the cache
+            st.session_state.analysis_result = description_cache.describe(gemini, sample_file, image_input.digest)
 
-            st.session_state.chat = gemini.start_chat(history=[])
-            st.session_state.chat_history = []
+            # Keeps the last turns verbatim and summarizes older ones to bound each request;
+            # the new conversation is saved so this tab can resume it
+            st.session_state.chat_history, st.session_state.chat = new_conversation(gemini, RESPONSE_CACHE)
+            save_image(gemini, image_input, sample_file, st.session_state.analysis_result)
+            # Prepares the likely next questions while the user reads the analysis
+            prefetch_follow_ups(gemini, st.session_state.chat, sample_file, FOLLOW_UPS)
 
-        st.image(file_path, caption=uploaded_file.name, use_container_width=True)
+        st.image(image_input.data, caption=uploaded_file.name, use_container_width=True)
+        if prep_stats:
+            st.caption(prep_stats.summary)
 
 elif option == "Capture Image":
     camera_image = st.camera_input("Capture an image using your camera")
     if camera_image:
-        file_path = save_file(camera_image)
+        image_input, prep_stats = preprocess(ImageInput.from_upload(camera_image, name="captured_image"), IMAGE_PREP)
 
-        if st.session_state.uploaded_file != file_path:
-            st.session_state.uploaded_file = file_path
-            sample_file = genai.upload_file(path=file_path, display_name="captured_image")
+        if st.session_state.uploaded_file != image_input.digest:
+            st.session_state.uploaded_file = image_input.digest
+            sample_file = upload_image_to_gemini(image_input)
             st.session_state.sample_file = sample_file
 
-            st.session_state.analysis_result = gemini.generate_content([sample_file, "What is in the image?"])
+            st.session_state.analysis_result = description_cache.describe(gemini, sample_file, image_input.digest)
             
-            st.session_state.chat = gemini.start_chat(history=[])
-            st.session_state.chat_history = []
+            st.session_state.chat_history, st.session_state.chat = new_conversation(gemini, RESPONSE_CACHE)
+            save_image(gemini, image_input, sample_file, st.session_state.analysis_result)
+            prefetch_follow_ups(gemini, st.session_state.chat, sample_file, FOLLOW_UPS)
 
-        st.image(file_path, caption="Captured Image", use_container_width=True)
+        st.image(image_input.data, caption="Captured Image", use_container_width=True)
+        if prep_stats:
+            st.caption(prep_stats.summary)
 
 # Analysis result and chat interface
 if st.session_state.sample_file:
     st.write("### Analysis Result:")
-    st.markdown(st.session_state.analysis_result.text)  
-    text_to_speech(st.session_state.analysis_result.text, autoplay=True)
+    st.markdown(st.session_state.analysis_result)  
+    text_to_speech(st.session_state.analysis_result, autoplay=True)
 
     st.header("Chat with AI about the Image")
     
-    for speaker, message in st.session_state.chat_history:
-        with st.chat_message(speaker):
-            if speaker == "assistant":
-                st.markdown(message)  
-            else:
-                st.write(strip_markdown(message))  
-            
-            if speaker == "assistant":
-                text_to_speech(message, autoplay=False)
+    render_history(st.session_state.chat_history, render_message, window=HISTORY_WINDOW)
 
     # Add voice input option
     input_method = st.radio("Choose input method:", ["Text", "Voice"])
     
     if input_method == "Voice":
-        audio_processor = AudioProcessor()
-        webrtc_ctx = webrtc_streamer(
-            key="speech-to-text",
-            mode=webrtc_streamer.AudioProcessorMode.AUDIO_ONLY,
-            audio_processor_factory=lambda: audio_processor,
+        # Transcripts finished since the last rerun; the pipeline survives reruns
+        transcripts = voice_input(
+            "speech-to-text",
             rtc_configuration={"iceServers": [{"urls": ["stun:stun.l.google.com:19302"]}]},
         )
-        
-        if webrtc_ctx.state.playing:
-            audio_processor.is_recording = True
-            try:
-                transcript = audio_processor.transcript_queue.get_nowait()
-                user_input = transcript
-            except queue.Empty:
-                user_input = None
-        else:
-            audio_processor.is_recording = False
-            user_input = None
+        user_input = " ".join(transcripts) or None
     else:
         user_input = st.chat_input("Type your question here...")
 
+    # Suggested follow-ups whose answers (and audio) are already prepared
+    suggestion = None if user_input else follow_up_suggestions(st.session_state.chat, [st.session_state.sample_file])
+    if suggestion is not None:
+        user_input = suggestion.question
+
     if user_input:
         st.session_state.chat_history.append(("user", user_input))
         with st.chat_message("user"):
             st.write(strip_markdown(user_input)) 
 
-        ai_response = st.session_state.chat.send_message([st.session_state.sample_file, user_input])
-        st.session_state.chat_history.append(("assistant", ai_response.text))
         with st.chat_message("assistant"):
-            st.markdown(ai_response.text)  
-            text_to_speech(ai_response.text, autoplay=True)
+            if suggestion is not None:
+                response_text = suggestion.answer
+                st.markdown(response_text)
+                st.session_state.chat.record_turn(user_input, response_text)
+                st.session_state.chat_history.append(("assistant", response_text))
+                # The clip was synthesized with the answer
+                text_to_speech(response_text, autoplay=True)
+            else:
+                # Render the answer as it streams in, then record the finished turn
+                response_text, _ = stream_reply(st.session_state.chat, [st.session_state.sample_file, user_input])
+                if response_text is not None:
+                    st.session_state.chat_history.append(("assistant", response_text))
+                    # Speak the answer sentence by sentence so playback starts right away
+                    speak(response_text)
+
+# Optional latency panel (p50/p95 per stage) in the sidebar
+render_panel(run_span)
@@ -1,92 +1,82 @@
 import streamlit as st
-import google.generativeai as gen_ai
-from PIL import Image
-import os
-from gtts import gTTS
-import base64
-import re
-from datetime import datetime
-
-# Configure Gemini API
-gen_ai.configure(api_key="")
-gemini = gen_ai.GenerativeModel("gemini-1.5-flash")
-
-def upload_image_to_gemini(image_path):
-    uploaded_file = gen_ai.upload_file(path=image_path, display_name=os.path.basename(image_path))
-    return uploaded_file
-
-def strip_markdown(text):
-    """Removes Markdown syntax."""
-    text = re.sub(r"[*_~]", "", text)
-    return text
-
-def text_to_speech(text, autoplay=True):
-    """Generates an audio player from text."""
-    plain_text = strip_markdown(text)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    audio_file_path = f"audio_{timestamp}.mp3"
-    
-    tts = gTTS(text=plain_text, lang='en')
-    tts.save(audio_file_path)
-    
-    with open(audio_file_path, 'rb') as audio_file:
-        audio_bytes = audio_file.read()
-    
-    audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
-    
-    st.markdown(f"""
-        <audio autoplay="{str(autoplay).lower()}" controls>
-            <source src="data:audio/mp3;base64,{audio_base64}" type="audio/mp3">
-        </audio>
-    """, unsafe_allow_html=True)
-    os.remove(audio_file_path)
+
+from common.chat_stream import stream_reply
+from common.chat_view import render_history
+from common.description_cache import description_cache
+from common.image_input import ImageInput
+from common.image_prep import PrepConfig, preprocess
+from common.scratch import scratch
+from common.services import get_model, resume_conversation, save_image, speak, text_to_speech, upload_image_to_gemini
+from common.tracing import render_panel, tracer
+
+# Times this script run; render_panel() at the bottom of the page ends it
+run_span = tracer.begin("page.run")
+
+gemini = get_model("gemini-1.5-flash")
+
+# Downscale photos before they are uploaded; set to None to send originals
+IMAGE_PREP = PrepConfig(max_side=1536, format="JPEG", quality=85)
+
+# Answer repeated questions about the same image from the shared response cache (False opts out)
+RESPONSE_CACHE = True
+
+# Sweeps orphaned scratch files and temp files older versions left in the working directory
+scratch.start()
+
+# Number of recent chat messages rendered on every rerun; older ones are collapsed
+HISTORY_WINDOW = 10
+
+def render_message(index, item, recent):
+    """Renders a chat message; only the latest assistant message gets a player."""
+    role, message = item
+    with st.chat_message(role):
+        st.markdown(message)
+        if role == "assistant" and index == len(st.session_state.chat_history) - 1:
+            text_to_speech(message, autoplay=False)
 
 st.title("📸 Gemini Pro - Image ChatBot")
 
 # Initialize session states
-if "chat_session" not in st.session_state:
-    st.session_state.chat_session = gemini.start_chat(history=[])
+# Resume this tab's saved conversation without calling the model; the history moves to
+# disk once it outgrows the session's memory budget
 if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
-if "image_description_done" not in st.session_state:
-    st.session_state.image_description_done = False
-if "image_description_audio_played" not in st.session_state:
-    st.session_state.image_description_audio_played = False
+    saved, st.session_state.chat_history, st.session_state.chat_session = resume_conversation(gemini, RESPONSE_CACHE)
+    st.session_state.image_description_done = bool(saved and saved.description)
+    # A resumed description was already played
+    st.session_state.image_description_audio_played = st.session_state.image_description_done
 
 st.subheader("Choose Image Input Method")
 input_method = st.radio("Select how you want to provide an image:", ("Upload Image", "Capture Image"))
 
-uploaded_image, captured_image, image_path = None, None, None
+uploaded_image, captured_image, image_input = None, None, None
 if input_method == "Upload Image":
     uploaded_image = st.file_uploader("Upload an image", type=["png", "jpg", "jpeg"])
     if uploaded_image:
-        temp_path = f"temp_uploaded_image.{uploaded_image.name.split('.')[-1]}"
-        with open(temp_path, "wb") as f:
-            f.write(uploaded_image.getbuffer())
-        image_path = temp_path
+        image_input = ImageInput.from_upload(uploaded_image)
 elif input_method == "Capture Image":
     captured_image = st.camera_input("Capture an image using your camera")
     if captured_image:
-        image_path = "temp_captured_image.png"
-        with open(image_path, "wb") as f:
-            f.write(captured_image.getbuffer())
+        image_input = ImageInput.from_upload(captured_image, name="captured_image.png")
 
-if image_path:
-    image = Image.open(image_path)
-    st.image(image, caption="Uploaded/Captured Image", use_column_width=True)
+if image_input:
+    image_input, prep_stats = preprocess(image_input, IMAGE_PREP)
+    st.image(image_input.data, caption="Uploaded/Captured Image", use_column_width=True)
+    if prep_stats:
+        st.caption(prep_stats.summary)
 
     st.subheader("Uploading the Image to Gemini")
     with st.spinner("Uploading the image..."):
-        gemini_file = upload_image_to_gemini(image_path)
+        gemini_file = upload_image_to_gemini(image_input)
     st.success(f"Image uploaded successfully as: {gemini_file.uri}")
 
     if not st.session_state.image_description_done:
         st.subheader("Gemini Describes the Image")
         with st.spinner("Generating a description..."):
-            description_response = gemini.generate_content([gemini_file, "What is in the image?"])
-        description_text = description_response.text
+            # Served from the cache when this image was already described
+            description_text = description_cache.describe(gemini, gemini_file, image_input.digest)
         st.session_state.chat_history.append(("assistant", description_text))
         st.session_state.image_description_done = True
+        save_image(gemini, image_input, gemini_file, description_text)
         st.markdown(description_text)
     
     if st.session_state.image_description_done and not st.session_state.image_description_audio_played:
@@ -94,11 +84,7 @@ if image_path:
         st.session_state.image_description_audio_played = True
 
     st.subheader("Chat about the Image")
-    for i, (role, message) in enumerate(st.session_state.chat_history):
-        with st.chat_message(role):
-            st.markdown(message)
-            if role == "assistant" and i == len(st.session_state.chat_history) - 1:
-                text_to_speech(message, autoplay=False)
+    render_history(st.session_state.chat_history, render_message, window=HISTORY_WINDOW)
 
     user_prompt = st.chat_input("Ask Gemini-Pro about the image...")
     if user_prompt:
@@ -107,14 +93,16 @@ if image_path:
 
         prompt_to_gemini = f"This is the user's prompt: {user_prompt}. Make sure to answer only related to the image or things related to it. Do not go off topic."
 
-        gemini_response = st.session_state.chat_session.send_message([gemini_file, prompt_to_gemini])
-        response_text = gemini_response.text
-        st.session_state.chat_history.append(("assistant", response_text))
         with st.chat_message("assistant"):
-            st.markdown(response_text)
-            text_to_speech(response_text, autoplay=True)
+            # The cache is keyed on what the user asked, not on the instructions around it
+            response_text, _ = stream_reply(
+                st.session_state.chat_session, [gemini_file, prompt_to_gemini], question=user_prompt
+            )
+            if response_text is not None:
+                st.session_state.chat_history.append(("assistant", response_text))
+                speak(response_text)
 else:
     st.info("Please select and provide an image to proceed.")
 
-if image_path:
-    os.remove(image_path)
+# Optional latency panel (p50/p95 per stage) in the sidebar
+render_panel(run_span)
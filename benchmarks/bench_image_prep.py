@@ -0,0 +1,85 @@
+"""
+Compares image upload latency with and without the preprocessing stage.
+
+By default the upload is simulated from the encoded size and a fixed network
+bandwidth, so the benchmark runs offline. With --live, images are uploaded to
+the Gemini File API (GOOGLE_API_KEY must be set).
+
+    python -m benchmarks.bench_image_prep --bandwidth-mbps 2
+"""
+import argparse
+import io
+import os
+import statistics
+import time
+
+from PIL import Image
+
+from common.image_input import ImageInput
+from common import image_prep
+from common.image_prep import PrepConfig, preprocess
+
+
+def make_photo(width, height):
+    """Builds a photo-like JPEG (noise over a gradient) that compresses like a camera capture."""
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    photo = Image.merge("RGB", (gradient, noise, Image.blend(gradient, noise, 0.5)))
+    buffer = io.BytesIO()
+    photo.save(buffer, format="JPEG", quality=95)
+    return ImageInput(buffer.getvalue(), "photo.jpg", "image/jpeg")
+
+
+def upload_seconds(image_input, args):
+    """Time to upload an image, simulated from the bandwidth unless --live is set."""
+    if not args.live:
+        return image_input.size * 8 / (args.bandwidth_mbps * 1_000_000)
+
+    import google.generativeai as genai
+
+    genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
+    start = time.perf_counter()
+    genai.upload_file(path=image_input.open(), mime_type=image_input.mime_type, display_name=image_input.name)
+    return time.perf_counter() - start
+
+
+def run(image_input, config, args):
+    """Returns (end-to-end seconds, prepared bytes) for one image."""
+    # Empty the result cache so every run pays for the preprocessing
+    image_prep._results.clear()
+
+    start = time.perf_counter()
+    prepared, _ = preprocess(image_input, config)
+    prep_seconds = time.perf_counter() - start
+    return prep_seconds + upload_seconds(prepared, args), prepared.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--bandwidth-mbps", type=float, default=2.0)
+    parser.add_argument("--max-side", type=int, default=1536)
+    parser.add_argument("--quality", type=int, default=85)
+    parser.add_argument("--live", action="store_true", help="upload to the Gemini File API")
+    args = parser.parse_args()
+
+    photo = make_photo(args.width, args.height)
+    configs = {
+        "original": None,
+        "prepared": PrepConfig(max_side=args.max_side, format="JPEG", quality=args.quality),
+    }
+
+    print(f"{args.width}x{args.height} photo, {photo.size / 1024:.0f} KB, "
+          f"{'live upload' if args.live else f'{args.bandwidth_mbps} Mbit/s simulated'}")
+    for label, config in configs.items():
+        results = [run(photo, config, args) for _ in range(args.runs)]
+        seconds = [r[0] for r in results]
+        print(f"{label:>9}: {results[0][1] / 1024:8.0f} KB  "
+              f"median {statistics.median(seconds) * 1000:8.1f} ms  "
+              f"min {min(seconds) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
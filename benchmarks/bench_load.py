@@ -0,0 +1,239 @@
+"""
+Load-tests the pages offline, against local fakes of Gemini and gTTS.
+
+Every simulated user drives one Streamlit AppTest session: it opens the page,
+uploads an image (on pages that take one) and asks --turns questions. Each
+user gets its own image and questions, so the shared caches only help the
+way they would for distinct visitors. The fakes (benchmarks/fake_services.py)
+add the configured latency and inject failures, which the Gemini client
+retries like real overload errors; nothing touches the network.
+
+AppTest swaps process-wide Streamlit state while a script runs, so every
+user runs in its own process. Contention inside one server process (the
+GIL, the shared thread pools and the Gemini slot limits) is therefore not
+part of the numbers; CPU contention between users is.
+
+Reported per page and number of concurrent users:
+  - rerun time p50/p95 of every script run (first load, upload, each turn)
+  - throughput: chat turns answered per second across all users
+  - failures: steps that ended in an exception or a timeout
+  - memory per session: Python memory a session keeps after its turns,
+    measured with tracemalloc in a separate single-process pass
+
+Exits with status 1 when a step fails without injected failures, so it can
+gate CI.
+
+    python -m benchmarks.bench_load --users 1 4 16 --turns 5 --latency 0.3 --failure-rate 0.02
+"""
+import argparse
+import gc
+import io
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import time
+import tracemalloc
+
+PAGES = ["app.py", "chat_pic.py", "just_chat.py"]
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    return sorted(values)[int(fraction * (len(values) - 1))]
+
+
+def sample_image(seed, size=(1600, 1200)):
+    """A PNG larger than the prep limit, unique to `seed` so caches don't hit across users."""
+    from PIL import Image
+
+    gradient = Image.linear_gradient("L").resize(size)
+    image = Image.merge("RGB", (gradient, gradient.transpose(Image.ROTATE_180), Image.new("L", size, seed % 256)))
+    image.putpixel((0, 0), (seed // 256 % 256, seed // 65536 % 256, 0))
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def run_session(page_path, seed, turns, timeout):
+    """
+    Drives one session through the page.
+    Returns:
+        (AppTest, list, int, list): The session, seconds of every script run,
+        turns answered and the errors of the failed steps
+    """
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(page_path, default_timeout=timeout)
+    reruns, errors = [], []
+
+    def step(element=None):
+        start = time.perf_counter()
+        try:
+            (element or at).run()
+        except RuntimeError as e:  # the script did not finish within the timeout
+            errors.append(str(e))
+            return False
+        finally:
+            reruns.append(time.perf_counter() - start)
+        if at.exception:
+            errors.append(at.exception[0].value)
+            return False
+        return True
+
+    step()
+    if at.file_uploader:
+        step(at.file_uploader[0].set_value((f"photo-{seed}.png", sample_image(seed), "image/png")))
+
+    answered = 0
+    for turn in range(turns):
+        if not at.chat_input:
+            errors.append("no chat input on the page")
+            break
+        if step(at.chat_input[0].set_value(f"User {seed}, question {turn}: what is in the top left corner?")):
+            answered += 1
+    return at, reruns, answered, errors
+
+
+def simulate_user(page, root, user, turns, timeout, fake_settings, barrier, results, memory_sessions=0):
+    """
+    Process entry point of one simulated user. Warms the page up (imports and
+    process-wide resources), waits for the other users, then runs one timed
+    session. With memory_sessions, runs that many sessions under tracemalloc
+    instead and reports the memory they keep.
+    """
+    os.chdir(root)
+    sys.path.insert(0, root)
+    logging.disable(logging.CRITICAL)
+    # The fakes only cover gTTS
+    os.environ["TTS_BACKEND"] = "gtts"
+    from benchmarks import fake_services
+
+    fake = fake_services.install(**fake_settings)
+    page_path = os.path.join(root, page)
+    report = {"user": user, "reruns": [], "turns": 0, "errors": []}
+    try:
+        run_session(page_path, seed=100000 + user, turns=1, timeout=timeout)
+        from common.gemini_client import gemini_client
+
+        fake.calls.clear()
+        gemini_client.retries = 0
+        barrier.wait()
+
+        if memory_sessions:
+            gc.collect()
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+            sessions = [run_session(page_path, user * 1000 + i, turns, timeout) for i in range(memory_sessions)]
+            gc.collect()
+            retained, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            report["retained"] = (retained - baseline) / len(sessions)
+            report["peak"] = peak - baseline
+            report["errors"] = [error for session in sessions for error in session[3]]
+        else:
+            report["started"] = time.time()
+            _, report["reruns"], report["turns"], report["errors"] = run_session(page_path, user, turns, timeout)
+            report["finished"] = time.time()
+
+        report["retries"] = gemini_client.retries
+        report["calls"] = dict(fake.calls)
+    except Exception as e:
+        barrier.abort()
+        report["errors"].append(f"{type(e).__name__}: {e}")
+    results.put(report)
+
+
+def run_users(page, root, users, turns, timeout, fake_settings, memory_sessions=0):
+    """Starts `users` simulated users on a page and returns their reports."""
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(users)
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=simulate_user,
+            args=(page, root, user, turns, timeout, fake_settings, barrier, results, memory_sessions),
+        )
+        for user in range(users)
+    ]
+    for process in processes:
+        process.start()
+    reports = []
+    while len(reports) < users:
+        try:
+            reports.append(results.get(timeout=1))
+        except queue.Empty:
+            # A worker that died without reporting (killed, out of memory) counts as a failed user
+            if not any(process.is_alive() for process in processes):
+                break
+    for process in processes:
+        process.join()
+    while len(reports) < users:
+        reports.append({"user": None, "reruns": [], "turns": 0, "errors": ["worker exited without a report"]})
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pages", nargs="*", default=PAGES)
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 4], help="concurrent users, one run per value")
+    parser.add_argument("--turns", type=int, default=3, help="questions each user asks")
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds per Gemini call")
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--chunk-latency", type=float, default=0.02, help="seconds between streamed chunks")
+    parser.add_argument("--tts-latency", type=float, default=0.05, help="seconds per gTTS call")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of Gemini calls that fail")
+    parser.add_argument("--memory-sessions", type=int, default=3, help="sessions in the memory pass, 0 skips it")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds a script run may take")
+    args = parser.parse_args()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    fake_settings = {
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "chunk_latency": args.chunk_latency,
+        "tts_latency": args.tts_latency,
+        "failure_rate": args.failure_rate,
+    }
+
+    print(f"{args.turns} turns per user, Gemini latency {args.latency * 1000:.0f} ms, "
+          f"failure rate {args.failure_rate:.0%}")
+    unexpected_failures = 0
+    for page in args.pages:
+        print(f"\n{page}")
+        print(f"{'users':>7} {'turns/s':>8} {'rerun p50':>10} {'rerun p95':>10} {'failures':>9} {'retries':>8}")
+        for users in args.users:
+            reports = run_users(page, root, users, args.turns, args.timeout, fake_settings)
+            reruns = [seconds for report in reports for seconds in report["reruns"]]
+            failures = sum(len(report["errors"]) for report in reports)
+            finished = [report for report in reports if "finished" in report]
+            elapsed = (
+                max(report["finished"] for report in finished) - min(report["started"] for report in finished)
+                if finished else 0
+            )
+            turns = sum(report["turns"] for report in reports)
+            p50 = f"{percentile(reruns, 0.5) * 1000:8.0f} ms" if reruns else f"{'-':>11}"
+            p95 = f"{percentile(reruns, 0.95) * 1000:8.0f} ms" if reruns else f"{'-':>11}"
+            print(f"{users:7d} {turns / elapsed if elapsed else 0:8.2f} {p50}{p95} {failures:9d} "
+                  f"{sum(report.get('retries', 0) for report in reports):8d}")
+            for error in sorted({error.splitlines()[0] for report in reports for error in report["errors"]})[:3]:
+                print(f"{'':7} ! {error[:100]}")
+            if not args.failure_rate:
+                unexpected_failures += failures
+
+        if args.memory_sessions:
+            report, = run_users(page, root, 1, args.turns, args.timeout, fake_settings, args.memory_sessions)
+            if "retained" in report:
+                print(f"  memory per session: {report['retained'] / 1024:.0f} KiB retained, "
+                      f"peak {report['peak'] / 2 ** 20:.1f} MiB over {args.memory_sessions} sessions")
+            else:
+                print(f"  memory per session: failed ({report['errors'][-1]})")
+            if not args.failure_rate:
+                unexpected_failures += len(report["errors"])
+
+    if unexpected_failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
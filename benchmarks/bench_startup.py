@@ -0,0 +1,74 @@
+"""
+Measures the cold-start cost of each page.
+
+Every run starts a fresh interpreter, imports Streamlit (reported separately
+as the baseline) and then executes the page once in bare mode, with no
+uploads and no input, which is what a first visit costs before the user
+does anything. Also lists which heavy optional dependencies the page loaded.
+
+    python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PAGES = ["just_chat.py", "chat_pic.py", "aud_response_better.py", "response_in_aud.py", "aud_input.py", "app.py"]
+
+HEAVY_MODULES = ["gtts", "PIL", "numpy", "streamlit_webrtc", "av", "speech_recognition", "vosk", "piper"]
+
+# Runs in the child interpreter; prints one JSON line with the timings
+_CHILD = """
+import json, logging, runpy, sys, time
+start = time.perf_counter()
+import streamlit
+baseline = time.perf_counter() - start
+logging.disable(logging.CRITICAL)
+modules = set(sys.modules)
+start = time.perf_counter()
+runpy.run_path(sys.argv[1], run_name="__main__")
+page = time.perf_counter() - start
+loaded = [name for name in {heavy!r} if name in sys.modules and name not in modules]
+print(json.dumps({{"baseline": baseline, "page": page, "modules": len(sys.modules), "heavy": loaded}}))
+"""
+
+
+def measure(page, root):
+    """Runs a page once in a fresh interpreter and returns its timings."""
+    result = subprocess.run(
+        [sys.executable, "-c", _CHILD.format(heavy=HEAVY_MODULES), page],
+        cwd=root,
+        env={**os.environ, "PYTHONPATH": root},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pages", nargs="*", default=PAGES)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    for page in args.pages:
+        try:
+            runs = [measure(page, root) for _ in range(args.runs)]
+        except subprocess.CalledProcessError as e:
+            error = (e.stderr.strip().splitlines() or ["unknown error"])[-1]
+            print(f"{page:>24}: failed ({error})")
+            continue
+        baseline = statistics.median(run["baseline"] for run in runs)
+        seconds = statistics.median(run["page"] for run in runs)
+        print(f"{page:>24}: streamlit {baseline * 1000:7.1f} ms  "
+              f"page {seconds * 1000:7.1f} ms  "
+              f"{runs[-1]['modules']:5d} modules  "
+              f"heavy: {', '.join(runs[-1]['heavy']) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Compares speech-to-text backends on recorded WAV fixtures.
+
+Reports per-utterance latency and the real-time factor (processing time
+divided by audio duration; below 1 is faster than real time). Fixtures are
+16-bit PCM WAV files, any sample rate or channel count; the expected
+transcript can sit next to each one as <name>.txt.
+
+    VOSK_MODEL_PATH=models/vosk-model-small-en-us-0.15 \\
+        python -m benchmarks.bench_stt path/to/wavs --backends vosk google
+"""
+import argparse
+import glob
+import os
+import statistics
+import time
+import wave
+
+import numpy as np
+
+from common.stt_backends import BACKENDS, get_backend
+
+
+def load_wav(path):
+    """Reads a 16-bit PCM WAV file as mono int16 samples."""
+    with wave.open(path, "rb") as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM is supported")
+        samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+        channels = wav.getnchannels()
+        sample_rate = wav.getframerate()
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return samples, sample_rate
+
+
+def word_error_rate(expected, actual):
+    """Word-level edit distance divided by the number of expected words."""
+    expected, actual = expected.lower().split(), (actual or "").lower().split()
+    distances = list(range(len(actual) + 1))
+    for i, expected_word in enumerate(expected, 1):
+        previous, distances[0] = distances[0], i
+        for j, actual_word in enumerate(actual, 1):
+            previous, distances[j] = distances[j], min(
+                distances[j] + 1,
+                distances[j - 1] + 1,
+                previous + (expected_word != actual_word),
+            )
+    return distances[-1] / max(1, len(expected))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("fixtures", help="directory of WAV fixtures")
+    parser.add_argument("--backends", nargs="+", default=sorted(BACKENDS), choices=sorted(BACKENDS))
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.fixtures, "*.wav")))
+    if not paths:
+        parser.error(f"no .wav files in {args.fixtures}")
+    fixtures = []
+    for path in paths:
+        samples, sample_rate = load_wav(path)
+        transcript_path = os.path.splitext(path)[0] + ".txt"
+        expected = open(transcript_path).read().strip() if os.path.exists(transcript_path) else None
+        fixtures.append((os.path.basename(path), samples, sample_rate, expected))
+    audio_seconds = sum(len(samples) / rate for _, samples, rate, _ in fixtures)
+    print(f"{len(fixtures)} fixtures, {audio_seconds:.1f} s of audio")
+
+    for name in args.backends:
+        start = time.perf_counter()
+        backend = get_backend(name)
+        load_seconds = time.perf_counter() - start
+
+        latencies, errors = [], []
+        for _, samples, sample_rate, expected in fixtures:
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                text = backend.transcribe(samples, sample_rate)
+                latencies.append((time.perf_counter() - start, len(samples) / sample_rate))
+            if expected is not None:
+                errors.append(word_error_rate(expected, text))
+
+        seconds = [latency for latency, _ in latencies]
+        real_time_factor = sum(seconds) / sum(duration for _, duration in latencies)
+        wer = f"{statistics.mean(errors):.2f}" if errors else "n/a"
+        print(f"{name:>8}: load {load_seconds:6.2f} s  "
+              f"median latency {statistics.median(seconds) * 1000:8.1f} ms  "
+              f"p95 {sorted(seconds)[int(0.95 * (len(seconds) - 1))] * 1000:8.1f} ms  "
+              f"RTF {real_time_factor:5.2f}  WER {wer}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Compares text-to-speech backends on synthesis latency.
+
+Each sample text is synthesized --runs times per backend, bypassing the TTS
+cache. Latency is reported per call and per input character, since engines
+scale roughly linearly with text length. Backends are loaded directly, so a
+missing engine is reported instead of silently falling back to gTTS.
+
+    PIPER_MODEL_PATH=voices/en_US-lessac-medium.onnx \\
+        python -m benchmarks.bench_tts --backends espeak piper gtts
+"""
+import argparse
+import statistics
+import time
+
+from common.tts_backends import BACKENDS
+
+SAMPLES = [
+    "Sure.",
+    "The image shows a tabby cat sitting on a windowsill.",
+    "The cat appears relaxed, with its eyes half closed and its tail curled around its paws. "
+    "Behind it, the window looks out onto a garden with a few potted plants.",
+    "Gemini can describe the colours, objects and layout of a picture, answer follow-up questions "
+    "about details you point out, and compare it with other images you upload later in the chat. "
+    "Long answers are spoken sentence by sentence, so the first chunk matters most for latency, "
+    "but the total synthesis time still bounds how soon the full reply can be replayed.",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=sorted(BACKENDS), choices=sorted(BACKENDS))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--lang", default="en")
+    args = parser.parse_args()
+
+    characters = sum(len(text) for text in SAMPLES)
+    print(f"{len(SAMPLES)} texts, {characters} characters")
+
+    for name in args.backends:
+        start = time.perf_counter()
+        try:
+            backend = BACKENDS[name]()
+        except Exception as e:
+            print(f"{name:>8}: unavailable ({e})")
+            continue
+        load_seconds = time.perf_counter() - start
+
+        seconds, per_character, output_bytes = [], [], 0
+        for text in SAMPLES:
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                audio = backend.synthesize(text, args.lang)
+                elapsed = time.perf_counter() - start
+                seconds.append(elapsed)
+                per_character.append(elapsed / len(text))
+                output_bytes += len(audio)
+
+        print(f"{name:>8}: load {load_seconds:6.2f} s  "
+              f"median latency {statistics.median(seconds) * 1000:8.1f} ms  "
+              f"p95 {sorted(seconds)[int(0.95 * (len(seconds) - 1))] * 1000:8.1f} ms  "
+              f"{statistics.median(per_character) * 1000:6.2f} ms/char  "
+              f"{output_bytes / len(seconds) / 1024:7.1f} KiB/clip ({backend.mime_type})")
+
+
+if __name__ == "__main__":
+    main()
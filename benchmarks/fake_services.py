@@ -0,0 +1,268 @@
+"""
+Local stand-ins for the Gemini SDK and gTTS, so benchmarks run without
+network access or an API key.
+
+install() registers fake `google.generativeai` and `gtts` modules; call it
+before the pages (or common.services) are imported. Every fake call sleeps
+for a configurable latency with jitter, and Gemini calls fail at a
+configurable rate with ServiceUnavailable, the retryable error the live API
+returns under load, so the retry and backoff paths are exercised too.
+"""
+import itertools
+import random
+import sys
+import threading
+import time
+import types
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from google.api_core import exceptions as api_exceptions
+
+# Tokens Gemini counts for one image
+IMAGE_TOKENS = 258
+
+_FILLER = [
+    "The picture is well lit and the subject is in focus.",
+    "There are a few objects in the background, slightly blurred.",
+    "The colours are mostly warm, with some darker areas near the edges.",
+    "Nothing in the image suggests it was edited.",
+    "Let me know if you want more detail about a specific part.",
+]
+
+
+class FakeSettings:
+    """
+    Latency and failure injection shared by every fake call in the process.
+    Args:
+        latency (float): Seconds a Gemini call takes before it returns (or before the first chunk)
+        jitter (float): Each delay is scaled by a random factor in [1 - jitter, 1 + jitter]
+        chunk_latency (float): Seconds between streamed chunks
+        failure_rate (float): Probability that a Gemini call raises ServiceUnavailable
+        tts_latency (float): Seconds a gTTS synthesis takes
+        answer_sentences (int): Sentences in every answer
+        seed (int): Seed for jitter and failures, None for a random one
+    """
+
+    def __init__(self, latency=0.3, jitter=0.5, chunk_latency=0.02, failure_rate=0.0, tts_latency=0.05,
+                 answer_sentences=4, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.chunk_latency = chunk_latency
+        self.failure_rate = failure_rate
+        self.tts_latency = tts_latency
+        self.answer_sentences = answer_sentences
+        self.calls = Counter()  # fake call name -> calls made
+        self.failures = Counter()  # fake call name -> injected failures
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self, seconds):
+        """Sleeps for `seconds` with jitter."""
+        with self._lock:
+            factor = self._random.uniform(1 - self.jitter, 1 + self.jitter)
+        time.sleep(max(0.0, seconds * factor))
+
+    def call(self, name, seconds, can_fail=True):
+        """Simulates a remote call: sleeps, then raises at the configured failure rate."""
+        with self._lock:
+            self.calls[name] += 1
+            fail = can_fail and self._random.random() < self.failure_rate
+        self.delay(seconds)
+        if fail:
+            with self._lock:
+                self.failures[name] += 1
+            raise api_exceptions.ServiceUnavailable(f"Injected failure in {name}")
+
+
+settings = FakeSettings()
+
+_file_ids = itertools.count(1)
+
+
+def _count_tokens(parts):
+    return sum(len(part.text) // 4 if part.text else IMAGE_TOKENS for part in parts)
+
+
+def _answer(prompt):
+    """A deterministic answer of settings.answer_sentences sentences."""
+    topic = " ".join(prompt.split()[:8]).rstrip("?.!") or "the image"
+    sentences = [f"You asked about: {topic}."]
+    sentences += [_FILLER[i % len(_FILLER)] for i in range(settings.answer_sentences - 1)]
+    return " ".join(sentences)
+
+
+class _Part:
+    def __init__(self, text="", file_data=None):
+        self.text = text
+        self.file_data = file_data
+
+
+class _Content:
+    def __init__(self, role, parts):
+        self.role = role
+        self.parts = parts
+
+
+def _to_parts(content):
+    """Converts message content (text, file or a list of them) to parts."""
+    if isinstance(content, _Content):
+        return list(content.parts)
+    if isinstance(content, dict):
+        return _to_parts(content.get("parts", []))
+    if not isinstance(content, (list, tuple)):
+        content = [content]
+    parts = []
+    for item in content:
+        if isinstance(item, _Part):
+            parts.append(item)
+        elif isinstance(item, str):
+            parts.append(_Part(text=item))
+        else:
+            parts.append(_Part(file_data=getattr(item, "uri", None)))
+    return parts
+
+
+def _to_content(entry):
+    if isinstance(entry, _Content):
+        return entry
+    return _Content(entry.get("role", "user"), _to_parts(entry))
+
+
+class _Response:
+    """Answer of a fake call; iterating it yields the streamed chunks."""
+
+    def __init__(self, text, prompt_tokens, stream):
+        self.text = text
+        self.stream = stream
+        self.usage_metadata = types.SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=len(text) // 4,
+            total_token_count=prompt_tokens + len(text) // 4,
+        )
+        # The one candidate finished normally, as the live API reports once a stream is read in full
+        self.candidates = [types.SimpleNamespace(finish_reason="STOP")]
+
+    def __iter__(self):
+        words = self.text.split(" ")
+        for index in range(0, len(words), 6):
+            if self.stream and index:
+                settings.delay(settings.chunk_latency)
+            yield types.SimpleNamespace(text=" ".join(words[index:index + 6]) + " ")
+
+    def resolve(self):
+        pass
+
+
+class ChatSession:
+    def __init__(self, model, history=None):
+        self.model = model
+        self.history = history or []
+
+    @property
+    def history(self):
+        return self._history
+
+    @history.setter
+    def history(self, history):
+        self._history = [_to_content(entry) for entry in history]
+
+    def send_message(self, content, stream=False, **kwargs):
+        settings.call("send_message", settings.latency)
+        parts = _to_parts(content)
+        prompt_tokens = sum(_count_tokens(entry.parts) for entry in self._history) + _count_tokens(parts)
+        text = _answer(" ".join(part.text for part in parts if part.text))
+        self._history += [_Content("user", parts), _Content("model", [_Part(text=text)])]
+        return _Response(text, prompt_tokens, stream)
+
+
+class GenerativeModel:
+    def __init__(self, model_name="gemini-1.5-flash", **kwargs):
+        self.model_name = model_name if model_name.startswith("models/") else f"models/{model_name}"
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        settings.call("generate_content", settings.latency)
+        if isinstance(contents, (list, tuple)) and contents and isinstance(contents[0], (dict, _Content)):
+            # A conversation: the answer is to its last turn, but every turn counts as prompt
+            turns = [_to_content(entry) for entry in contents]
+            text = _answer(" ".join(part.text for part in turns[-1].parts if part.text))
+            return _Response(text, sum(_count_tokens(turn.parts) for turn in turns), stream)
+        parts = _to_parts(contents)
+        text = _answer(" ".join(part.text for part in parts if part.text))
+        return _Response(text, _count_tokens(parts), stream)
+
+    def start_chat(self, history=None, **kwargs):
+        return ChatSession(self, history)
+
+    def count_tokens(self, contents):
+        return types.SimpleNamespace(total_tokens=_count_tokens(_to_parts(contents)))
+
+
+def configure(**kwargs):
+    pass
+
+
+def upload_file(path, mime_type=None, name=None, display_name=None, **kwargs):
+    settings.call("upload_file", settings.latency)
+    if hasattr(path, "read"):
+        size = len(path.read())
+    else:
+        with open(path, "rb") as f:
+            size = len(f.read())
+    file_id = next(_file_ids)
+    return types.SimpleNamespace(
+        name=f"files/fake-{file_id}",
+        uri=f"https://generativelanguage.googleapis.com/v1beta/files/fake-{file_id}",
+        display_name=display_name,
+        mime_type=mime_type,
+        size_bytes=size,
+        expiration_time=datetime.now(timezone.utc) + timedelta(hours=48),
+    )
+
+
+class gTTS:
+    def __init__(self, text, lang="en", tld="com", **kwargs):
+        self.text = text
+        self.lang = lang
+
+    def write_to_fp(self, fp):
+        settings.call("gtts", settings.tts_latency, can_fail=False)
+        # Roughly the size of real MP3 speech (about 64 bytes per character)
+        fp.write(b"ID3" + bytes(len(self.text) * 64))
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            self.write_to_fp(f)
+
+
+def install(**kwargs):
+    """
+    Replaces google.generativeai and gtts with the fakes.
+    Args:
+        **kwargs: FakeSettings arguments
+    Returns:
+        FakeSettings: The settings every fake call uses
+    """
+    global settings
+    settings = FakeSettings(**kwargs)
+
+    import google
+
+    genai = types.ModuleType("google.generativeai")
+    genai.configure = configure
+    genai.GenerativeModel = GenerativeModel
+    genai.ChatSession = ChatSession
+    genai.upload_file = upload_file
+    genai.protos = types.SimpleNamespace(File=types.SimpleNamespace)
+    google.generativeai = genai
+    sys.modules["google.generativeai"] = genai
+    # Fake streams never break, but BoundedChat catches these
+    genai.types = types.ModuleType("google.generativeai.types")
+    genai.types.BrokenResponseError = type("BrokenResponseError", (Exception,), {})
+    genai.types.IncompleteIterationError = type("IncompleteIterationError", (Exception,), {})
+    sys.modules["google.generativeai.types"] = genai.types
+
+    gtts = types.ModuleType("gtts")
+    gtts.gTTS = gTTS
+    sys.modules["gtts"] = gtts
+    return settings
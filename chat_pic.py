@@ -1,101 +1,193 @@
 import streamlit as st
-import google.generativeai as gen_ai
-from PIL import Image
-import os
 
-# Configure Gemini API
-gen_ai.configure(api_key="")
-gemini = gen_ai.GenerativeModel("gemini-1.5-flash")
+from common.batch import analyze_batch
+from common.chat_stream import stream_reply
+from common.chat_view import render_history
+from common.description_cache import description_cache
+from common.image_input import ImageInput
+from common.image_prep import PrepConfig, preprocess
+from common.scratch import scratch
+from common.services import (
+    follow_up_suggestions, get_model, prefetch_follow_ups, resume_conversation, save_image, upload_image_to_gemini,
+)
+from common.tracing import render_panel, tracer
 
-def upload_image_to_gemini(image_path):
-    uploaded_file = gen_ai.upload_file(path=image_path, display_name=os.path.basename(image_path))
-    return uploaded_file
+# Times this script run; render_panel() at the bottom of the page ends it
+run_span = tracer.begin("page.run")
+
+gemini = get_model("gemini-1.5-flash")
+
+# Downscale photos before they are uploaded; set to None to send originals
+IMAGE_PREP = PrepConfig(max_side=1536, format="JPEG", quality=85)
+
+# Answer repeated questions about the same image from the shared response cache (False opts out)
+RESPONSE_CACHE = True
+
+# Follow-up questions answered in the background after the description, when the server
+# runs with PREFETCH=1 (0 turns it off for this page)
+FOLLOW_UPS = 3
+
+# Sweeps orphaned scratch files and temp files older versions left in the working directory
+scratch.start()
+
+# Number of recent chat messages rendered on every rerun; older ones are collapsed
+HISTORY_WINDOW = 10
+
+# Gemini calls one batch of images may have in flight at once
+BATCH_CONCURRENCY = 4
+
+def render_message(index, item, recent):
+    role, message = item
+    with st.chat_message(role):
+        st.markdown(message)
+
+def chat_about_images(gemini_files, placeholder):
+    """Shows the chat history and answers a new question about the given uploaded images."""
+    # Display the chat history, collapsing older messages
+    render_history(st.session_state.chat_history, render_message, window=HISTORY_WINDOW)
+
+    # User input for questions about the image
+    user_prompt = st.chat_input(placeholder)
+    # Suggested follow-ups whose answers are already prepared
+    suggestion = None if user_prompt else follow_up_suggestions(st.session_state.chat_session, gemini_files)
+    if suggestion is not None:
+        user_prompt = suggestion.question
+
+    if user_prompt:
+        # Add user's message to chat history and display it
+        st.session_state.chat_history.append(("user", user_prompt))
+        st.chat_message("user").markdown(user_prompt)
+
+        with st.chat_message("assistant"):
+            if suggestion is not None:
+                response_text = suggestion.answer
+                st.markdown(response_text)
+                st.session_state.chat_session.record_turn(user_prompt, response_text)
+            else:
+                # Stream Gemini's answer to the image and user's question as it is generated
+                response_text, _ = stream_reply(st.session_state.chat_session, [*gemini_files, user_prompt])
+
+            # Add Gemini's response to chat history once it is complete, unless it was dropped
+            if response_text is not None:
+                st.session_state.chat_history.append(("assistant", response_text))
 
 # Streamlit UI
 st.title("📸 Gemini Pro - Image ChatBot")
 
-# Initialize chat session and history in Streamlit session state
-if "chat_session" not in st.session_state:
-    st.session_state.chat_session = gemini.start_chat(history=[])
+# Initialize chat session and history in Streamlit session state, resuming this tab's
+# saved conversation without calling the model (the history moves to disk past its memory budget)
 if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
-if "image_description_done" not in st.session_state:
-    st.session_state.image_description_done = False  # Track if the image description step is completed
+    saved, st.session_state.chat_history, st.session_state.chat_session = resume_conversation(gemini, RESPONSE_CACHE)
+    st.session_state.resumed_file = saved.image_file if saved else None
+    # Track if the image description step is completed
+    st.session_state.image_description_done = bool(saved and saved.description)
 
 # Step 1: Select Input Method
 st.subheader("Step 1: Choose Image Input Method")
-input_method = st.radio("Select how you want to provide an image:", ("Upload Image", "Capture Image"))
+input_method = st.radio(
+    "Select how you want to provide an image:", ("Upload Image", "Capture Image", "Upload Several Images")
+)
 
 uploaded_image = None
 captured_image = None
-image_path = None
+image_input = None
+batch_images = []
 
 # Handle user selection
 if input_method == "Upload Image":
     uploaded_image = st.file_uploader("Upload an image", type=["png", "jpg", "jpeg"])
     if uploaded_image:
-        # Save uploaded image to a temporary path
-        temp_path = f"temp_uploaded_image.{uploaded_image.name.split('.')[-1]}"
-        with open(temp_path, "wb") as f:
-            f.write(uploaded_image.getbuffer())
-        image_path = temp_path
+        # Keep the uploaded image in memory
+        image_input = ImageInput.from_upload(uploaded_image)
 elif input_method == "Capture Image":
     captured_image = st.camera_input("Capture an image using your camera")
     if captured_image:
-        # Save captured image to a temporary path
-        image_path = "temp_captured_image.png"
-        with open(image_path, "wb") as f:
-            f.write(captured_image.getbuffer())
+        # Keep the captured image in memory
+        image_input = ImageInput.from_upload(captured_image, name="captured_image.png")
+elif input_method == "Upload Several Images":
+    uploaded_images = st.file_uploader("Upload images", type=["png", "jpg", "jpeg"], accept_multiple_files=True)
+    # Keep the uploaded images in memory
+    batch_images = [ImageInput.from_upload(uploaded) for uploaded in uploaded_images or []]
 
 # Process the image
-if image_path:
+if image_input:
+    # Downscale and re-encode the image before it is displayed and uploaded
+    image_input, prep_stats = preprocess(image_input, IMAGE_PREP)
+
     # Display the image
-    image = Image.open(image_path)
-    st.image(image, caption="Uploaded/Captured Image", use_column_width=True)
+    st.image(image_input.data, caption="Uploaded/Captured Image", use_column_width=True)
+    if prep_stats:
+        st.caption(prep_stats.summary)
 
     # Step 2: Upload to Gemini
     st.subheader("Step 2: Uploading the Image to Gemini")
     with st.spinner("Uploading the image..."):
-        gemini_file = upload_image_to_gemini(image_path)
+        gemini_file = upload_image_to_gemini(image_input)
     st.success(f"Image uploaded successfully as: {gemini_file.uri}")
 
     # Step 3: Automatically Describe the Image (only once)
     if not st.session_state.image_description_done:
         st.subheader("Step 3: Gemini Describes the Image")
         with st.spinner("Generating a description..."):
-            description_response = gemini.generate_content([gemini_file, "What is in the image?"])
-        description_text = description_response.text
+            # Served from the cache when this image was already described
+            description_text = description_cache.describe(gemini, gemini_file, image_input.digest)
         st.session_state.chat_history.append(("assistant", description_text))  # Save to chat history
         st.session_state.image_description_done = True  # Mark description as completed
+        save_image(gemini, image_input, gemini_file, description_text)  # Lets this tab resume the chat
+        # Prepares the likely next questions while the user reads the description
+        prefetch_follow_ups(gemini, st.session_state.chat_session, gemini_file, FOLLOW_UPS, speak=False)
         st.write("**Image Description:**")
         st.markdown(description_text)
 
     # Step 4: Chat about the Image
     st.subheader("Step 4: Chat about the Image")
+    chat_about_images([gemini_file], "Ask Gemini-Pro about the image...")
 
-    # Display the chat history
-    for role, message in st.session_state.chat_history:
-        with st.chat_message(role):
-            st.markdown(message)
-
-    # User input for questions about the image
-    user_prompt = st.chat_input("Ask Gemini-Pro about the image...")
-    if user_prompt:
-        # Add user's message to chat history and display it
-        st.session_state.chat_history.append(("user", user_prompt))
-        st.chat_message("user").markdown(user_prompt)
-
-        # Send message to Gemini with the image and user's question
-        gemini_response = st.session_state.chat_session.send_message([gemini_file, user_prompt])
-        response_text = gemini_response.text
-
-        # Add Gemini's response to chat history and display it
-        st.session_state.chat_history.append(("assistant", response_text))
-        with st.chat_message("assistant"):
-            st.markdown(response_text)
+# Resumed conversation: keep chatting about the image uploaded before the reconnect
+elif st.session_state.resumed_file is not None and input_method != "Upload Several Images":
+    st.subheader("Step 4: Chat about the Image")
+    chat_about_images([st.session_state.resumed_file], "Ask Gemini-Pro about the image...")
+
+# Process a batch of images
+elif batch_images:
+    # Steps 2 and 3 for all images at once: uploads and descriptions run concurrently
+    st.subheader("Step 2: Uploading and Describing the Images")
+    batch_key = tuple(image.digest for image in batch_images)
+    if st.session_state.get("batch_key") != batch_key:
+        progress = st.progress(0.0, text=f"Analyzing {len(batch_images)} images...")
+        results = [None] * len(batch_images)
+        batch = analyze_batch(gemini, batch_images, IMAGE_PREP, max_concurrency=BATCH_CONCURRENCY)
+        for done, result in enumerate(batch, 1):
+            results[result.index] = result
+            progress.progress(done / len(batch_images), text=f"Analyzed {done} of {len(batch_images)} images")
+        progress.empty()
+        st.session_state.batch_key = batch_key
+        st.session_state.batch_results = results
+
+        # Save all descriptions to the chat history as one message
+        descriptions = [f"**{r.image.name}**: {r.description}" for r in results if r.error is None]
+        if descriptions:
+            st.session_state.chat_history.append(("assistant", "\n\n".join(descriptions)))
+    results = st.session_state.batch_results
+
+    # Display the images in a grid
+    for row in range(0, len(results), 4):
+        for column, result in zip(st.columns(4), results[row:row + 4]):
+            with column:
+                st.image(result.image.data, caption=result.image.name, use_column_width=True)
+                if result.error is not None:
+                    st.error(f"Could not analyze this image: {result.error}")
+
+    # Step 4: Chat about any or all of the images
+    st.subheader("Step 4: Chat about the Images")
+    analyzed = [result for result in results if result.error is None]
+    selected = st.multiselect(
+        "Ask about", range(len(analyzed)), default=range(len(analyzed)),
+        format_func=lambda i: analyzed[i].image.name,
+    )
+    chat_about_images([analyzed[i].file for i in selected], "Ask Gemini-Pro about the images...")
 else:
     st.info("Please select and provide an image to proceed.")
 
-# Clean up temporary files
-if image_path:
-    os.remove(image_path)
+# Optional latency panel (p50/p95 per stage) in the sidebar
+render_panel(run_span)
@@ -0,0 +1,6 @@
+"""
+Helpers shared by the Streamlit entry-point scripts.
+The module-level instances at the bottom of each module (tts_cache,
+gemini_client, ...) are shared by every session of every page running in
+the process, and configured from environment variables.
+"""
@@ -0,0 +1,155 @@
+from math import gcd
+
+import numpy as np
+
+
+def design_polyphase_filter(up, down, taps_per_phase=16, rolloff=0.9, beta=8.0):
+    """
+    Designs the anti-aliasing low-pass filter for resampling by up/down and
+    splits it into `up` phases.
+    Returns:
+        np.ndarray: Array of shape (up, taps_per_phase); row p holds the taps
+        h[p], h[p + up], h[p + 2 * up], ... scaled by `up` to keep unit gain
+    """
+    length = taps_per_phase * up
+    # Cutoff in cycles per sample of the upsampled signal
+    cutoff = 0.5 * rolloff / max(up, down)
+    n = np.arange(length) - (length - 1) / 2
+    taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, beta)
+    taps *= up / taps.sum()
+    return taps.reshape(taps_per_phase, up).T.astype(np.float32)
+
+
+class PolyphaseResampler:
+    """
+    Streaming rational resampler (in_rate -> out_rate) for mono float32 blocks.
+    The filter history is carried across blocks, so consecutive frames resample
+    as one continuous signal. Work buffers are preallocated for `max_block`
+    samples (and grown for a longer block) and the gather indices are cached
+    per (block length, phase offset), so steady-state calls do not allocate.
+    """
+
+    def __init__(self, in_rate, out_rate, taps_per_phase=16, max_block=4096):
+        divisor = gcd(in_rate, out_rate)
+        self.up = out_rate // divisor
+        self.down = in_rate // divisor
+        self.taps_per_phase = taps_per_phase
+        self.filters = design_polyphase_filter(self.up, self.down, taps_per_phase)
+        self.max_block = 0
+
+        self._history = taps_per_phase - 1
+        self._input = np.zeros(self._history, dtype=np.float32)
+        self._allocate(max_block)
+        # Upsampled position of the next output, relative to the start of the next block
+        self._offset = 0
+        self._plans = {}
+
+    def _allocate(self, max_block):
+        """(Re)allocates the work buffers for blocks of up to max_block samples, keeping the history."""
+        history = self._input[:self._history].copy()
+        self.max_block = max_block
+        self._input = np.zeros(self._history + max_block, dtype=np.float32)
+        self._input[:self._history] = history
+        max_out = max_block * self.up // self.down + 2
+        self._gathered = np.empty((max_out, self.taps_per_phase), dtype=np.float32)
+        self._output = np.empty(max_out, dtype=np.float32)
+
+    def _plan(self, block_length, offset):
+        """Gather indices and per-output filter rows for one block shape."""
+        key = (block_length, offset)
+        plan = self._plans.get(key)
+        if plan is None:
+            count = -(-(block_length * self.up - offset) // self.down)
+            positions = offset + np.arange(count) * self.down
+            bases = positions // self.up + self._history
+            indices = bases[:, None] - np.arange(self.taps_per_phase)[None, :]
+            plan = (count, indices, self.filters[positions % self.up], offset + count * self.down)
+            if len(self._plans) < 64:
+                self._plans[key] = plan
+        return plan
+
+    def process(self, block):
+        """
+        Resamples one block of float32 samples.
+        Returns:
+            np.ndarray: View of the output, valid until the next call
+        """
+        length = len(block)
+        if length > self.max_block:
+            self._allocate(length)
+        self._input[self._history:self._history + length] = block
+
+        count, indices, filters, next_position = self._plan(length, self._offset)
+        gathered = self._gathered[:count]
+        output = self._output[:count]
+        np.take(self._input, indices, out=gathered)
+        np.multiply(gathered, filters, out=gathered)
+        np.sum(gathered, axis=1, out=output)
+
+        # Keep the tail of this block as history for the next one
+        self._input[:self._history] = self._input[length:length + self._history]
+        self._offset = next_position - length * self.up
+        return output
+
+
+class AudioNormalizer:
+    """
+    Turns WebRTC audio frames (any rate, channel count and sample format) into
+    mono int16 samples at `out_rate`: downmix, polyphase resampling and dtype
+    conversion, all into preallocated buffers.
+    """
+
+    def __init__(self, out_rate=16000, taps_per_phase=16, max_block=4096):
+        self.out_rate = out_rate
+        self.taps_per_phase = taps_per_phase
+        self.max_block = max_block
+        self._resampler = None
+        self._in_rate = None
+        self._mono = np.empty(max_block, dtype=np.float32)
+        self._pcm = np.empty(max_block, dtype=np.int16)
+
+    def downmix(self, frame):
+        """Averages the channels of a frame into float32 samples in [-1, 1]."""
+        samples = frame.to_ndarray()
+        channels = len(frame.layout.channels)
+        if frame.format.is_planar:
+            samples = samples.reshape(channels, -1)
+            axis = 0
+        else:
+            samples = samples.reshape(-1, channels)
+            axis = 1
+        length = samples.shape[1 - axis]
+        if length > len(self._mono):
+            self._mono = np.empty(length, dtype=np.float32)
+        mono = self._mono[:length]
+        np.mean(samples, axis=axis, dtype=np.float32, out=mono)
+        if frame.format.name.startswith(("s16", "s32")):
+            np.multiply(mono, 1.0 / np.iinfo(samples.dtype).max, out=mono)
+        return mono
+
+    def process(self, frame):
+        """
+        Normalizes one frame.
+        Returns:
+            np.ndarray: Mono int16 samples at out_rate, as a view that is only
+            valid until the next call
+        """
+        if frame.sample_rate != self._in_rate:
+            self._in_rate = frame.sample_rate
+            self._resampler = None
+            if frame.sample_rate != self.out_rate:
+                self._resampler = PolyphaseResampler(
+                    frame.sample_rate, self.out_rate, self.taps_per_phase, self.max_block
+                )
+
+        samples = self.downmix(frame)
+        if self._resampler is not None:
+            samples = self._resampler.process(samples)
+
+        if len(samples) > len(self._pcm):
+            self._pcm = np.empty(len(samples), dtype=np.int16)
+        pcm = self._pcm[:len(samples)]
+        np.multiply(samples, 32767, out=samples)
+        np.clip(samples, -32768, 32767, out=samples)
+        np.copyto(pcm, samples, casting="unsafe")
+        return pcm
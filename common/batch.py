@@ -0,0 +1,61 @@
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from common.description_cache import DEFAULT_PROMPT, description_cache
+from common.gemini_client import gemini_client
+from common.image_prep import preprocess
+from common.sessions import current_session_id
+from common.tracing import tracer
+from common.upload_cache import upload_cache
+
+# Outcome for one image of a batch; error is set (and file/description are None) when it failed
+BatchResult = namedtuple("BatchResult", ["index", "image", "file", "description", "error", "prep_stats"])
+
+# Shared by every session; each batch is further bounded by its own Gemini slot limit
+_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("BATCH_WORKERS", 8)),
+    thread_name_prefix="batch",
+)
+
+
+def _analyze(index, image, model, prep_config, prompt, session_id, limit):
+    """Prepares, uploads and describes one image."""
+    with gemini_client.session(f"{session_id}:batch", limit), tracer.session(session_id):
+        try:
+            image, prep_stats = preprocess(image, prep_config)
+            image_file = upload_cache.upload_image(image)
+            description = description_cache.describe(model, image_file, image.digest, prompt)
+        except Exception as e:
+            return BatchResult(index, image, None, None, e, None)
+    return BatchResult(index, image, image_file, description, None, prep_stats)
+
+
+def analyze_batch(model, images, prep_config=None, prompt=DEFAULT_PROMPT, max_concurrency=4):
+    """
+    Prepares, uploads and describes several images concurrently.
+    Results are yielded as they complete, so the caller can report progress;
+    an image that fails yields a result with `error` set instead of stopping
+    the batch. Images already uploaded or described come from the caches.
+    Args:
+        model: Gemini GenerativeModel
+        images (list): ImageInput objects
+        prep_config (PrepConfig): Preprocessing applied before upload, or None
+        prompt (str): Question asked about each image
+        max_concurrency (int): Gemini calls this batch may have in flight at once
+    Returns:
+        Iterator of BatchResult, in completion order
+    """
+    # Batch calls get their own fairness key (see _analyze), so they do not eat into the session's interactive slots
+    session_id = current_session_id()
+    futures = [
+        _pool.submit(_analyze, index, image, model, prep_config, prompt, session_id, max_concurrency)
+        for index, image in enumerate(images)
+    ]
+    try:
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # A rerun can abandon the batch midway; drop the images not started yet
+        for future in futures:
+            future.cancel()
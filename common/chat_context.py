@@ -0,0 +1,249 @@
+import hashlib
+import logging
+
+from google.generativeai.types import BrokenResponseError, IncompleteIterationError
+
+from common.gemini_client import finish_reason, gemini_client
+from common.response_cache import CachedResponse, RecordingResponse
+from common.tracing import tracer
+from common.upload_cache import upload_cache
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below in a few sentences. Keep the facts, names "
+    "and numbers needed to answer follow-up questions.\n\n"
+    "Earlier summary:\n{summary}\n\nConversation:\n{transcript}"
+)
+SUMMARY_PREFIX = "Summary of our earlier conversation: "
+SUMMARY_ACK = "Understood."
+
+logger = logging.getLogger(__name__)
+
+
+def _text_parts(content):
+    """Returns the text parts of a history entry, dropping file references."""
+    return [part.text for part in content.parts if part.text]
+
+
+def _message_parts(content):
+    """Splits send_message content into its text and its file references."""
+    items = content if isinstance(content, (list, tuple)) else [content]
+    return [item for item in items if isinstance(item, str)], [item for item in items if not isinstance(item, str)]
+
+
+class BoundedChat:
+    """
+    Gemini chat session whose context stays within a token budget.
+    The last `keep_turns` turns are kept verbatim; older turns are folded into a
+    rolling summary that is sent as the first turn. File references (the image)
+    are dropped from past turns because every new message attaches the file again.
+    It can be used wherever a ChatSession was used (send_message, history);
+    history only holds the verbatim turns, so pages keep the displayed
+    conversation themselves (see session_store.Transcript).
+    With a ConversationLog, every new summary is saved to it so restore() can
+    pick the conversation up again. With a ResponseCache, a question close to
+    one already answered about the same images, at the same point of the
+    conversation, is answered from the cache instead of the model.
+    Answers prepared ahead of time (see speculate) are added with record_turn.
+    """
+
+    def __init__(self, model, keep_turns=6, max_tokens=8000, log=None, response_cache=None):
+        self.model = model
+        self.keep_turns = keep_turns
+        self.max_tokens = max_tokens
+        self.log = log
+        self.response_cache = response_cache
+        self.summary = ""
+        self.turns = 0  # questions asked since the chat was created or restored
+        self.prompt_tokens = []  # prompt token count of every turn sent so far
+        self._chat = model.start_chat(history=[])
+        self._last_response = None
+        self._history_before_send = None  # see rewind
+
+    @property
+    def context(self):
+        """The verbatim turns still sent to the model, without the summary turn."""
+        history = self._full_history()
+        return history[2:] if self.summary else history
+
+    @property
+    def history(self):
+        """The verbatim turns; folded turns only live on in the summary."""
+        return list(self.context)
+
+    def restore(self, summary, messages):
+        """
+        Continues a saved conversation without calling the model.
+        Args:
+            summary (str): The saved summary
+            messages (list): Recent (speaker, text) messages of the page history,
+                oldest first; the last keep_turns question/answer pairs become the context
+        """
+        self.summary = summary
+        pairs = [
+            (question, answer)
+            for (speaker, question), (next_speaker, answer) in zip(messages, messages[1:])
+            if speaker == "user" and next_speaker == "assistant"
+        ]
+        turns = []
+        for question, answer in pairs[-self.keep_turns:]:
+            turns += [("user", [question]), ("model", [answer])]
+        self._set_history(turns)
+
+    def send_message(self, content, question=None, **kwargs):
+        """
+        Sends a message (same arguments as ChatSession.send_message).
+        With stream=True, only the request up to the first chunk runs under the
+        Gemini client's slots; reading the rest is bounded only by the SDK's
+        request timeout (see GeminiClient).
+        Args:
+            question (str): The user's own words, the response cache key when
+                content wraps them in a longer prompt; defaults to the text of content
+        """
+        self.turns += 1
+        self._record_usage()
+        self._compact()
+        self._history_before_send = list(self._chat.history)
+        texts, files = _message_parts(content)
+        if self.response_cache is None:
+            self._last_response = gemini_client.call(self._chat.send_message, content, **kwargs)
+            return self._last_response
+
+        bucket = self._cache_bucket(files)
+        question = question or " ".join(texts)
+        with tracer.span("response_cache.lookup") as attrs:
+            answer = self.response_cache.get(bucket, question)
+            attrs["hit"] = answer is not None
+        if answer is not None:
+            # Record the turn as if the model had answered, so follow-ups keep their context
+            self._append_turn(texts, answer)
+            return CachedResponse(answer)
+
+        response = gemini_client.call(self._chat.send_message, content, **kwargs)
+        if kwargs.get("stream"):
+            response = RecordingResponse(response, lambda text: self.response_cache.put(bucket, question, text))
+        elif finish_reason(response) == "STOP":
+            # Answers cut short (SAFETY, RECITATION, MAX_TOKENS) would be served to everyone asking next
+            self.response_cache.put(bucket, question, response.text)
+        self._last_response = response
+        return response
+
+    def rewind(self):
+        """
+        Drops the last message sent and its answer, e.g. an answer whose stream
+        was interrupted or blocked, after which the SDK cannot build the history.
+        ChatSession.rewind() itself fails on a stream that was not read to the
+        end, so the history from before the message is put back instead.
+        """
+        if self._history_before_send is not None:
+            self._chat.history = self._history_before_send
+            self._history_before_send = None
+        self._last_response = None
+
+    def record_turn(self, question, answer):
+        """Adds a question and an answer prepared for it (see speculate) without calling the model."""
+        self.turns += 1
+        self._record_usage()
+        self._compact()
+        self._append_turn([question], answer)
+
+    def speculate(self, files):
+        """
+        Prepares to answer questions about `files` as the next turn, without
+        recording them: the history and response cache bucket are taken now, so
+        the returned function can run on another thread while the page goes on.
+        Answers come from the response cache or a one-off generate_content call,
+        and are cached; one the model did not finish normally raises ValueError.
+        Returns:
+            callable: answer(question) -> str
+        """
+        history = list(self._full_history())
+        bucket = self._cache_bucket(files) if self.response_cache is not None else None
+
+        def answer(question):
+            if bucket is not None:
+                text = self.response_cache.get(bucket, question)
+                if text is not None:
+                    return text
+            contents = [*history, {"role": "user", "parts": [*files, question]}]
+            response = gemini_client.call(self.model.generate_content, contents)
+            reason = finish_reason(response)
+            if reason != "STOP":
+                raise ValueError(f"The answer stopped with {reason}")
+            text = response.text
+            if bucket is not None:
+                self.response_cache.put(bucket, question, text)
+            return text
+
+        return answer
+
+    def _cache_bucket(self, files):
+        """
+        Response cache bucket of the next turn: the model, the images' content
+        hashes and the conversation so far. Only the summary and the answers are
+        hashed, so sessions that got the same (cached) answers share buckets.
+        """
+        images = tuple(upload_cache.digest_of(file) or getattr(file, "uri", "") for file in files)
+        answers = [" ".join(_text_parts(content)) for content in self.context if content.role == "model"]
+        context = hashlib.sha256("\0".join([self.summary, *answers]).encode("utf-8")).hexdigest()
+        return self.model.model_name, images, context
+
+    @property
+    def last_prompt_tokens(self):
+        """Prompt tokens of the latest turn (once its response is complete), or None."""
+        self._record_usage()
+        return self.prompt_tokens[-1] if self.prompt_tokens else None
+
+    def _record_usage(self):
+        response, self._last_response = self._last_response, None
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None and usage.prompt_token_count:
+            self.prompt_tokens.append(usage.prompt_token_count)
+
+    def _compact(self):
+        """Drops file references from past turns and folds old turns into the summary."""
+        turns = [(content.role, _text_parts(content)) for content in self.context]
+        kept_turns = self.keep_turns
+        over_budget = bool(self.prompt_tokens) and self.prompt_tokens[-1] > self.max_tokens
+        if over_budget:
+            kept_turns = max(1, self.keep_turns // 2)
+
+        # Fold in batches of keep_turns so the summary call is not made on every turn
+        fold = len(turns) // 2 > self.keep_turns * 2 or (over_budget and len(turns) // 2 > kept_turns)
+        if fold:
+            old, turns = turns[: -kept_turns * 2], turns[-kept_turns * 2 :]
+            transcript = "\n".join(f"{role}: {' '.join(parts)}" for role, parts in old)
+            self.summary = gemini_client.call(
+                self.model.generate_content,
+                SUMMARY_PROMPT.format(summary=self.summary or "(none)", transcript=transcript),
+            ).text
+            if self.log is not None:
+                self.log.save_summary(self.summary)
+        self._set_history(turns)
+
+    def _append_turn(self, texts, answer):
+        self._chat.history = [
+            *self._full_history(),
+            {"role": "user", "parts": texts or [""]},
+            {"role": "model", "parts": [answer]},
+        ]
+
+    def _full_history(self):
+        """The chat history with the summary turn, after dropping a broken last turn."""
+        try:
+            return self._chat.history
+        except (BrokenResponseError, IncompleteIterationError):
+            # The last answer was not read to the end, broke off or was blocked (see rewind)
+            logger.info("Dropped a broken turn from the chat history", exc_info=True)
+            self.rewind()
+            return self._chat.history
+
+    def _set_history(self, turns):
+        """Replaces the chat history with the summary turn and (role, text parts) turns."""
+        history = []
+        if self.summary:
+            history += [
+                {"role": "user", "parts": [SUMMARY_PREFIX + self.summary]},
+                {"role": "model", "parts": [SUMMARY_ACK]},
+            ]
+        history += [{"role": role, "parts": parts or [""]} for role, parts in turns]
+        self._chat.history = history
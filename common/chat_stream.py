@@ -0,0 +1,96 @@
+import logging
+import time
+from collections import namedtuple
+
+import streamlit as st
+
+from common.gemini_client import finish_reason
+from common.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Finish reasons of an answer worth keeping; MAX_TOKENS answers are cut short but coherent
+COMPLETE = ("STOP", "MAX_TOKENS")
+
+# Timing of one streamed assistant turn
+TurnStats = namedtuple(
+    "TurnStats", ["time_to_first_token", "total_time", "tokens", "tokens_per_sec", "prompt_tokens"]
+)
+
+
+def stream_reply(chat, content, show_stats=True, question=None):
+    """
+    Sends a chat message with streaming on and renders the text as it arrives.
+    Call it inside the st.chat_message("assistant") container; the chat history
+    should only be updated with the returned text once this returns.
+    The Gemini client holds its slots only until the first chunk; the rest of
+    the stream is read here, bounded only by the SDK's request timeout.
+    An answer that is not finished (a rerun or network error mid-stream) or
+    was stopped by the model (SAFETY, RECITATION, ...) is dropped from the chat
+    with chat.rewind(), since the SDK cannot build the history past it, and an
+    error is shown in its place.
+    Args:
+        chat: Gemini chat session
+        content: Message passed to chat.send_message
+        show_stats (bool): Whether to show the timing caption under the answer
+        question (str): The user's own words when content wraps them in a longer
+            prompt, used by BoundedChat's response cache
+    Returns:
+        (str, TurnStats): The full response text and its timing, or (None, None)
+        when the answer was dropped
+    """
+    placeholder = st.empty()
+    start = time.perf_counter()
+    first_token_at = None
+    text = ""
+
+    if question is None:
+        response = chat.send_message(content, stream=True)
+    else:
+        response = chat.send_message(content, stream=True, question=question)
+    try:
+        for chunk in response:
+            try:
+                piece = chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. the final metadata chunk)
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            text += piece
+            placeholder.markdown(text + "▌")
+    except Exception:
+        logger.warning("The answer stream broke off", exc_info=True)
+    finally:
+        # Also runs when a rerun stops the script mid-stream
+        reason = finish_reason(response)
+        if reason not in COMPLETE:
+            chat.rewind()
+    if reason not in COMPLETE:
+        logger.info("Dropped an answer that stopped with %s", reason or "an unfinished stream")
+        placeholder.error("The answer could not be completed. Please ask again, or rephrase the question.")
+        return None, None
+    placeholder.markdown(text)
+
+    end = time.perf_counter()
+    first_token_at = first_token_at or end
+    usage = getattr(response, "usage_metadata", None)
+    tokens = getattr(usage, "candidates_token_count", 0) or len(text.split())
+    generation_time = end - first_token_at
+    stats = TurnStats(
+        time_to_first_token=first_token_at - start,
+        total_time=end - start,
+        tokens=tokens,
+        tokens_per_sec=tokens / generation_time if generation_time > 0 else 0.0,
+        prompt_tokens=getattr(usage, "prompt_token_count", 0) or 0,
+    )
+    tracer.record("chat.first_token", stats.time_to_first_token)
+    tracer.record("chat.stream", stats.total_time, tokens=stats.tokens)
+
+    if show_stats:
+        st.caption(
+            f"First token in {stats.time_to_first_token:.2f}s · "
+            f"{stats.tokens} tokens at {stats.tokens_per_sec:.1f} tokens/s · "
+            f"prompt {stats.prompt_tokens} tokens"
+        )
+    return text, stats
@@ -0,0 +1,79 @@
+import math
+
+import streamlit as st
+
+from common.tracing import tracer
+
+
+def render_history(history, render_message, window=10, key="chat"):
+    """
+    Renders a chat history so that rerun cost does not grow with its length.
+    Only the last `window` messages are rendered on every rerun. Older messages
+    stay collapsed behind a toggle and, when expanded, are shown one page of
+    `window` messages at a time.
+    Args:
+        history (list): Messages, oldest first
+        render_message (callable): Called as render_message(index, message, recent);
+            recent is False for messages on an older page, which should skip
+            anything expensive such as audio players
+        window (int): Number of recent messages rendered in full
+        key (str): Prefix for the widget keys, unique per history on the page
+    """
+    with tracer.span("render.history", messages=len(history)):
+        _render_history(history, render_message, window, key)
+
+
+def _render_history(history, render_message, window, key):
+    older = max(0, len(history) - window)
+
+    if older:
+        label = f"Show {older} earlier message{'s' if older > 1 else ''}"
+        if st.toggle(label, key=f"{key}_show_older"):
+            pages = math.ceil(older / window)
+            page = pages
+            if pages > 1:
+                page = st.number_input("Page", min_value=1, max_value=pages, value=pages, key=f"{key}_page")
+            start = (page - 1) * window
+            for index in range(start, min(start + window, older)):
+                render_message(index, history[index], False)
+            st.divider()
+
+    for index in range(older, len(history)):
+        render_message(index, history[index], True)
+
+
+def render_suggestions(job, key="suggestions", poll=1.0):
+    """
+    Shows the answered questions of a PrefetchJob as one-click suggestions.
+    While the job runs, the suggestions are refreshed every `poll` seconds
+    without rerunning the page; a click reruns the page, which gets the
+    suggestion back from this function.
+    Args:
+        job (PrefetchJob): The job, or None
+        key (str): Prefix for the widget keys, unique per chat on the page
+        poll (float): Seconds between refreshes while answers are being prepared
+    Returns:
+        Suggestion: The one clicked on the previous run, or None
+    """
+    picked = st.session_state.pop(f"{key}_picked", None)
+    if picked is not None or job is None or job.stale:
+        return picked
+    polling = not job.done
+    st.fragment(_render_suggestions, run_every=poll if polling else None)(job, key, polling)
+    return None
+
+
+def _render_suggestions(job, key, polling):
+    if polling and job.done:
+        # Rerun the page once, so the fragment stops polling
+        st.rerun()
+    suggestions = job.ready()
+    if not suggestions:
+        if polling:
+            st.caption("Preparing suggested questions...")
+        return
+    st.caption("Suggested questions")
+    for suggestion in suggestions:
+        if st.button(suggestion.question, key=f"{key}_{suggestion.index}"):
+            st.session_state[f"{key}_picked"] = job.take(suggestion.index)
+            st.rerun()
@@ -0,0 +1,353 @@
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import streamlit as st
+
+from common.sessions import current_session_id
+from common.upload_cache import EXPIRY_MARGIN, FILE_LIFETIME
+
+logger = logging.getLogger(__name__)
+
+# A saved conversation; turns is only the number of saved turns (load them with load_turns),
+# image_file is None when there is no image or its Gemini file is (about to be) deleted
+Conversation = namedtuple(
+    "Conversation", ["id", "image_digest", "image_file", "model", "description", "summary", "turns"]
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    image_digest TEXT,
+    model TEXT,
+    description TEXT,
+    summary TEXT NOT NULL DEFAULT '',
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS turns (
+    conversation_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    speaker TEXT NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (conversation_id, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS files (
+    digest TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    uri TEXT NOT NULL,
+    mime_type TEXT,
+    expires_at REAL NOT NULL
+);
+"""
+
+_TOUCH = (
+    "INSERT INTO conversations (id, updated_at) VALUES (?, ?) "
+    "ON CONFLICT (id) DO UPDATE SET updated_at = excluded.updated_at"
+)
+
+
+def _is_live(session_id):
+    """Whether a Streamlit session still has a connected browser tab."""
+    from streamlit.runtime import Runtime
+
+    return Runtime.exists() and Runtime.instance().is_active_session(session_id)
+
+
+def current_conversation():
+    """
+    Returns the id of the conversation shown in this browser tab. It is kept in
+    the ?conversation= URL parameter, which survives reconnects and restarts
+    (unlike the Streamlit session id), and created on the first visit.
+    A conversation belongs to one live session at a time (see
+    ConversationStore.claim): a duplicated tab or a link opened elsewhere while
+    the conversation is open gets a new conversation of its own. A link opened
+    after its tab was closed resumes the conversation, so treat it as private.
+    """
+    session_id = current_session_id("shared")
+    conversation_id = st.query_params.get("conversation")
+    if not conversation_id or not conversation_store.claim(conversation_id, session_id):
+        conversation_id = uuid.uuid4().hex
+        conversation_store.claim(conversation_id, session_id)
+        st.query_params["conversation"] = conversation_id
+    return conversation_id
+
+
+def _expiration_time(image_file):
+    """Epoch seconds at which a Gemini file is deleted, assuming the full lifetime when unknown."""
+    expiration_time = getattr(image_file, "expiration_time", None)
+    if isinstance(expiration_time, datetime):
+        if expiration_time.tzinfo is None:
+            expiration_time = expiration_time.replace(tzinfo=timezone.utc)
+        return expiration_time.timestamp()
+    return time.time() + FILE_LIFETIME
+
+
+def _restore_file(name, uri, mime_type, expires_at):
+    """Rebuilds a Gemini file handle that can be sent in a message, without an API call."""
+    import google.generativeai as genai
+
+    return genai.protos.File(
+        name=name,
+        uri=uri,
+        mime_type=mime_type,
+        expiration_time=datetime.fromtimestamp(expires_at, timezone.utc),
+    )
+
+
+class ConversationLog:
+    """Where one conversation's turns and summary are saved (see Transcript and BoundedChat)."""
+
+    def __init__(self, store, conversation_id, turns=0, session_id=None):
+        self.store = store
+        self.conversation_id = conversation_id
+        self.turns = turns  # turns already saved when the log was opened
+        self.session_id = session_id  # session that writes to it
+        self.page_size = store.page_size
+
+    def append(self, position, speaker, text):
+        self.store.save_turn(self.conversation_id, position, speaker, text, self.session_id)
+
+    def load(self, start, count):
+        return self.store.load_turns(self.conversation_id, start, count)
+
+    def save_summary(self, summary):
+        self.store.save_summary(self.conversation_id, summary, self.session_id)
+
+
+class ConversationStore:
+    """
+    Saves conversations (turns, the chat summary, the image content hash, its
+    Gemini file and description) in SQLite, so a tab can pick its conversation
+    up again after a dropped connection or a server restart.
+    Writes are queued and committed by a background thread in batches of up
+    to `batch_size` statements, at most `flush_interval` seconds after they
+    were queued, so scripts never wait on the disk; load() only waits for the
+    writes still queued for its own conversation. The database runs in WAL
+    mode, so reads on the script thread do not block on the writer. Turns are
+    read a page of `page_size` at a time. Conversations not updated for
+    `max_age` seconds are deleted on startup. With db_path=None nothing is saved.
+    Only the session holding a conversation (see claim) writes to it, and saved
+    turns are never overwritten, so two tabs cannot clobber each other's history.
+    """
+
+    def __init__(self, db_path, batch_size=100, flush_interval=0.2, page_size=50, max_age=30 * 24 * 60 * 60):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.page_size = page_size
+        self.max_age = max_age
+        self.batches = 0
+        self._queue = queue.Queue()
+        self._db = None  # reader connection
+        self._lock = threading.Lock()
+        self._owners = {}  # conversation id -> session id holding it
+        self._pending = {}  # conversation id -> writes queued but not committed yet
+        self._written = threading.Condition()
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        # WAL makes NORMAL safe against corruption; a crash can only lose the last commits
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _ensure_started(self):
+        """Creates the schema and starts the writer thread on first use."""
+        with self._lock:
+            if self._db is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+                db = self._connect()
+                with db:
+                    db.executescript(_SCHEMA)
+                    expired = time.time() - self.max_age
+                    db.execute(
+                        "DELETE FROM turns WHERE conversation_id IN (SELECT id FROM conversations WHERE updated_at < ?)",
+                        (expired,),
+                    )
+                    db.execute("DELETE FROM conversations WHERE updated_at < ?", (expired,))
+                    db.execute("DELETE FROM files WHERE expires_at < ?", (time.time(),))
+                threading.Thread(target=self._write_forever, name="conversation-writer", daemon=True).start()
+                atexit.register(self.flush)
+                self._db = db
+        return self._db
+
+    def _write(self, conversation_id, statement, params):
+        """Queues a write to a conversation for the background thread."""
+        if self.db_path:
+            self._ensure_started()
+            with self._written:
+                self._pending[conversation_id] = self._pending.get(conversation_id, 0) + 1
+            self._queue.put((conversation_id, statement, params))
+
+    def _write_forever(self):
+        db = None
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                if db is None:
+                    db = self._connect()
+                with db:
+                    for _, statement, params in batch:
+                        db.execute(statement, params)
+                self.batches += 1
+            except Exception:
+                # Whatever went wrong, the thread lives on: load() and flush() wait on it
+                logger.exception("Could not save %d conversation updates", len(batch))
+            finally:
+                self._written_batch(batch)
+
+    def _written_batch(self, batch):
+        """Marks a batch as handled, committed or not."""
+        with self._written:
+            for conversation_id, _, _ in batch:
+                self._pending[conversation_id] -= 1
+                if not self._pending[conversation_id]:
+                    del self._pending[conversation_id]
+            self._written.notify_all()
+        for _ in batch:
+            self._queue.task_done()
+
+    def flush(self):
+        """Waits until every queued write is committed."""
+        if self._db is not None:
+            self._queue.join()
+
+    def _wait_for_writes(self, conversation_id):
+        """Waits until the writes queued for one conversation are committed."""
+        with self._written:
+            self._written.wait_for(lambda: conversation_id not in self._pending)
+
+    def claim(self, conversation_id, session_id=None):
+        """
+        Binds a conversation to a session (the current one by default).
+        Returns:
+            bool: False while another session holding it still has a connected tab
+        """
+        session_id = session_id or current_session_id("shared")
+        with self._lock:
+            owner = self._owners.get(conversation_id)
+            if owner not in (None, session_id) and _is_live(owner):
+                return False
+            self._owners[conversation_id] = session_id
+            if len(self._owners) > 4096:
+                # Forget the conversations of closed tabs
+                self._owners = {
+                    conversation: owner
+                    for conversation, owner in self._owners.items()
+                    if owner == session_id or _is_live(owner)
+                }
+            return True
+
+    def _claimed(self, conversation_id, session_id):
+        """Claims a conversation for a write, logging writes another session holds."""
+        if self.claim(conversation_id, session_id):
+            return True
+        logger.info("Not saving to conversation %s, another tab has it open", conversation_id)
+        return False
+
+    def log(self, conversation_id, turns=0):
+        """Returns the log the current session's Transcript and BoundedChat save into."""
+        return ConversationLog(self, conversation_id, turns, current_session_id("shared"))
+
+    def save_turn(self, conversation_id, position, speaker, text, session_id=None):
+        if not self._claimed(conversation_id, session_id):
+            return
+        self._write(conversation_id, _TOUCH, (conversation_id, time.time()))
+        # A turn already saved at this position is kept, never replaced
+        self._write(
+            conversation_id,
+            "INSERT INTO turns VALUES (?, ?, ?, ?) ON CONFLICT (conversation_id, position) DO NOTHING",
+            (conversation_id, position, speaker, text),
+        )
+
+    def save_summary(self, conversation_id, summary, session_id=None):
+        if self._claimed(conversation_id, session_id):
+            self._write(
+                conversation_id, "UPDATE conversations SET summary = ? WHERE id = ?", (summary, conversation_id)
+            )
+
+    def save_image(self, conversation_id, digest, image_file, model_name, description, session_id=None):
+        """Records the conversation's image: its content hash, Gemini file and description."""
+        if not self._claimed(conversation_id, session_id):
+            return
+        self._write(conversation_id, _TOUCH, (conversation_id, time.time()))
+        self._write(
+            conversation_id,
+            "UPDATE conversations SET image_digest = ?, model = ?, description = ? WHERE id = ?",
+            (digest, model_name, description, conversation_id),
+        )
+        self._write(
+            conversation_id,
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+            (digest, image_file.name, image_file.uri, getattr(image_file, "mime_type", None),
+             _expiration_time(image_file)),
+        )
+
+    def reset(self, conversation_id, session_id=None):
+        """Starts a conversation over: drops its turns, summary and image."""
+        if not self._claimed(conversation_id, session_id):
+            return
+        self._write(conversation_id, "DELETE FROM turns WHERE conversation_id = ?", (conversation_id,))
+        self._write(
+            conversation_id,
+            "UPDATE conversations SET image_digest = NULL, model = NULL, description = NULL, summary = '' "
+            "WHERE id = ?",
+            (conversation_id,),
+        )
+
+    def load(self, conversation_id):
+        """
+        Returns a saved conversation without its turns, or None.
+        Waits for the conversation's queued writes first, so a quick reconnect
+        sees its latest turns.
+        """
+        if not self.db_path:
+            return None
+        db = self._ensure_started()
+        self._wait_for_writes(conversation_id)
+        with self._lock:
+            row = db.execute(
+                "SELECT image_digest, model, description, summary FROM conversations WHERE id = ?",
+                (conversation_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            turns = db.execute("SELECT COUNT(*) FROM turns WHERE conversation_id = ?", (conversation_id,)).fetchone()
+            file_row = db.execute(
+                "SELECT name, uri, mime_type, expires_at FROM files WHERE digest = ? AND expires_at > ?",
+                (row[0], time.time() + EXPIRY_MARGIN),
+            ).fetchone()
+        image_file = _restore_file(*file_row) if file_row else None
+        return Conversation(conversation_id, row[0], image_file, row[1], row[2], row[3], turns[0])
+
+    def load_turns(self, conversation_id, start, count):
+        """Returns `count` saved (speaker, text) turns from position `start`, oldest first."""
+        db = self._ensure_started()
+        with self._lock:
+            return db.execute(
+                "SELECT speaker, text FROM turns WHERE conversation_id = ? AND position >= ? AND position < ? "
+                "ORDER BY position",
+                (conversation_id, start, start + count),
+            ).fetchall()
+
+
+conversation_store = ConversationStore(
+    db_path=os.environ.get(
+        "CONVERSATION_DB", os.path.join(tempfile.gettempdir(), "gemini-chat", "conversations.db")
+    ) or None,
+    max_age=int(os.environ.get("CONVERSATION_MAX_AGE", 30 * 24 * 60 * 60)),
+)
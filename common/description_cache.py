@@ -0,0 +1,115 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from common.gemini_client import gemini_client
+
+DEFAULT_PROMPT = "What is in the image?"
+
+
+class DescriptionCache:
+    """
+    Caches the model's description of an image, keyed by
+    (image content hash, model name, prompt).
+    The memory tier is an LRU with a fixed number of entries; when a SQLite
+    path is given, descriptions are also persisted and survive restarts.
+    """
+
+    def __init__(self, max_entries=512, db_path=None):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS descriptions (
+                    digest TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    prompt TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (digest, model, prompt)
+                )
+                """
+            )
+            self._db.commit()
+
+    def _remember(self, key, text):
+        """Adds a description to the memory tier. Called with the lock held."""
+        self._entries[key] = text
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, digest, model_name, prompt=DEFAULT_PROMPT):
+        """Returns the cached description, or None."""
+        key = (digest, model_name, prompt)
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return text
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT text FROM descriptions WHERE digest = ? AND model = ? AND prompt = ?",
+                    key,
+                ).fetchone()
+                if row is not None:
+                    self._remember(key, row[0])
+                    self.hits += 1
+                    return row[0]
+        return None
+
+    def put(self, digest, model_name, text, prompt=DEFAULT_PROMPT):
+        """Stores a description."""
+        key = (digest, model_name, prompt)
+        with self._lock:
+            self._remember(key, text)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO descriptions VALUES (?, ?, ?, ?, ?)",
+                    (*key, text, time.time()),
+                )
+                self._db.commit()
+
+    def describe(self, model, image_file, digest, prompt=DEFAULT_PROMPT):
+        """
+        Returns the model's description of an uploaded image, calling the model only on a miss.
+        Args:
+            model: Gemini GenerativeModel
+            image_file: File handle returned by the upload
+            digest (str): Content hash of the image
+            prompt (str): Question asked about the image
+        """
+        text = self.get(digest, model.model_name, prompt)
+        if text is not None:
+            return text
+
+        # Sessions describing the same image at the same time share one call
+        key = (digest, model.model_name, prompt)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            text = self.get(digest, model.model_name, prompt)
+            if text is None:
+                with self._lock:
+                    self.misses += 1
+                text = gemini_client.call(model.generate_content, [image_file, prompt]).text
+                self.put(digest, model.model_name, text, prompt)
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return text
+
+
+description_cache = DescriptionCache(
+    max_entries=int(os.environ.get("DESCRIPTION_CACHE_SIZE", 512)),
+    db_path=os.environ.get("DESCRIPTION_CACHE_DB") or None,
+)
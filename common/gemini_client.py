@@ -0,0 +1,191 @@
+import asyncio
+import contextlib
+import inspect
+import os
+import random
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from google.api_core import exceptions as api_exceptions
+
+from common.sessions import current_session_id
+from common.tracing import tracer
+
+# Errors worth retrying: rate limits, overload and transient server failures.
+# Our own timeout is not: the timed-out thread still holds its slots, so a retry
+# would only queue behind it.
+RETRYABLE_ERRORS = (
+    api_exceptions.ResourceExhausted,
+    api_exceptions.TooManyRequests,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.InternalServerError,
+    api_exceptions.DeadlineExceeded,
+)
+
+
+def finish_reason(response):
+    """
+    Why the model stopped answering: "STOP", "MAX_TOKENS", "SAFETY",
+    "RECITATION", ... or None when a streamed response was not read to the
+    end, broke off with an error, or has no candidate (a blocked prompt).
+    """
+    if not getattr(response, "_done", True) or getattr(response, "_error", None) is not None:
+        return None
+    candidates = response.candidates
+    if not candidates:
+        return None
+    reason = candidates[-1].finish_reason
+    return getattr(reason, "name", reason)
+
+
+def _takes_request_options(fn):
+    """Whether fn accepts the SDK's request_options (generate_content and send_message do, upload_file doesn't)."""
+    try:
+        parameters = inspect.signature(fn).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    return any(p.name == "request_options" or p.kind is p.VAR_KEYWORD for p in parameters)
+
+
+class GeminiClient:
+    """
+    Runs blocking Gemini SDK calls (generate_content, send_message, upload_file)
+    on a shared asyncio loop.
+    - at most `max_in_flight` calls run at once across the process;
+    - one session can hold at most `per_session` of those slots, so a busy
+      session cannot starve the others;
+    - rate-limit and transient errors are retried with exponential backoff and
+      full jitter, waiting outside the slots so retries don't block other calls;
+    - each attempt is bounded by `timeout` seconds, which is also passed to
+      SDK calls as their request timeout so a hung request's thread returns.
+      A timed-out call cannot be interrupted, so its slots stay taken until
+      its thread returns (the worker pool has exactly `max_in_flight` threads
+      and is never starved), and it is not retried.
+    With stream=True the slots are held up to the first chunk, and the caller
+    reads the rest of the stream outside them; the SDK's request timeout may
+    also end a stream that runs longer than `timeout`.
+    Scripts use the blocking call(); other coroutines can await call_async().
+    """
+
+    def __init__(self, max_in_flight=8, per_session=2, max_retries=4, base_delay=1.0, max_delay=30.0, timeout=60.0):
+        self.max_in_flight = max_in_flight
+        self.per_session = per_session
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.retries = 0
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._in_flight = None
+        # Semaphores are dropped once no call of that session is waiting on them
+        self._sessions = weakref.WeakValueDictionary()
+        # Session overrides for worker threads, see session()
+        self._local = threading.local()
+
+    def _ensure_loop(self):
+        """Starts the event loop thread on first use."""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                # asyncio.to_thread's default pool has only cpu_count + 4 threads, which would cap max_in_flight
+                self._loop.set_default_executor(
+                    ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="gemini-call")
+                )
+                self._in_flight = asyncio.Semaphore(self.max_in_flight)
+                threading.Thread(target=self._loop.run_forever, name="gemini-client", daemon=True).start()
+        return self._loop
+
+    def _session_semaphore(self, session_id, limit=None):
+        semaphore = self._sessions.get(session_id)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(limit or self.per_session)
+            self._sessions[session_id] = semaphore
+        return semaphore
+
+    @contextlib.contextmanager
+    def session(self, session_id, limit=None):
+        """
+        Makes call() on this thread use `session_id` as its fairness key.
+        Worker threads have no Streamlit context, so without this all of their
+        calls would share one anonymous session.
+        Args:
+            session_id (str): Fairness key
+            limit (int): Slots for this key, defaults to per_session
+        """
+        previous = getattr(self._local, "session", None)
+        self._local.session = (session_id, limit)
+        try:
+            yield
+        finally:
+            self._local.session = previous
+
+    def backoff(self, attempt):
+        """Delay before retry number `attempt` (full jitter)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def call_async(self, fn, *args, session_id=None, session_limit=None, **kwargs):
+        """
+        Runs fn(*args, **kwargs) in a worker thread under the concurrency limits.
+        Must be awaited on the client's loop (call() takes care of that).
+        A timed-out attempt stops being awaited, but keeps its slots until its
+        thread returns.
+        """
+        if "request_options" not in kwargs and _takes_request_options(fn):
+            kwargs["request_options"] = {"timeout": self.timeout}
+        session = self._session_semaphore(session_id, session_limit)
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self._attempt(session, fn, *args, **kwargs)
+            except RETRYABLE_ERRORS:
+                if attempt == self.max_retries:
+                    raise
+            self.retries += 1
+            await asyncio.sleep(self.backoff(attempt))
+
+    async def _attempt(self, session, fn, *args, **kwargs):
+        """One call under the slots, released when the thread returns rather than at the timeout."""
+        await session.acquire()
+        try:
+            await self._in_flight.acquire()
+        except BaseException:
+            session.release()
+            raise
+        task = asyncio.ensure_future(asyncio.to_thread(fn, *args, **kwargs))
+
+        def release(done):
+            self._in_flight.release()
+            session.release()
+            # Nobody awaits a timed-out attempt; retrieve its exception so asyncio doesn't log it
+            if not done.cancelled():
+                done.exception()
+
+        task.add_done_callback(release)
+        return await asyncio.wait_for(asyncio.shield(task), self.timeout)
+
+    def call(self, fn, *args, session_id=None, **kwargs):
+        """
+        Blocking version of call_async() for the Streamlit script thread.
+        Args:
+            fn (callable): SDK call, e.g. model.generate_content
+            session_id (str): Fairness key, defaults to the thread's session() or the
+                current Streamlit session
+        """
+        loop = self._ensure_loop()
+        session_limit = None
+        if session_id is None:
+            session_id, session_limit = getattr(self._local, "session", None) or (current_session_id(), None)
+        # Includes the time spent waiting for a slot and in retries
+        with tracer.span(f"gemini.{getattr(fn, '__name__', 'call')}"):
+            future = asyncio.run_coroutine_threadsafe(
+                self.call_async(fn, *args, session_id=session_id, session_limit=session_limit, **kwargs), loop
+            )
+            return future.result()
+
+
+gemini_client = GeminiClient(
+    max_in_flight=int(os.environ.get("GEMINI_MAX_IN_FLIGHT", 8)),
+    per_session=int(os.environ.get("GEMINI_PER_SESSION", 2)),
+    timeout=float(os.environ.get("GEMINI_TIMEOUT", 60)),
+)
@@ -0,0 +1,54 @@
+import io
+import mimetypes
+
+from common.upload_cache import content_digest
+
+
+class ImageInput:
+    """
+    An uploaded or captured image held in memory.
+    Display, hashing and upload all read the same bytes; nothing is written to
+    disk unless save() is called explicitly.
+    """
+
+    def __init__(self, data, name, mime_type=None):
+        self.data = bytes(data)
+        self.name = name
+        self.mime_type = mime_type or mimetypes.guess_type(name)[0] or "application/octet-stream"
+        self._digest = None
+
+    @classmethod
+    def from_upload(cls, uploaded_file, name=None):
+        """
+        Wraps a Streamlit UploadedFile (from st.file_uploader or st.camera_input).
+        Args:
+            uploaded_file: The Streamlit upload
+            name (str): Overrides the uploaded file name
+        """
+        return cls(uploaded_file.getvalue(), name or uploaded_file.name, uploaded_file.type)
+
+    @property
+    def buffer(self):
+        """Read-only view of the image bytes."""
+        return memoryview(self.data)
+
+    @property
+    def digest(self):
+        """SHA-256 of the image bytes, computed once."""
+        if self._digest is None:
+            self._digest = content_digest(self.buffer)
+        return self._digest
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    def open(self):
+        """Returns a file-like object over the bytes (shares the buffer until written to)."""
+        return io.BytesIO(self.data)
+
+    def save(self, path):
+        """Writes the image to disk and returns the path."""
+        with open(path, "wb") as f:
+            f.write(self.buffer)
+        return path
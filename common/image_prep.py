@@ -0,0 +1,103 @@
+import io
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from common.image_input import ImageInput
+from common.tracing import tracer
+
+# How an image is prepared before upload.
+# max_side: longest side in pixels (None keeps the size), format: PIL format to
+# re-encode to, quality: encoder quality for lossy formats, strip_exif: drop metadata.
+PrepConfig = namedtuple(
+    "PrepConfig",
+    ["max_side", "format", "quality", "strip_exif"],
+    defaults=(1536, "JPEG", 85, True),
+)
+
+_EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp"}
+_MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+
+class PrepStats(namedtuple("PrepStats", ["original_bytes", "output_bytes", "seconds", "size"])):
+    """Outcome of preparing one image."""
+
+    @property
+    def bytes_saved(self):
+        return self.original_bytes - self.output_bytes
+
+    @property
+    def summary(self):
+        return (
+            f"Image prepared in {self.seconds * 1000:.0f} ms: "
+            f"{self.original_bytes / 1024:.0f} KB → {self.output_bytes / 1024:.0f} KB "
+            f"({self.size[0]}×{self.size[1]})"
+        )
+
+
+# Reruns prepare the same upload again, so keep the last few results
+_results = OrderedDict()
+_results_lock = threading.Lock()
+_MAX_RESULTS = 32
+
+
+def preprocess(image_input, config=PrepConfig()):
+    """
+    Downscales and re-encodes an image before it is uploaded.
+    Args:
+        image_input (ImageInput): The original image
+        config (PrepConfig): Preparation settings, None returns the image untouched
+    Returns:
+        (ImageInput, PrepStats): The prepared image and what it cost; the stats
+        are None when config is None
+    """
+    if config is None:
+        return image_input, None
+
+    key = (image_input.digest, config)
+    with _results_lock:
+        if key in _results:
+            _results.move_to_end(key)
+            return _results[key]
+
+    from PIL import Image, ImageOps
+
+    start = time.perf_counter()
+    with Image.open(image_input.open()) as original:
+        has_exif = bool(original.info.get("exif"))
+        # Apply the EXIF orientation to the pixels before the metadata is dropped
+        image = ImageOps.exif_transpose(original)
+        resized = False
+        if config.max_side and max(image.size) > config.max_side:
+            image.thumbnail((config.max_side, config.max_side), Image.LANCZOS)
+            resized = True
+        if config.format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        save_args = {"format": config.format, "optimize": True}
+        if config.format in ("JPEG", "WEBP"):
+            save_args["quality"] = config.quality
+        if not config.strip_exif and has_exif:
+            save_args["exif"] = original.info["exif"]
+
+        buffer = io.BytesIO()
+        image.save(buffer, **save_args)
+        size = image.size
+
+    stem = image_input.name.rsplit(".", 1)[0]
+    prepared = ImageInput(
+        buffer.getvalue(),
+        f"{stem}.{_EXTENSIONS.get(config.format, config.format.lower())}",
+        _MIME_TYPES.get(config.format),
+    )
+    # Re-encoding a small image can make it bigger; keep the original unless it had to change
+    if prepared.size >= image_input.size and not resized and not (config.strip_exif and has_exif):
+        prepared = image_input
+
+    stats = PrepStats(image_input.size, prepared.size, time.perf_counter() - start, size)
+    tracer.record("image.prep", stats.seconds, bytes_saved=stats.bytes_saved)
+    with _results_lock:
+        _results[key] = (prepared, stats)
+        while len(_results) > _MAX_RESULTS:
+            _results.popitem(last=False)
+    return prepared, stats
@@ -0,0 +1,28 @@
+import base64
+
+from streamlit import config, runtime
+
+from common.tracing import tracer
+
+
+def media_url(data, mime_type, key):
+    """
+    Serves bytes from Streamlit's media endpoint and returns their URL.
+    Files are content-addressed, so the same clip always gets the same URL and
+    the browser can cache it; the endpoint also answers range requests. A file
+    stays available while a session that registered it in its latest run is
+    alive, so call this on every rerun that renders the media.
+    Without a Streamlit runtime (bare mode) a data URI is returned instead.
+    Args:
+        data (bytes): File contents
+        mime_type (str): Mime type of the contents
+        key (str): Stable name for the file, e.g. its cache key
+    """
+    if not runtime.exists():
+        return f"data:{mime_type};base64,{base64.b64encode(data).decode('utf-8')}"
+
+    with tracer.span("media.register", bytes=len(data)):
+        url = runtime.get_instance().media_file_mgr.add(data, mime_type, f"media.{key}")
+    # Raw HTML does not go through the frontend's URL rewriting, so add the base path here
+    base_path = config.get_option("server.baseUrlPath").strip("/")
+    return f"/{base_path}{url}" if base_path else url
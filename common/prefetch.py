@@ -0,0 +1,213 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from common.description_cache import description_cache
+from common.gemini_client import gemini_client
+from common.services import strip_markdown
+from common.sessions import current_session_id
+from common.tracing import tracer
+from common.upload_cache import upload_cache
+
+logger = logging.getLogger(__name__)
+
+FOLLOW_UP_PROMPT = (
+    "Write the {count} questions a user is most likely to ask next about this image. "
+    "Keep each question short. Reply with one question per line and nothing else."
+)
+
+# Bullets and numbering the model may put in front of each question
+_LIST_MARKER = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+# A follow-up question whose answer is ready; index is its position in PrefetchJob.questions
+Suggestion = namedtuple("Suggestion", ["index", "question", "answer"])
+
+# Shared by every session; each session is further bounded by its own Gemini slot limit.
+# Each worker holds at most one Gemini slot, so capping the pool at half of them
+# keeps the other half for the users' own questions.
+_pool = ThreadPoolExecutor(
+    max_workers=max(1, min(int(os.environ.get("PREFETCH_WORKERS", 4)), gemini_client.max_in_flight // 2)),
+    thread_name_prefix="prefetch",
+)
+
+
+def _parse_questions(text):
+    """Returns the questions of a one-per-line reply, without list markers or duplicates."""
+    questions = []
+    for line in text.splitlines():
+        question = _LIST_MARKER.sub("", line).strip().strip('"')
+        if question and question not in questions:
+            questions.append(question)
+    return questions
+
+
+class PrefetchJob:
+    """
+    Follow-up questions about one image, answered in the background for the
+    next turn of one chat (see Prefetcher.start).
+    The job goes stale, and its answers are dropped, once it is cancelled or
+    the chat moves on; work still queued or not yet synthesized stops then,
+    or once the time budget is spent.
+    """
+
+    def __init__(self, prefetcher, chat, image_file, budget):
+        self.prefetcher = prefetcher
+        self.chat = chat
+        self.turn = chat.turns
+        self.image_uri = getattr(image_file, "uri", None)
+        self.deadline = time.monotonic() + budget
+        self.questions = []
+        self._answers = {}  # question index -> answer
+        self._futures = []
+        self._cancelled = False
+        self._lock = threading.Lock()
+
+    @property
+    def stale(self):
+        """True once cancelled or when the chat answered another turn, which the answers don't account for."""
+        return self._cancelled or self.chat.turns != self.turn
+
+    @property
+    def stopped(self):
+        """True once no new work should start: stale or past the time budget."""
+        return self.stale or time.monotonic() > self.deadline
+
+    @property
+    def done(self):
+        """True once no more suggestions will become ready."""
+        with self._lock:
+            return all(future.done() for future in self._futures)
+
+    def matches(self, chat, image_files):
+        """Whether the answers fit the next message of `chat` about exactly these images."""
+        return chat is self.chat and [getattr(file, "uri", None) for file in image_files] == [self.image_uri]
+
+    def submit(self, fn, *args):
+        """Runs fn(*args) on the shared pool, unless the job was cancelled."""
+        with self._lock:
+            if not self._cancelled:
+                self._futures.append(_pool.submit(fn, *args))
+
+    def add_answer(self, index, answer):
+        with self._lock:
+            self._answers[index] = answer
+        self.prefetcher.answered += 1
+
+    def ready(self):
+        """Suggestions whose answers are ready, in question order; none once stale."""
+        if self.stale:
+            return []
+        with self._lock:
+            answers = sorted(self._answers.items())
+        return [Suggestion(index, self.questions[index], answer) for index, answer in answers]
+
+    def take(self, index):
+        """Returns the suggestion the user picked and cancels the rest, since the chat moves on."""
+        with self._lock:
+            suggestion = Suggestion(index, self.questions[index], self._answers[index])
+        self.prefetcher.used += 1
+        self.cancel()
+        return suggestion
+
+    def cancel(self):
+        """Drops the answers and the work not started yet; calls already running finish in the background."""
+        with self._lock:
+            self._cancelled = True
+            for future in self._futures:
+                future.cancel()
+
+
+class Prefetcher:
+    """
+    Speculatively answers the questions a user is likely to ask next about an
+    image, while they read its description.
+    One Gemini call lists `count` likely follow-ups (cached per image like the
+    description), then each is answered as the chat's next turn and, for pages
+    that speak their answers, synthesized into the TTS cache, so picking one
+    shows and plays the answer without waiting. Jobs stop starting new work
+    after `budget` seconds.
+    Prefetch calls share the process-wide Gemini slots and the TTS service
+    with interactive calls, so on a busy server they can delay the users' own
+    questions. That is bounded, not prevented: jobs run on a worker pool
+    holding at most half of the Gemini slots, and each session's jobs hold at
+    most `per_session` of them under a fairness key separate from the user's.
+    It multiplies the Gemini and TTS calls per image, so it is off unless
+    `enabled`.
+    """
+
+    def __init__(self, per_session=2, budget=60.0, enabled=False):
+        self.per_session = per_session
+        self.budget = budget
+        self.enabled = enabled
+        self.answered = 0
+        self.used = 0
+
+    def start(self, model, chat, image_file, count=3, speak=True):
+        """
+        Starts prefetching the follow-ups to an image's description.
+        Args:
+            model: Gemini GenerativeModel
+            chat (BoundedChat): Chat the answers are for; they are taken as its next turn
+            image_file: Gemini file handle of the image
+            count (int): Number of follow-up questions
+            speak (bool): Also synthesize the answers
+        Returns:
+            PrefetchJob: The job, or None when prefetching is disabled
+        """
+        if not self.enabled or count <= 0:
+            return None
+        job = PrefetchJob(self, chat, image_file, self.budget)
+        # Taken now, on the script thread, so later turns cannot leak into the answers
+        answer = chat.speculate([image_file])
+        job.submit(self._ask, job, model, image_file, count, speak, answer, current_session_id())
+        return job
+
+    def _ask(self, job, model, image_file, count, speak, answer, session_id):
+        """Lists the follow-up questions and queues their answers."""
+        with gemini_client.session(f"{session_id}:prefetch", self.per_session), tracer.session(session_id):
+            if job.stopped:
+                return
+            prompt = FOLLOW_UP_PROMPT.format(count=count)
+            digest = upload_cache.digest_of(image_file)
+            try:
+                with tracer.span("prefetch.questions"):
+                    if digest is not None:
+                        text = description_cache.describe(model, image_file, digest, prompt)
+                    else:
+                        text = gemini_client.call(model.generate_content, [image_file, prompt]).text
+            except Exception:
+                logger.warning("Could not list follow-up questions", exc_info=True)
+                return
+        job.questions = _parse_questions(text)[:count]
+        for index, question in enumerate(job.questions):
+            job.submit(self._answer, job, index, question, answer, speak, session_id)
+
+    def _answer(self, job, index, question, answer, speak, session_id):
+        """Answers one follow-up question, then synthesizes the answer."""
+        from common.tts_cache import tts_cache
+
+        with gemini_client.session(f"{session_id}:prefetch", self.per_session), tracer.session(session_id):
+            if job.stopped:
+                return
+            try:
+                with tracer.span("prefetch.answer"):
+                    text = answer(question)
+                if speak and not job.stopped:
+                    # The same clip text_to_speech() plays, so it comes from the cache
+                    tts_cache.get_or_synthesize(strip_markdown(text), lang="en")
+            except Exception:
+                logger.warning("Could not prefetch the answer to %r", question, exc_info=True)
+                return
+        job.add_answer(index, text)
+
+
+# Off unless PREFETCH=1; pages then opt out with FOLLOW_UPS = 0
+prefetcher = Prefetcher(
+    per_session=int(os.environ.get("PREFETCH_PER_SESSION", 2)),
+    budget=float(os.environ.get("PREFETCH_BUDGET", 60)),
+    enabled=os.environ.get("PREFETCH") == "1",
+)
@@ -0,0 +1,255 @@
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict, namedtuple
+from types import SimpleNamespace
+
+from common.gemini_client import finish_reason
+
+# Filler that says little about what is being asked; it still counts in embeddings, with a low weight
+STOPWORDS = frozenset(
+    "a an the is are was were be this that these those it its of and "
+    "me you your my i we can could would please do does did".split()
+)
+STOPWORD_WEIGHT = 0.2
+# Words that flip or pick out what is asked; questions must have exactly the same ones (and numbers)
+NEGATIONS = frozenset("not no never nor none nothing nobody nowhere neither without".split())
+# Features are hashed into this many dimensions; vectors are sparse, so it costs nothing
+DIMENSIONS = 1 << 20
+
+_WORD = re.compile(r"[a-z0-9]+")
+_CONTRACTIONS = [
+    (re.compile(r"n't\b"), " not"),
+    (re.compile(r"\bcannot\b"), "can not"),
+    (re.compile(r"'s\b"), " is"),
+    (re.compile(r"'re\b"), " are"),
+]
+_NUMBER_WORDS = {
+    word: str(value)
+    for value, word in enumerate(
+        "zero one two three four five six seven eight nine ten eleven twelve thirteen fourteen fifteen "
+        "sixteen seventeen eighteen nineteen twenty".split()
+    )
+}
+_ORDINAL = re.compile(r"(\d+)(?:st|nd|rd|th)")
+
+# One cached answer; vector is the question's sparse embedding ({dimension: weight}),
+# content its words other than stopwords, in order
+CacheEntry = namedtuple("CacheEntry", ["bucket", "question", "vector", "content", "answer", "created_at"])
+
+
+def normalize(question):
+    """
+    Lower-cases a question, expands common contractions and returns its words,
+    with numbers written as digits ("three" and "3rd" become "3").
+    """
+    text = question.lower().replace("’", "'")
+    for pattern, replacement in _CONTRACTIONS:
+        text = pattern.sub(replacement, text)
+    words = [_NUMBER_WORDS.get(word, word) for word in _WORD.findall(text)]
+    return [_ORDINAL.sub(r"\1", word) for word in words]
+
+
+def _is_exact(word):
+    return word in NEGATIONS or any(char.isdigit() for char in word)
+
+
+def signature(words):
+    """
+    The parts of a normalized question that another must share to be the same
+    question, whatever their similarity.
+    Returns:
+        (tuple, tuple): Its numbers and negations, and its words other than
+        stopwords, both in order
+    """
+    return tuple(word for word in words if _is_exact(word)), tuple(word for word in words if word not in STOPWORDS)
+
+
+def _typo(a, b):
+    """Whether two words of 5+ letters differ by one inserted, deleted or swapped letter."""
+    if min(len(a), len(b)) < 5 or abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) == len(b):
+        diffs = [i for i in range(len(a)) if a[i] != b[i]]
+        if len(diffs) != 2 or diffs[1] != diffs[0] + 1:
+            return False
+        i = diffs[0]
+        return a[i] == b[i + 1] and a[i + 1] == b[i]
+    short, long = sorted((a, b), key=len)
+    return any(long[:i] + long[i + 1:] == short for i in range(len(long)))
+
+
+def same_content(a, b):
+    """Whether two content word sequences match word for word, up to typos (see _typo)."""
+    return len(a) == len(b) and all(x == y or _typo(x, y) for x, y in zip(a, b))
+
+
+def embed(question):
+    """
+    Embeds a question as a unit-length sparse vector of hashed features
+    (words, word pairs and character trigrams, which absorb small typos).
+    Returns:
+        dict: Dimension -> weight
+    """
+    words = normalize(question)
+    vector = {}
+
+    def add(feature, weight):
+        dimension = zlib.crc32(feature.encode("utf-8")) % DIMENSIONS
+        vector[dimension] = vector.get(dimension, 0.0) + weight
+
+    for index, word in enumerate(words):
+        weight = STOPWORD_WEIGHT if word in STOPWORDS else 1.0
+        add(f"w:{word}", weight)
+        if index:
+            add(f"b:{words[index - 1]} {word}", weight)
+        padded = f"#{word}#"
+        for start in range(len(padded) - 2):
+            add(f"c:{padded[start:start + 3]}", weight * 0.3)
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+    return {dimension: weight / norm for dimension, weight in vector.items()} if norm else {}
+
+
+def similarity(a, b):
+    """Cosine similarity of two unit-length sparse vectors."""
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(dimension, 0.0) for dimension, weight in a.items())
+
+
+class CachedResponse:
+    """Stands in for a Gemini response with a cached answer; iterating yields it as one chunk."""
+
+    usage_metadata = None
+    candidates = (SimpleNamespace(finish_reason="STOP"),)
+
+    def __init__(self, text):
+        self.text = text
+
+    def __iter__(self):
+        yield self
+
+    def resolve(self):
+        pass
+
+
+class RecordingResponse:
+    """
+    Passes a streamed response through and calls on_complete(text) once it was
+    read in full and the model finished normally: an answer cut short (SAFETY,
+    RECITATION, MAX_TOKENS) or broken off by an error is never passed on.
+    """
+
+    def __init__(self, response, on_complete):
+        self._response = response
+        self._on_complete = on_complete
+
+    def __iter__(self):
+        pieces = []
+        for chunk in self._response:
+            try:
+                pieces.append(chunk.text)
+            except ValueError:
+                # Chunks without text parts (e.g. the final metadata chunk)
+                pass
+            yield chunk
+        if finish_reason(self._response) == "STOP":
+            self._on_complete("".join(pieces))
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+class ResponseCache:
+    """
+    Answers repeated questions without calling the model.
+    Answers are grouped in buckets (in practice: model, image content hashes
+    and the conversation so far, see BoundedChat), and further by the numbers
+    and negations in the question, which must match exactly ("question 3" is
+    not "question 4", "why is" is not "why isn't"). Within a group, a question
+    gets a cached answer when both have the same words apart from filler
+    (STOPWORDS), in the same order and up to typos, and their embeddings have
+    at least `threshold` cosine similarity; so a one-word change like
+    "left"/"right" or "in"/"on" never hits, however long the question.
+    Entries expire after `ttl` seconds and the least recently used are evicted
+    past `max_entries`. Each group holds few questions, so it is scanned linearly.
+    """
+
+    def __init__(self, threshold=0.6, ttl=60 * 60, max_entries=2048, enabled=True):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # (bucket, question) -> CacheEntry, least recently used first
+        self._buckets = {}  # (bucket, numbers and negations) -> set of entry keys
+        self._lock = threading.Lock()
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def _drop(self, key):
+        """Removes an entry. Called with the lock held."""
+        entry = self._entries.pop(key)
+        keys = self._buckets[entry.bucket]
+        keys.discard(key)
+        if not keys:
+            del self._buckets[entry.bucket]
+
+    def get(self, bucket, question):
+        """
+        Returns the cached answer to the closest question in a bucket, or None
+        when no question is similar enough.
+        """
+        if not self.enabled:
+            return None
+        exact, content = signature(normalize(question))
+        vector = embed(question)
+        expired_before = time.time() - self.ttl
+        with self._lock:
+            best, best_score = None, self.threshold
+            for key in list(self._buckets.get((bucket, exact), ())):
+                entry = self._entries[key]
+                if entry.created_at < expired_before:
+                    self._drop(key)
+                    continue
+                score = similarity(vector, entry.vector)
+                if score >= best_score and same_content(content, entry.content):
+                    best, best_score = key, score
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best)
+            self.hits += 1
+            return self._entries[best].answer
+
+    def put(self, bucket, question, answer):
+        """Caches the answer to a question."""
+        if not self.enabled or not answer.strip():
+            return
+        words = normalize(question)
+        exact, content = signature(words)
+        group = (bucket, exact)
+        key = (bucket, " ".join(words))
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = CacheEntry(group, question, embed(question), content, answer, time.time())
+            self._buckets.setdefault(group, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+
+# Pages opt out with RESPONSE_CACHE = False
+response_cache = ResponseCache(
+    threshold=float(os.environ.get("RESPONSE_CACHE_THRESHOLD", 0.6)),
+    ttl=int(os.environ.get("RESPONSE_CACHE_TTL", 60 * 60)),
+    max_entries=int(os.environ.get("RESPONSE_CACHE_SIZE", 2048)),
+    enabled=os.environ.get("RESPONSE_CACHE", "1") != "0",
+)
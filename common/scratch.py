@@ -0,0 +1,162 @@
+import contextlib
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+from common.sessions import current_session_id
+
+# Exactly the names earlier versions of the pages wrote into the working directory and sometimes
+# never removed: gTTS clips, the fixed temp image names and save_file()'s "<uuid4>_<upload name>"
+LEGACY_PATTERNS = [
+    re.compile(r"audio_\d{8}_\d{6}\.mp3"),
+    re.compile(r"temp_(uploaded|captured)_image\.(jpg|jpeg|png)", re.IGNORECASE),
+    re.compile(
+        r"[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}_[^/\\]+\.(jpg|jpeg|png)", re.IGNORECASE
+    ),
+]
+
+
+class ScratchSpace:
+    """
+    Temporary files for the few places that need a real path.
+    Every file gets a unique name inside a per-session directory, so sessions
+    and concurrent calls never collide, and is deleted when its context manager
+    exits. A background sweeper removes what crashed sessions leave behind:
+    files older than `max_age`, then the oldest ones while the total is above
+    `max_bytes`. Prefer in-memory buffers; use this only when a library insists
+    on a file name.
+    With `legacy_dir`, the sweeper also removes the expired files older
+    versions of the pages left there (see LEGACY_PATTERNS); it is off by
+    default, since that directory may hold files this app never created.
+    """
+
+    def __init__(self, root, max_age=60 * 60, max_bytes=512 * 1024 * 1024, sweep_interval=5 * 60, legacy_dir=None):
+        self.root = root
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.legacy_dir = legacy_dir
+        self._in_use = set()
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._stopped = threading.Event()
+
+    def session_dir(self, session_id=None):
+        """Returns (and creates) the directory holding one session's files."""
+        path = os.path.join(self.root, session_id or current_session_id("shared"))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @contextlib.contextmanager
+    def path(self, suffix="", session_id=None):
+        """
+        Reserves a unique file path and deletes the file on exit.
+        Args:
+            suffix (str): File name suffix, e.g. ".png"
+            session_id (str): Owning session, defaults to the current one
+        """
+        with self._lock:
+            # Under the lock so the sweeper cannot remove the directory in between
+            path = os.path.join(self.session_dir(session_id), f"{uuid.uuid4().hex}{suffix}")
+            self._in_use.add(path)
+        try:
+            yield path
+        finally:
+            with self._lock:
+                self._in_use.discard(path)
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+    @contextlib.contextmanager
+    def file(self, data, suffix="", session_id=None):
+        """Writes bytes to a unique scratch file, yields its path and deletes it on exit."""
+        with self.path(suffix, session_id) as path:
+            with open(path, "wb") as f:
+                f.write(data)
+            yield path
+
+    def sweep(self, now=None):
+        """
+        Removes expired files, then the oldest ones until the total fits max_bytes.
+        Files held by an open context manager are never removed.
+        Returns:
+            tuple: (files removed, bytes removed)
+        """
+        now = now or time.time()
+        with self._lock:
+            in_use = set(self._in_use)
+
+        files = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                with contextlib.suppress(FileNotFoundError):
+                    stat = os.stat(path)
+                    files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+
+        removed, removed_bytes = 0, 0
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in files:
+            if path in in_use:
+                continue
+            if now - mtime < self.max_age and total <= self.max_bytes:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+                removed += 1
+                removed_bytes += size
+            total -= size
+
+        # Drop the directories of sessions that have no files left or reserved
+        with self._lock:
+            reserved = {os.path.dirname(path) for path in self._in_use}
+            for entry in os.scandir(self.root) if os.path.isdir(self.root) else ():
+                if entry.is_dir() and entry.path not in reserved:
+                    with contextlib.suppress(OSError):
+                        os.rmdir(entry.path)
+        return removed, removed_bytes
+
+    def sweep_legacy(self, directory, now=None):
+        """Removes expired files that older versions of the pages left in a directory."""
+        now = now or time.time()
+        removed = 0
+        for entry in os.scandir(directory):
+            if not entry.is_file() or not any(p.fullmatch(entry.name) for p in LEGACY_PATTERNS):
+                continue
+            if now - entry.stat().st_mtime >= self.max_age:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(entry.path)
+                    removed += 1
+        return removed
+
+    def _sweep_forever(self):
+        while not self._stopped.is_set():
+            with contextlib.suppress(OSError):
+                self.sweep()
+                if self.legacy_dir:
+                    self.sweep_legacy(self.legacy_dir)
+            self._stopped.wait(self.sweep_interval)
+
+    def start(self):
+        """Starts the background sweeper once per process; later calls are no-ops."""
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep_forever, name="scratch-sweeper", daemon=True)
+                self._sweeper.start()
+
+    def stop(self):
+        """Stops the background sweeper."""
+        self._stopped.set()
+
+
+scratch = ScratchSpace(
+    root=os.environ.get("SCRATCH_DIR") or os.path.join(tempfile.gettempdir(), "gemini-chat-scratch"),
+    max_age=int(os.environ.get("SCRATCH_MAX_AGE", 60 * 60)),
+    max_bytes=int(os.environ.get("SCRATCH_MAX_BYTES", 512 * 1024 * 1024)),
+    # Opt-in: the directory the old pages ran in, usually the server's working directory
+    legacy_dir=os.environ.get("SCRATCH_LEGACY_DIR") or None,
+)
@@ -0,0 +1,200 @@
+"""
+Services shared by the pages: the Gemini model, Markdown stripping, audio
+replies, image uploads, voice input, saved conversations and prefetched
+follow-up questions.
+Heavy optional dependencies (gTTS, PIL, numpy, streamlit_webrtc, av, speech
+engines) are imported inside the functions that need them, so a text-only
+page never loads them.
+"""
+import os
+import re
+
+import streamlit as st
+
+# Markdown emphasis and code markers, which speech engines would read out
+_MARKDOWN = re.compile(r"[*_`~]")
+
+
+@st.cache_resource
+def get_model(model_name="gemini-1.5-flash"):
+    """
+    Returns the process-wide Gemini model, configuring the SDK on first use.
+    The API key comes from the GOOGLE_API_KEY environment variable.
+    """
+    import google.generativeai as genai
+
+    genai.configure(api_key=os.environ.get("GOOGLE_API_KEY", ""))
+    return genai.GenerativeModel(model_name)
+
+
+def strip_markdown(text):
+    """Removes Markdown syntax, leaving plain text."""
+    return _MARKDOWN.sub("", text)
+
+
+def text_to_speech(text, autoplay=True):
+    """
+    Converts text to speech and displays an audio player.
+    Args:
+        text (str): Text to convert to speech, Markdown is stripped
+        autoplay (bool): Whether to autoplay the audio
+    """
+    from common.tts_cache import tts_cache
+
+    # Reuse the clip if this text was already synthesized
+    clip = tts_cache.get_or_synthesize(strip_markdown(text), lang="en")
+    # Served from the media endpoint, so reruns only resend the URL
+    st.audio(clip.audio_bytes, format=clip.mime_type, autoplay=autoplay)
+
+
+def speak(text):
+    """Speaks a new answer sentence by sentence so playback starts right away."""
+    from common.tts_stream import stream_text_to_speech
+
+    return stream_text_to_speech(strip_markdown(text))
+
+
+def upload_image_to_gemini(image_input):
+    """Uploads an ImageInput to the Gemini File API; identical images are only uploaded once per process."""
+    from common.upload_cache import upload_cache
+
+    return upload_cache.upload_image(image_input)
+
+
+def resume_conversation(model, cache_responses=False):
+    """
+    Picks up this tab's saved conversation (see current_conversation) on the
+    first run of a session, without calling the model: the latest messages are
+    loaded (older ones page in when shown), the chat gets its summary and last
+    turns back, and the image's Gemini file and description go back into the
+    caches, so the same image is neither uploaded nor described again.
+    Args:
+        model: Gemini GenerativeModel
+        cache_responses (bool): Answer repeated questions from the shared response cache
+    Returns:
+        (Conversation, Transcript, BoundedChat): The saved conversation (None for
+        a new one), the page history and a chat that continues it; both keep saving
+    """
+    from common.chat_context import BoundedChat
+    from common.conversation_store import conversation_store, current_conversation
+    from common.description_cache import description_cache
+    from common.session_store import session_store
+    from common.upload_cache import upload_cache
+
+    conversation_id = current_conversation()
+    saved = conversation_store.load(conversation_id)
+    log = conversation_store.log(conversation_id, saved.turns if saved else 0)
+    history = session_store.transcript(log=log)
+    chat = BoundedChat(model, log=log, response_cache=_response_cache(cache_responses))
+    if saved:
+        chat.restore(saved.summary, history[-chat.keep_turns * 4:])
+        if saved.image_file is not None:
+            upload_cache.put(saved.image_digest, saved.image_file)
+        if saved.description:
+            description_cache.put(saved.image_digest, saved.model, saved.description)
+    return saved, history, chat
+
+
+def new_conversation(model, cache_responses=False):
+    """
+    Starts this tab's saved conversation over, e.g. for a new image.
+    Args:
+        model: Gemini GenerativeModel
+        cache_responses (bool): Answer repeated questions from the shared response cache
+    Returns:
+        (Transcript, BoundedChat): An empty page history and chat that save into it
+    """
+    from common.chat_context import BoundedChat
+    from common.conversation_store import conversation_store, current_conversation
+    from common.session_store import session_store
+
+    conversation_id = current_conversation()
+    conversation_store.reset(conversation_id)
+    log = conversation_store.log(conversation_id)
+    chat = BoundedChat(model, log=log, response_cache=_response_cache(cache_responses))
+    return session_store.transcript(log=log), chat
+
+
+def _response_cache(enabled):
+    """The shared response cache when a page opts in, else None."""
+    if not enabled:
+        return None
+    from common.response_cache import response_cache
+
+    return response_cache
+
+
+def save_image(model, image_input, image_file, description):
+    """Records the conversation's image (content hash, Gemini file and description) for resuming."""
+    from common.conversation_store import conversation_store, current_conversation
+
+    conversation_store.save_image(
+        current_conversation(), image_input.digest, image_file, model.model_name, description
+    )
+
+
+def prefetch_follow_ups(model, chat, image_file, count=3, speak=True):
+    """
+    Starts answering the likely follow-up questions about an image in the
+    background (see Prefetcher), replacing this session's previous job;
+    follow_up_suggestions() shows them. Does nothing unless the server runs
+    with PREFETCH=1.
+    Args:
+        model: Gemini GenerativeModel
+        chat (BoundedChat): Chat whose next turn the answers are for
+        image_file: Gemini file handle of the image
+        count (int): Number of follow-up questions, 0 prefetches nothing
+        speak (bool): Also synthesize the answers, for pages that read them out
+    """
+    from common.prefetch import prefetcher
+
+    previous = st.session_state.get("prefetch")
+    if previous is not None:
+        previous.cancel()
+    st.session_state.prefetch = prefetcher.start(model, chat, image_file, count, speak)
+
+
+def follow_up_suggestions(chat, image_files):
+    """
+    Shows the follow-up questions prefetched for the next message of `chat`
+    about `image_files` as one-click suggestions.
+    Returns:
+        Suggestion: The question the user picked, with its answer, or None
+    """
+    from common.chat_view import render_suggestions
+
+    job = st.session_state.get("prefetch")
+    if job is not None and not job.matches(chat, image_files):
+        job = None
+    return render_suggestions(job)
+
+
+def voice_input(key, **webrtc_kwargs):
+    """
+    Renders a microphone streamer and returns the transcripts finished since
+    the last rerun. The session's VoicePipeline is created on first use and
+    kept in st.session_state, so utterances survive reruns.
+    Args:
+        key (str): Widget key of the streamer
+        **webrtc_kwargs: Extra arguments for webrtc_streamer (e.g. rtc_configuration)
+    """
+    from streamlit_webrtc import WebRtcMode, webrtc_streamer
+
+    from common.voice_pipeline import VoicePipeline
+
+    if "voice_pipeline" not in st.session_state:
+        st.session_state.voice_pipeline = VoicePipeline()
+    pipeline = st.session_state.voice_pipeline
+    webrtc_ctx = webrtc_streamer(
+        key=key,
+        mode=WebRtcMode.SENDRECV,
+        audio_processor_factory=pipeline.audio_processor,
+        media_stream_constraints={"video": False, "audio": True},
+        **webrtc_kwargs,
+    )
+
+    if webrtc_ctx.state.playing:
+        pipeline.start()
+    else:
+        pipeline.stop()
+    return pipeline.poll()
@@ -0,0 +1,227 @@
+import array
+import contextlib
+import os
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+
+from common.sessions import current_session_id
+
+# Speakers a transcript can hold, stored as their index (one byte per message)
+SPEAKERS = ("user", "assistant")
+
+
+def _remove(path):
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+
+
+class Transcript:
+    """
+    Compact chat history of one session, used like a list of (speaker, text) pairs.
+    All texts live in one UTF-8 buffer indexed by an array of offsets, with one
+    byte per speaker, instead of a tuple and a str object per message. The
+    oldest messages can be moved to a file (see SessionStore.enforce); reading
+    those goes to disk, while appending and the recent messages never do.
+    The file is deleted when the transcript is garbage collected.
+    With a ConversationLog, new messages are also saved to it, and the
+    messages it already holds are resumed: the last page is loaded right away,
+    older pages only when they are read.
+    """
+
+    __slots__ = (
+        "session_id", "path", "last_access", "_store", "_log", "_older", "_page", "_speakers", "_offsets",
+        "_buffer", "_archived", "_lock", "__weakref__",
+    )
+
+    def __init__(self, session_id, path, store=None, log=None):
+        self.session_id = session_id
+        self.path = path
+        self.last_access = time.monotonic()
+        self._store = store
+        self._log = log
+        # Messages [0, _older) were resumed from the log and are read from it a page at a time
+        self._older = 0
+        self._page = (0, [])  # (first index, messages) of the last page read from the log
+        self._speakers = array.array("B")
+        # Message i spans bytes offsets[i]:offsets[i + 1] of the whole transcript
+        self._offsets = array.array("Q", [0])
+        # Bytes of the messages from _archived on; the earlier ones are in the file
+        self._buffer = bytearray()
+        self._archived = 0
+        self._lock = threading.Lock()
+        weakref.finalize(self, _remove, path)
+        if log is not None and log.turns:
+            self._older = max(0, log.turns - log.page_size)
+            for speaker, text in log.load(self._older, log.turns - self._older):
+                self._add(speaker, text)
+
+    def __len__(self):
+        return self._older + len(self._speakers)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("transcript index out of range")
+        if index < self._older:
+            return self._read_older(index)
+        index -= self._older
+        with self._lock:
+            self.last_access = time.monotonic()
+            start, end = self._offsets[index], self._offsets[index + 1]
+            if index >= self._archived:
+                base = self._offsets[self._archived]
+                data = self._buffer[start - base:end - base]
+            else:
+                with open(self.path, "rb") as f:
+                    f.seek(start)
+                    data = f.read(end - start)
+            speaker = SPEAKERS[self._speakers[index]]
+        return speaker, data.decode("utf-8")
+
+    def _read_older(self, index):
+        """Reads a resumed message, loading the page it is on from the log."""
+        self.last_access = time.monotonic()
+        start, messages = self._page
+        if not start <= index < start + len(messages):
+            start = index - index % self._log.page_size
+            messages = self._log.load(start, min(self._log.page_size, self._older - start))
+            self._page = (start, messages)
+        return tuple(messages[index - start])
+
+    def _add(self, speaker, text):
+        data = text.encode("utf-8")
+        with self._lock:
+            self._speakers.append(SPEAKERS.index(speaker))
+            self._buffer += data
+            self._offsets.append(self._offsets[-1] + len(data))
+            self.last_access = time.monotonic()
+
+    def append(self, message):
+        """Adds a (speaker, text) message, saves it to the log, then applies the store's budgets."""
+        speaker, text = message
+        position = len(self)
+        self._add(speaker, text)
+        if self._log is not None:
+            self._log.append(position, speaker, text)
+        if self._store is not None:
+            self._store.enforce(self)
+
+    @property
+    def memory_bytes(self):
+        """Bytes kept in memory: recent texts, offsets and speakers."""
+        return len(self._buffer) + self._offsets.itemsize * len(self._offsets) + len(self._speakers)
+
+    @property
+    def disk_bytes(self):
+        """Bytes of the messages moved to disk."""
+        return self._offsets[self._archived]
+
+    def spill(self, keep_bytes=0):
+        """
+        Moves the oldest in-memory messages to disk until the texts left in
+        memory take at most `keep_bytes`.
+        Returns:
+            int: Bytes freed
+        """
+        with self._lock:
+            end = self._offsets[-1]
+            count = self._archived
+            while count < len(self._speakers) and end - self._offsets[count] > keep_bytes:
+                count += 1
+            if count == self._archived:
+                return 0
+            cut = self._offsets[count] - self._offsets[self._archived]
+            with open(self.path, "ab") as f:
+                f.write(self._buffer[:cut])
+            del self._buffer[:cut]
+            self._archived = count
+        return cut
+
+
+class SessionStore:
+    """
+    Keeps the chat transcripts of every session within memory budgets.
+    - a session whose transcript takes more than `session_budget` bytes has
+      its oldest messages moved to disk, keeping about half the budget of
+      recent ones in memory;
+    - when all transcripts together take more than `global_budget` bytes,
+      or a session has been idle for `max_idle` seconds, whole sessions are
+      spilled to disk, the least recently used first.
+    Spilled messages stay readable, so pages can still page through old history.
+    """
+
+    def __init__(self, spill_dir, session_budget=512 * 1024, global_budget=128 * 1024 * 1024, max_idle=30 * 60):
+        self.spill_dir = spill_dir
+        self.session_budget = session_budget
+        self.global_budget = global_budget
+        self.max_idle = max_idle
+        self.spills = 0
+        self._transcripts = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def transcript(self, session_id=None, log=None):
+        """
+        Returns a new transcript owned by a session (the current one by default).
+        Args:
+            session_id (str): Owning session
+            log (ConversationLog): Where messages are saved; the messages it already
+                holds are resumed, otherwise the transcript starts empty
+        """
+        session_id = session_id or current_session_id("shared")
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, f"{session_id}-{uuid.uuid4().hex}.transcript")
+        transcript = Transcript(session_id, path, self, log)
+        with self._lock:
+            self._transcripts[path] = transcript
+        return transcript
+
+    def enforce(self, transcript):
+        """Applies the budgets after `transcript` grew."""
+        if transcript.memory_bytes > self.session_budget and transcript.spill(self.session_budget // 2):
+            self.spills += 1
+
+        with self._lock:
+            transcripts = list(self._transcripts.values())
+        total = sum(other.memory_bytes for other in transcripts)
+        idle_since = time.monotonic() - self.max_idle
+        for other in sorted(transcripts, key=lambda other: other.last_access):
+            if other is transcript or (total <= self.global_budget and other.last_access > idle_since):
+                continue
+            freed = other.spill()
+            if freed:
+                total -= freed
+                self.spills += 1
+
+    def usage(self):
+        """
+        Memory use per session.
+        Returns:
+            dict: Session id -> {"messages", "memory_bytes", "disk_bytes"}
+        """
+        with self._lock:
+            transcripts = list(self._transcripts.values())
+        sessions = {}
+        for transcript in transcripts:
+            usage = sessions.setdefault(transcript.session_id, {"messages": 0, "memory_bytes": 0, "disk_bytes": 0})
+            usage["messages"] += len(transcript)
+            usage["memory_bytes"] += transcript.memory_bytes
+            usage["disk_bytes"] += transcript.disk_bytes
+        return sessions
+
+
+session_store = SessionStore(
+    spill_dir=os.environ.get("SESSION_SPILL_DIR") or os.path.join(tempfile.gettempdir(), "gemini-chat-sessions"),
+    session_budget=int(os.environ.get("SESSION_BUDGET", 512 * 1024)),
+    global_budget=int(os.environ.get("SESSION_GLOBAL_BUDGET", 128 * 1024 * 1024)),
+    max_idle=int(os.environ.get("SESSION_MAX_IDLE", 30 * 60)),
+)
@@ -0,0 +1,11 @@
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+
+def current_session_id(default=None):
+    """
+    Returns the id of the Streamlit session whose script runs on this thread.
+    Args:
+        default: Returned outside a script run (worker threads, tests)
+    """
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else default
@@ -0,0 +1,108 @@
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class STTBackend:
+    """
+    Speech-to-text engine used by the voice input path.
+    Subclasses implement transcribe(); they must be safe to call from several
+    worker threads at once.
+    """
+
+    name = None
+
+    def transcribe(self, samples, sample_rate):
+        """
+        Transcribes one utterance.
+        Args:
+            samples (np.ndarray): Mono int16 samples
+            sample_rate (int): Sample rate of the samples
+        Returns:
+            str or None: The text, or None when nothing was understood
+        """
+        raise NotImplementedError
+
+
+class GoogleSTT(STTBackend):
+    """Google Web Speech API through speech_recognition (needs the network)."""
+
+    name = "google"
+
+    def __init__(self, language="en-US"):
+        import speech_recognition as sr
+
+        self._sr = sr
+        self.language = language
+
+    def transcribe(self, samples, sample_rate):
+        sr = self._sr
+        audio = sr.AudioData(samples.tobytes(), sample_rate=sample_rate, sample_width=2)
+        try:
+            return sr.Recognizer().recognize_google(audio, language=self.language) or None
+        except sr.UnknownValueError:
+            return None
+
+
+class VoskSTT(STTBackend):
+    """
+    Offline recognition on the CPU with a Vosk (Kaldi) model.
+    The model directory comes from VOSK_MODEL_PATH; small English models such as
+    vosk-model-small-en-us-0.15 (~40 MB) run faster than real time on one core.
+    """
+
+    name = "vosk"
+
+    def __init__(self, model_path=None):
+        import vosk
+
+        vosk.SetLogLevel(-1)
+        self._vosk = vosk
+        # The model is read-only once loaded and shared by all recognizers
+        self.model = vosk.Model(model_path or os.environ["VOSK_MODEL_PATH"])
+
+    def transcribe(self, samples, sample_rate):
+        recognizer = self._vosk.KaldiRecognizer(self.model, sample_rate)
+        recognizer.AcceptWaveform(samples.tobytes())
+        return json.loads(recognizer.FinalResult()).get("text") or None
+
+
+BACKENDS = {backend.name: backend for backend in (GoogleSTT, VoskSTT)}
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_backend(name=None):
+    """
+    Returns the shared instance of a backend, loading it on first use.
+    A local engine that cannot be loaded (missing package or model) falls back
+    to Google.
+    Args:
+        name (str): Backend name, defaults to the STT_BACKEND environment variable
+            ("google" when unset)
+    """
+    name = name or os.environ.get("STT_BACKEND", "google")
+    with _instances_lock:
+        if name not in _instances:
+            try:
+                _instances[name] = BACKENDS[name]()
+            except Exception as e:
+                # Vosk raises a bare Exception when the model directory is not a model
+                if name == GoogleSTT.name:
+                    raise
+                logger.warning("STT backend %r unavailable (%s), falling back to Google", name, e)
+                _instances[name] = _instances.get(GoogleSTT.name) or GoogleSTT()
+                _instances[GoogleSTT.name] = _instances[name]
+        return _instances[name]
+
+
+# Recognition runs here, off the WebRTC media thread; the size bounds CPU use of local engines
+transcription_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("STT_WORKERS", 2)),
+    thread_name_prefix="stt",
+)
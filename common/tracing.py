@@ -0,0 +1,186 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+
+import streamlit as st
+
+from common.sessions import current_session_id
+
+# One timed stage: when it started (epoch seconds), how long it took and free-form attributes
+Span = namedtuple("Span", ["name", "session_id", "started_at", "duration", "attrs"])
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    return sorted(values)[int(fraction * (len(values) - 1))]
+
+
+class OpenSpan:
+    """A span started with Tracer.begin(); end() records it."""
+
+    def __init__(self, tracer, name, session_id, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.session_id = session_id
+        self.attrs = attrs
+        self.started_at = time.time()
+        # time.perf_counter() value at the start
+        self.start_time = time.perf_counter()
+
+    def end(self, **attrs):
+        self.attrs.update(attrs)
+        duration = time.perf_counter() - self.start_time
+        self.tracer.add(Span(self.name, self.session_id, self.started_at, duration, self.attrs))
+        return duration
+
+
+class Tracer:
+    """
+    Records how long each stage of a turn takes (uploads, model calls,
+    synthesis, rendering, ...), per session.
+    Each session keeps its latest `max_spans` spans in a ring buffer; the
+    `max_sessions` most recently active sessions are kept. Spans from worker
+    threads are attributed to the session set with session(), or to the
+    Streamlit session of the calling script thread.
+    """
+
+    def __init__(self, max_spans=500, max_sessions=256, enabled=True):
+        self.max_spans = max_spans
+        self.max_sessions = max_sessions
+        self.enabled = enabled
+        self._sessions = OrderedDict()  # session id -> deque of spans
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def current_session(self):
+        """The session spans on this thread are attributed to, or None."""
+        return getattr(self._local, "session_id", None) or current_session_id()
+
+    @contextlib.contextmanager
+    def session(self, session_id):
+        """Attributes spans recorded on this thread to `session_id` (for worker threads)."""
+        previous = getattr(self._local, "session_id", None)
+        self._local.session_id = session_id
+        try:
+            yield
+        finally:
+            self._local.session_id = previous
+
+    def add(self, span):
+        """Stores a finished span in its session's ring buffer."""
+        if not self.enabled:
+            return
+        with self._lock:
+            spans = self._sessions.get(span.session_id)
+            if spans is None:
+                spans = self._sessions[span.session_id] = deque(maxlen=self.max_spans)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(span.session_id)
+            spans.append(span)
+
+    def begin(self, name, **attrs):
+        """Starts a span that is recorded when its end() is called."""
+        return OpenSpan(self, name, self.current_session(), attrs)
+
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        """
+        Times the body of a with block; the yielded dict can take extra attributes.
+        The span is recorded even when the body raises.
+        """
+        open_span = self.begin(name, **attrs)
+        try:
+            yield open_span.attrs
+        except BaseException as e:
+            open_span.end(error=type(e).__name__)
+            raise
+        open_span.end()
+
+    def record(self, name, duration, **attrs):
+        """Records a stage that was timed elsewhere."""
+        self.add(Span(name, self.current_session(), time.time() - duration, duration, attrs))
+
+    def spans(self, session_id=None):
+        """Returns the buffered spans of a session, oldest first."""
+        with self._lock:
+            return list(self._sessions.get(session_id or self.current_session(), ()))
+
+    def summary(self, session_id=None):
+        """
+        Aggregates a session's spans per stage.
+        Returns:
+            list: One dict per stage with count, p50 and p95 in milliseconds
+        """
+        durations = {}
+        for span in self.spans(session_id):
+            durations.setdefault(span.name, []).append(span.duration * 1000)
+        return [
+            {
+                "stage": name,
+                "count": len(values),
+                "p50 ms": round(percentile(values, 0.5), 1),
+                "p95 ms": round(percentile(values, 0.95), 1),
+            }
+            for name, values in sorted(durations.items())
+        ]
+
+    def export_jsonl(self, session_id=None):
+        """Returns a session's spans as JSON lines."""
+        return "".join(
+            json.dumps({
+                "ts": round(span.started_at, 3),
+                "session": span.session_id,
+                "span": span.name,
+                "ms": round(span.duration * 1000, 3),
+                **span.attrs,
+            }, default=str) + "\n"
+            for span in self.spans(session_id)
+        )
+
+
+def render_panel(run_span=None):
+    """
+    Ends the span of the current script run and shows the optional latency
+    panel in the sidebar, with the session's chat history memory use, the
+    response cache hit rate and how many prefetched answers were used. Call it
+    at the very end of a page.
+    """
+    from common.prefetch import prefetcher
+    from common.response_cache import response_cache
+    from common.session_store import session_store
+
+    if run_span is not None:
+        run_span.end()
+    if not st.sidebar.toggle("Latency panel", key="trace_panel"):
+        return
+    st.sidebar.dataframe(tracer.summary(), hide_index=True)
+    usage = session_store.usage().get(tracer.current_session())
+    if usage:
+        st.sidebar.caption(
+            f"Chat history: {usage['messages']} messages, "
+            f"{usage['memory_bytes'] / 1024:.1f} KB in memory, {usage['disk_bytes'] / 1024:.1f} KB on disk"
+        )
+    if response_cache.hits + response_cache.misses:
+        st.sidebar.caption(
+            f"Response cache: {response_cache.hits} of {response_cache.hits + response_cache.misses} "
+            f"questions answered from the cache ({response_cache.hit_rate:.0%})"
+        )
+    if prefetcher.answered:
+        st.sidebar.caption(f"Prefetch: {prefetcher.used} of {prefetcher.answered} prepared answers used")
+    st.sidebar.download_button(
+        "Export spans (JSON lines)",
+        tracer.export_jsonl(),
+        file_name="spans.jsonl",
+        mime="application/x-ndjson",
+    )
+
+
+tracer = Tracer(
+    max_spans=int(os.environ.get("TRACE_MAX_SPANS", 500)),
+    enabled=os.environ.get("TRACE_ENABLED", "1") != "0",
+)
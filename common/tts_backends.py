@@ -0,0 +1,152 @@
+import io
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import wave
+
+logger = logging.getLogger(__name__)
+
+
+class TTSBackend:
+    """
+    Text-to-speech engine used by the audio replies.
+    Subclasses implement synthesize(); they must be safe to call from several
+    worker threads at once.
+    """
+
+    name = None
+    mime_type = "audio/mpeg"
+    extension = "mp3"
+
+    def synthesize(self, text, lang="en", voice="com"):
+        """
+        Synthesizes one piece of plain text in memory.
+        Args:
+            text (str): Plain text (already stripped of Markdown)
+            lang (str): Language code
+            voice (str): Engine-specific voice or accent; engines may ignore it
+        Returns:
+            bytes: Encoded audio in this backend's mime_type
+        """
+        raise NotImplementedError
+
+    def join(self, parts):
+        """Concatenates clips synthesized by this backend into one clip."""
+        # MP3 frames can be concatenated as-is, which is also how gTTS joins its own parts
+        return b"".join(parts)
+
+
+class GTTSBackend(TTSBackend):
+    """Google Translate's TTS through gTTS (needs the network)."""
+
+    name = "gtts"
+
+    def __init__(self):
+        from gtts import gTTS
+
+        self._gtts = gTTS
+
+    def synthesize(self, text, lang="en", voice="com"):
+        buffer = io.BytesIO()
+        # voice is the top-level domain, which selects the accent
+        self._gtts(text=text, lang=lang, tld=voice).write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+class WavBackend(TTSBackend):
+    """Base for local engines that produce 16-bit PCM WAV."""
+
+    mime_type = "audio/wav"
+    extension = "wav"
+
+    def join(self, parts):
+        if len(parts) == 1:
+            return parts[0]
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as output:
+            for index, part in enumerate(parts):
+                with wave.open(io.BytesIO(part), "rb") as clip:
+                    if index == 0:
+                        output.setparams(clip.getparams())
+                    output.writeframes(clip.readframes(clip.getnframes()))
+        return buffer.getvalue()
+
+
+class EspeakTTS(WavBackend):
+    """
+    Offline formant synthesis with espeak-ng (or espeak) on the CPU.
+    Robotic but very fast, and only needs the system package.
+    """
+
+    name = "espeak"
+
+    def __init__(self, executable=None, words_per_minute=None):
+        self.executable = executable or shutil.which("espeak-ng") or shutil.which("espeak")
+        if not self.executable:
+            raise RuntimeError("espeak-ng is not installed")
+        self.words_per_minute = int(words_per_minute or os.environ.get("ESPEAK_WPM", 175))
+
+    def synthesize(self, text, lang="en", voice="com"):
+        # Text goes through stdin so it is never parsed as an option
+        result = subprocess.run(
+            [self.executable, "--stdout", "--stdin", "-v", lang, "-s", str(self.words_per_minute)],
+            input=text.encode("utf-8"),
+            capture_output=True,
+            check=True,
+        )
+        return result.stdout
+
+
+class PiperTTS(WavBackend):
+    """
+    Offline neural synthesis on the CPU with a Piper (VITS/ONNX) voice.
+    The voice model comes from PIPER_MODEL_PATH (the .onnx file, with its
+    .onnx.json config next to it); it fixes the language, so lang is ignored.
+    """
+
+    name = "piper"
+
+    def __init__(self, model_path=None):
+        from piper import PiperVoice
+
+        # The voice is read-only once loaded and shared by all threads
+        self.voice = PiperVoice.load(model_path or os.environ["PIPER_MODEL_PATH"])
+
+    def synthesize(self, text, lang="en", voice="com"):
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as output:
+            # piper-tts >= 1.3 renamed synthesize() to synthesize_wav()
+            write = getattr(self.voice, "synthesize_wav", None) or self.voice.synthesize
+            write(text, output)
+        return buffer.getvalue()
+
+
+BACKENDS = {backend.name: backend for backend in (GTTSBackend, EspeakTTS, PiperTTS)}
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_backend(name=None):
+    """
+    Returns the shared instance of a backend, loading it on first use.
+    A local engine that cannot be loaded (missing binary, package or model)
+    falls back to gTTS.
+    Args:
+        name (str): Backend name, defaults to the TTS_BACKEND environment variable
+            ("gtts" when unset)
+    """
+    name = name or os.environ.get("TTS_BACKEND", "gtts")
+    with _instances_lock:
+        if name not in _instances:
+            try:
+                _instances[name] = BACKENDS[name]()
+            except (ImportError, KeyError, OSError, RuntimeError) as e:
+                if name == GTTSBackend.name:
+                    raise
+                logger.warning("TTS backend %r unavailable (%s), falling back to gTTS", name, e)
+                _instances[name] = _instances.get(GTTSBackend.name) or GTTSBackend()
+                _instances[GTTSBackend.name] = _instances[name]
+        return _instances[name]
@@ -0,0 +1,147 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+from common.tracing import tracer
+from common.tts_backends import get_backend
+
+# One synthesized clip: the audio bytes and their mime type
+AudioClip = namedtuple("AudioClip", ["key", "audio_bytes", "mime_type"])
+
+# Disk tier file extensions and the mime type they hold
+_EXTENSIONS = {"mp3": "audio/mpeg", "wav": "audio/wav"}
+
+
+def cache_key(text, lang="en", voice="com", engine="gtts"):
+    """
+    Builds the content-addressed key for a piece of speech.
+    Args:
+        text (str): Plain text that will be spoken
+        lang (str): Language code
+        voice (str): Voice or accent (the gTTS top-level domain for gTTS)
+        engine (str): Name of the TTS backend, since engines sound different
+    """
+    payload = "\0".join([text.strip(), lang, voice, engine])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """
+    Two-tier cache of synthesized speech.
+    The memory tier is an LRU bounded by the total size of the cached clips,
+    the optional disk tier keeps audio files named after their key so clips
+    survive restarts.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._clips = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key, mime_type):
+        extension = next(ext for ext, mime in _EXTENSIONS.items() if mime == mime_type)
+        return os.path.join(self.disk_dir, f"{key}.{extension}")
+
+    def _remember(self, clip):
+        """Adds a clip to the memory tier, evicting the oldest ones past the budget."""
+        with self._lock:
+            if clip.key in self._clips:
+                self._clips.move_to_end(clip.key)
+                return
+            self._clips[clip.key] = clip
+            self._size += len(clip.audio_bytes)
+            while self._size > self.max_bytes and len(self._clips) > 1:
+                _, old = self._clips.popitem(last=False)
+                self._size -= len(old.audio_bytes)
+
+    def get(self, key):
+        """Returns the cached clip for a key, or None."""
+        with self._lock:
+            clip = self._clips.get(key)
+            if clip is not None:
+                self._clips.move_to_end(key)
+                self.hits += 1
+                return clip
+
+        if not self.disk_dir:
+            return None
+        for mime_type in _EXTENSIONS.values():
+            path = self._disk_path(key, mime_type)
+            if os.path.exists(path):
+                with open(path, "rb") as audio_file:
+                    audio_bytes = audio_file.read()
+                clip = AudioClip(key, audio_bytes, mime_type)
+                self._remember(clip)
+                with self._lock:
+                    self.disk_hits += 1
+                return clip
+        return None
+
+    def put(self, key, audio_bytes, mime_type="audio/mpeg"):
+        """Stores audio bytes under a key and returns the resulting clip."""
+        clip = AudioClip(key, audio_bytes, mime_type)
+        self._remember(clip)
+        if self.disk_dir:
+            # Write under a temporary name first so readers never see half a file
+            path = self._disk_path(key, mime_type)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as audio_file:
+                audio_file.write(audio_bytes)
+            os.replace(tmp_path, path)
+        return clip
+
+    def get_or_synthesize(self, text, lang="en", voice="com", backend=None):
+        """
+        Returns the clip for some text, synthesizing it only on a cache miss.
+        Args:
+            text (str): Plain text (already stripped of Markdown)
+            lang (str): Language code passed to the synthesizer
+            voice (str): Voice or accent passed to the synthesizer
+            backend (TTSBackend): Engine used on a miss, defaults to get_backend()
+        """
+        backend = backend or get_backend()
+        key = cache_key(text, lang, voice, backend.name)
+        clip = self.get(key)
+        if clip is not None:
+            return clip
+
+        # Only one thread synthesizes a given clip, the others wait for it
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            clip = self.get(key)
+            if clip is None:
+                with self._lock:
+                    self.misses += 1
+                with tracer.span("tts.synthesize", engine=backend.name, chars=len(text)):
+                    audio_bytes = backend.synthesize(text.strip(), lang, voice)
+                clip = self.put(key, audio_bytes, backend.mime_type)
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return clip
+
+    def stats(self):
+        """Returns hit/miss counters and the memory tier usage."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "clips": len(self._clips),
+                "bytes": self._size,
+            }
+
+
+tts_cache = TTSCache(
+    max_bytes=int(os.environ.get("TTS_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+    disk_dir=os.environ.get("TTS_CACHE_DIR") or None,
+)
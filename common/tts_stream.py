@@ -0,0 +1,133 @@
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit.components.v1 as components
+
+from common.media_store import media_url
+from common.tracing import tracer
+from common.tts_backends import get_backend
+from common.tts_cache import cache_key, tts_cache
+
+# Sentence boundaries: end punctuation followed by whitespace, or a line break
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+
+# Bounded pool shared by every session so a long answer cannot spawn unbounded synthesis calls
+_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("TTS_STREAM_WORKERS", 4)),
+    thread_name_prefix="tts-stream",
+)
+
+# Each chunk gets its own player. A player starts only once the previous chunk
+# has ended; the progress is shared through sessionStorage (for players that
+# load late) and a BroadcastChannel (for players that are already waiting).
+_CHUNK_PLAYER = """
+<audio id="chunk" controls style="width: 100%; height: 40px;"
+       src="{src}"></audio>
+<script>
+const group = "{group}";
+const index = {index};
+const autoplay = {autoplay};
+const audio = document.getElementById("chunk");
+const channel = new BroadcastChannel(group);
+
+function play() {{
+    if (autoplay) audio.play().catch(() => {{}});
+}}
+
+channel.onmessage = (event) => {{
+    if (event.data === index - 1) play();
+}};
+audio.onended = () => {{
+    sessionStorage.setItem(group, String(index));
+    channel.postMessage(index);
+}};
+
+const ended = sessionStorage.getItem(group);
+if (index === 0 || (ended !== null && Number(ended) >= index - 1)) play();
+</script>
+"""
+
+
+def _synthesize(session_id, text, lang, voice, backend):
+    """Synthesizes one chunk on the pool, timed under the session that asked for it."""
+    with tracer.session(session_id):
+        return tts_cache.get_or_synthesize(text, lang, voice, backend)
+
+
+def split_sentences(text, max_chars=200):
+    """
+    Splits plain text into chunks for synthesis.
+    The first sentence is kept on its own so it is ready as soon as possible,
+    later short sentences are merged and overly long ones are cut at a space.
+    Args:
+        text (str): Plain text (already stripped of Markdown)
+        max_chars (int): Longest chunk sent to the synthesizer
+    """
+    sentences = [s.strip() for s in _SENTENCE_END.split(text) if s.strip()]
+
+    pieces = []
+    for sentence in sentences:
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            pieces.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if sentence:
+            pieces.append(sentence)
+
+    chunks = []
+    for piece in pieces:
+        if len(chunks) > 1 and len(chunks[-1]) + len(piece) < max_chars:
+            chunks[-1] = f"{chunks[-1]} {piece}"
+        else:
+            chunks.append(piece)
+    return chunks
+
+
+def stream_text_to_speech(plain_text, autoplay=True, lang="en", voice="com"):
+    """
+    Speaks text chunk by chunk so playback starts before the whole answer is synthesized.
+    Chunks are synthesized concurrently and their players are rendered in order;
+    the joined clip is stored in the TTS cache so replaying the full text later is free.
+    Args:
+        plain_text (str): Text to speak, already stripped of Markdown
+        autoplay (bool): Whether to play the chunks automatically
+        lang (str): Language code passed to the synthesizer
+        voice (str): Voice or accent (the gTTS top-level domain for gTTS)
+    """
+    chunks = split_sentences(plain_text)
+    if not chunks:
+        return None
+
+    backend = get_backend()
+    stream_span = tracer.begin("tts.stream", chunks=len(chunks), engine=backend.name)
+    session_id = tracer.current_session()
+    futures = [_pool.submit(_synthesize, session_id, chunk, lang, voice, backend) for chunk in chunks]
+    group = f"tts-{uuid.uuid4().hex}"
+
+    clips = []
+    for index, future in enumerate(futures):
+        clip = future.result()
+        clips.append(clip)
+        components.html(
+            _CHUNK_PLAYER.format(
+                src=media_url(clip.audio_bytes, clip.mime_type, clip.key),
+                group=group,
+                index=index,
+                autoplay=str(autoplay).lower(),
+            ),
+            height=50,
+        )
+        if index == 0:
+            # When playback can start
+            tracer.record("tts.first_chunk", time.perf_counter() - stream_span.start_time)
+
+    stream_span.end()
+    return tts_cache.put(
+        cache_key(plain_text, lang, voice, backend.name),
+        backend.join([clip.audio_bytes for clip in clips]),
+        backend.mime_type,
+    )
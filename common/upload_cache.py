@@ -0,0 +1,158 @@
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import google.generativeai as genai
+
+from common.gemini_client import gemini_client
+from common.scratch import scratch
+
+# Files uploaded through the Gemini File API are deleted after 48 hours
+FILE_LIFETIME = 48 * 60 * 60
+# Forget handles a bit early so we never hand out a file that is about to expire
+EXPIRY_MARGIN = 60 * 60
+
+
+def content_digest(data):
+    """Returns the SHA-256 hex digest of some bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(path):
+    """Returns the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class UploadCache:
+    """
+    Maps image content hashes to Gemini file handles.
+    Identical images are uploaded once per process, whichever session or path
+    they come from, until the remote file is close to expiring.
+    """
+
+    def __init__(self, ttl=FILE_LIFETIME - EXPIRY_MARGIN):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}  # digest -> (file handle, expires_at)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _expires_at(self, uploaded_file):
+        """Uses the server's expiration time when it is known, the TTL otherwise."""
+        expires_at = time.time() + self.ttl
+        expiration_time = getattr(uploaded_file, "expiration_time", None)
+        if isinstance(expiration_time, datetime):
+            if expiration_time.tzinfo is None:
+                expiration_time = expiration_time.replace(tzinfo=timezone.utc)
+            expires_at = min(expires_at, expiration_time.timestamp() - EXPIRY_MARGIN)
+        return expires_at
+
+    def get(self, digest):
+        """Returns the live file handle for a digest, or None."""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            uploaded_file, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[digest]
+                return None
+            self.hits += 1
+            return uploaded_file
+
+    def digest_of(self, uploaded_file):
+        """Returns the content hash a cached handle was uploaded for, or None."""
+        name = getattr(uploaded_file, "name", None)
+        with self._lock:
+            for digest, (cached_file, _) in self._entries.items():
+                if cached_file is uploaded_file or (name and getattr(cached_file, "name", None) == name):
+                    return digest
+        return None
+
+    def put(self, digest, uploaded_file):
+        """Adds a handle uploaded earlier, e.g. by a previous server run."""
+        with self._lock:
+            self._entries[digest] = (uploaded_file, self._expires_at(uploaded_file))
+
+    def upload(self, path, display_name=None, digest=None, mime_type=None):
+        """
+        Uploads an image file unless the same content was already uploaded.
+        Args:
+            path (str): Path to the image file
+            display_name (str): Name shown in the File API, defaults to the file name
+            digest (str): Content hash, computed from the file when not given
+            mime_type (str): MIME type, guessed from the path when not given
+        """
+        return self._get_or_upload(
+            digest or file_digest(path),
+            lambda: gemini_client.call(
+                genai.upload_file,
+                path=path,
+                mime_type=mime_type,
+                display_name=display_name or os.path.basename(path),
+            ),
+        )
+
+    def upload_image(self, image, display_name=None):
+        """
+        Uploads an in-memory ImageInput unless the same content was already uploaded.
+        Args:
+            image (ImageInput): The image to upload
+            display_name (str): Name shown in the File API, defaults to the image name
+        """
+        def upload():
+            try:
+                return gemini_client.call(
+                    genai.upload_file,
+                    path=image.open(),
+                    mime_type=image.mime_type,
+                    display_name=display_name or image.name,
+                )
+            except TypeError:
+                # Older SDKs only take a path: use a private scratch file, removed right after
+                with scratch.file(image.buffer, suffix=os.path.splitext(image.name)[1]) as path:
+                    return gemini_client.call(
+                        genai.upload_file,
+                        path=path,
+                        mime_type=image.mime_type,
+                        display_name=display_name or image.name,
+                    )
+
+        return self._get_or_upload(image.digest, upload)
+
+    def _get_or_upload(self, digest, upload):
+        """Returns the cached handle for a digest, calling upload() on a miss."""
+        uploaded_file = self.get(digest)
+        if uploaded_file is not None:
+            return uploaded_file
+
+        # Concurrent sessions uploading the same image wait for a single upload
+        with self._lock:
+            key_lock = self._key_locks.setdefault(digest, threading.Lock())
+        with key_lock:
+            uploaded_file = self.get(digest)
+            if uploaded_file is None:
+                uploaded_file = upload()
+                with self._lock:
+                    self.misses += 1
+                    self._entries[digest] = (uploaded_file, self._expires_at(uploaded_file))
+                    self._prune()
+        with self._lock:
+            self._key_locks.pop(digest, None)
+        return uploaded_file
+
+    def _prune(self):
+        """Drops expired entries. Called with the lock held."""
+        now = time.time()
+        for digest in [d for d, (_, expires_at) in self._entries.items() if expires_at <= now]:
+            del self._entries[digest]
+
+
+upload_cache = UploadCache()
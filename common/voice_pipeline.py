@@ -0,0 +1,120 @@
+import queue
+import threading
+
+from streamlit_webrtc import AudioProcessorBase
+
+from common.audio_norm import AudioNormalizer
+from common.stt_backends import get_backend, transcription_pool
+from common.tracing import tracer
+from common.voice_vad import UtteranceSegmenter
+
+
+class VoicePipeline:
+    """
+    Voice input for one Streamlit session.
+    Keep a single instance in st.session_state: it owns the STT backend, the
+    audio buffers and the transcript queue, so it survives reruns. WebRTC
+    processors created by audio_processor() only forward frames to it.
+    Transcripts are released in the order the utterances were spoken, even
+    when the worker pool finishes them out of order.
+    """
+
+    def __init__(self, backend=None, sample_rate=16000):
+        self.backend = backend or get_backend()
+        self.sample_rate = sample_rate
+        self.normalizer = AudioNormalizer(out_rate=sample_rate)
+        self.segmenter = UtteranceSegmenter(sample_rate)
+        self.running = False
+        # Recognition runs on pool threads; attribute its spans to the session that owns the pipeline
+        self.session_id = tracer.current_session()
+        self._transcripts = queue.Queue()
+        # recv() runs on the WebRTC media thread, start/stop/poll on the script thread
+        self._lock = threading.Lock()
+        self._next_sequence = 0
+        self._release_sequence = 0
+        self._finished = {}
+
+    def start(self):
+        """Starts accepting audio frames. Calling it again is a no-op."""
+        with self._lock:
+            self.running = True
+
+    def stop(self):
+        """Stops accepting frames; an utterance in progress is still recognized."""
+        with self._lock:
+            if not self.running:
+                return
+            self.running = False
+            utterance = self.segmenter.flush()
+            sequence = self._take_sequence(utterance)
+        if utterance is not None:
+            self._submit(sequence, utterance)
+
+    def process_frame(self, frame):
+        """Feeds one WebRTC audio frame (called from the media thread)."""
+        with self._lock:
+            if not self.running:
+                return
+            utterance = self.segmenter.push(self.normalizer.process(frame))
+            sequence = self._take_sequence(utterance)
+        if utterance is not None:
+            self._submit(sequence, utterance)
+
+    def _take_sequence(self, utterance):
+        """Numbers an utterance (None for no utterance) in spoken order. Called with the lock held."""
+        if utterance is None:
+            return None
+        sequence = self._next_sequence
+        self._next_sequence += 1
+        return sequence
+
+    def _submit(self, sequence, utterance):
+        """
+        Queues an utterance for recognition. Called without the lock: a
+        recognition that already finished runs its callback, which takes the
+        lock, right away on this thread.
+        """
+        future = transcription_pool.submit(self._transcribe, utterance)
+        future.add_done_callback(lambda done: self._finish(sequence, done))
+
+    def _transcribe(self, utterance):
+        with tracer.session(self.session_id), tracer.span("stt.transcribe", seconds=len(utterance) / self.sample_rate):
+            return self.backend.transcribe(utterance, self.sample_rate)
+
+    def _finish(self, sequence, future):
+        """Records a finished recognition and releases transcripts in order."""
+        text = future.result() if future.exception() is None else None
+        with self._lock:
+            self._finished[sequence] = text
+            while self._release_sequence in self._finished:
+                text = self._finished.pop(self._release_sequence)
+                self._release_sequence += 1
+                if text:
+                    self._transcripts.put(text)
+
+    def poll(self):
+        """
+        Returns every transcript finished since the last call, without blocking.
+        Each transcript is returned exactly once.
+        """
+        transcripts = []
+        while True:
+            try:
+                transcripts.append(self._transcripts.get_nowait())
+            except queue.Empty:
+                return transcripts
+
+    def audio_processor(self):
+        """Factory for webrtc_streamer's audio_processor_factory."""
+        return _PipelineAudioProcessor(self)
+
+
+class _PipelineAudioProcessor(AudioProcessorBase):
+    """Forwards received frames to a VoicePipeline and passes them through."""
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+
+    def recv(self, frame):
+        self.pipeline.process_frame(frame)
+        return frame
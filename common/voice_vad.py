@@ -0,0 +1,128 @@
+import numpy as np
+
+
+class UtteranceSegmenter:
+    """
+    Splits a stream of mono int16 frames into utterances.
+    A frame counts as speech when its RMS energy is above both a fixed floor and
+    a multiple of the adaptive noise level, and its zero-crossing rate is below
+    the level of broadband noise. Speech starts after `start_frames` speech
+    frames in a row and ends after `hangover_ms` of silence. Samples accumulate
+    in a preallocated buffer; a short pre-roll ring buffer keeps the first
+    syllable. Frames are copied, so callers may reuse their buffers.
+    """
+
+    def __init__(
+        self,
+        sample_rate,
+        energy_threshold=0.01,
+        noise_ratio=3.0,
+        max_zero_crossing_rate=0.35,
+        start_frames=3,
+        hangover_ms=600,
+        preroll_ms=200,
+        min_utterance_ms=300,
+        max_utterance_s=15,
+    ):
+        self.sample_rate = sample_rate
+        self.energy_threshold = energy_threshold
+        self.noise_ratio = noise_ratio
+        self.max_zero_crossing_rate = max_zero_crossing_rate
+        self.start_frames = start_frames
+        self.hangover_samples = sample_rate * hangover_ms // 1000
+        self.min_utterance_samples = sample_rate * min_utterance_ms // 1000
+        self.noise_level = energy_threshold
+        self.in_speech = False
+
+        self._buffer = np.zeros(sample_rate * max_utterance_s, dtype=np.int16)
+        self._length = 0
+        self._preroll = np.zeros(max(1, sample_rate * preroll_ms // 1000), dtype=np.int16)
+        self._preroll_end = 0
+        self._preroll_filled = 0
+        self._speech_run = 0
+        self._silence = 0
+
+    def is_speech(self, samples):
+        """Classifies one frame and updates the noise level on silence."""
+        if not len(samples):
+            return False
+        scaled = samples.astype(np.float32) / 32768.0
+        rms = float(np.sqrt(np.mean(scaled * scaled)))
+        zero_crossing_rate = float(np.count_nonzero(np.diff(np.signbit(scaled)))) / len(scaled)
+        speech = (
+            rms > max(self.energy_threshold, self.noise_level * self.noise_ratio)
+            and zero_crossing_rate < self.max_zero_crossing_rate
+        )
+        if not speech:
+            self.noise_level = 0.95 * self.noise_level + 0.05 * rms
+        return speech
+
+    def _append(self, samples):
+        """Copies samples into the ring buffer; returns False when it is full."""
+        room = len(self._buffer) - self._length
+        count = min(room, len(samples))
+        self._buffer[self._length:self._length + count] = samples[:count]
+        self._length += count
+        return count == len(samples)
+
+    def _remember(self, samples):
+        """Writes samples into the pre-roll ring buffer, overwriting the oldest."""
+        size = len(self._preroll)
+        samples = samples[-size:]
+        first = min(len(samples), size - self._preroll_end)
+        self._preroll[self._preroll_end:self._preroll_end + first] = samples[:first]
+        self._preroll[:len(samples) - first] = samples[first:]
+        self._preroll_end = (self._preroll_end + len(samples)) % size
+        self._preroll_filled = min(size, self._preroll_filled + len(samples))
+
+    def _take(self):
+        """Returns the buffered utterance and resets the buffer."""
+        utterance = self._buffer[:self._length].copy()
+        self._length = 0
+        self._silence = 0
+        self._speech_run = 0
+        self.in_speech = False
+        return utterance if len(utterance) >= self.min_utterance_samples else None
+
+    def flush(self):
+        """
+        Ends the stream, e.g. when the microphone stops.
+        Returns:
+            np.ndarray or None: The utterance in progress, if there was one
+        """
+        self._preroll_filled = 0
+        if not self.in_speech:
+            self._speech_run = 0
+            return None
+        return self._take()
+
+    def push(self, samples):
+        """
+        Adds one frame of mono int16 samples.
+        Returns:
+            np.ndarray or None: A complete utterance when one just ended
+        """
+        speech = self.is_speech(samples)
+
+        if not self.in_speech:
+            self._remember(samples)
+            self._speech_run = self._speech_run + 1 if speech else 0
+            if self._speech_run >= self.start_frames:
+                self.in_speech = True
+                # Oldest part of the ring first, then the part written most recently
+                start = (self._preroll_end - self._preroll_filled) % len(self._preroll)
+                if start + self._preroll_filled > len(self._preroll):
+                    self._append(self._preroll[start:])
+                    self._append(self._preroll[:self._preroll_end])
+                else:
+                    self._append(self._preroll[start:start + self._preroll_filled])
+                self._preroll_filled = 0
+            return None
+
+        if not self._append(samples):
+            # The utterance is longer than the buffer: hand over what we have
+            return self._take()
+        self._silence = 0 if speech else self._silence + len(samples)
+        if self._silence >= self.hangover_samples:
+            return self._take()
+        return None
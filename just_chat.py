@@ -1,40 +1,54 @@
 import streamlit as st
-import google.generativeai as gen_ai
 
-gen_ai.configure(api_key="")
-model = gen_ai.GenerativeModel('gemini-pro')
+from common.chat_stream import stream_reply
+from common.chat_view import render_history
+from common.services import get_model, resume_conversation
+from common.tracing import render_panel, tracer
 
+# Times this script run; render_panel() at the bottom of the page ends it
+run_span = tracer.begin("page.run")
 
-# Function to translate roles between Gemini-Pro and Streamlit terminology
-def translate_role_for_streamlit(user_role):
-    if user_role == "model":
-        return "assistant"
-    else:
-        return user_role
+model = get_model("gemini-pro")
 
+# No shared image, so answers depend on the whole conversation: no response cache
+RESPONSE_CACHE = False
 
-# Initialize chat session in Streamlit if not already present
-if "chat_session" not in st.session_state:
-    st.session_state.chat_session = model.start_chat(history=[])
+# Number of recent chat messages rendered on every rerun; older ones are collapsed
+HISTORY_WINDOW = 10
+
+
+# Function to render one (role, text) message of the chat history
+def render_message(index, message, recent):
+    role, text = message
+    with st.chat_message(role):
+        st.markdown(text)
+
+
+# Initialize chat session in Streamlit if not already present, resuming this tab's saved
+# conversation without calling the model (older turns are folded into a summary to keep
+# each request within a token budget, and the history moves to disk past its memory budget)
+if "chat_history" not in st.session_state:
+    _, st.session_state.chat_history, st.session_state.chat_session = resume_conversation(model, RESPONSE_CACHE)
 
 
 # Display the chatbot's title on the page
 st.title("🤖 Gemini Pro - ChatBot")
 
-# Display the chat history
-for message in st.session_state.chat_session.history:
-    with st.chat_message(translate_role_for_streamlit(message.role)):
-        st.markdown(message.parts[0].text)
+# Display the chat history, collapsing older messages
+render_history(st.session_state.chat_history, render_message, window=HISTORY_WINDOW)
 
 # Input field for user's message
 user_prompt = st.chat_input("Ask Gemini-Pro...")
 if user_prompt:
     # Add user's message to chat and display it
+    st.session_state.chat_history.append(("user", user_prompt))
     st.chat_message("user").markdown(user_prompt)
 
-    # Send user's message to Gemini-Pro and get the response
-    gemini_response = st.session_state.chat_session.send_message(user_prompt)
-
-    # Display Gemini-Pro's response
+    # Send user's message to Gemini-Pro and display the response as it streams in
     with st.chat_message("assistant"):
-        st.markdown(gemini_response.text)
+        response_text, _ = stream_reply(st.session_state.chat_session, user_prompt)
+        if response_text is not None:
+            st.session_state.chat_history.append(("assistant", response_text))
+
+# Optional latency panel (p50/p95 per stage) in the sidebar
+render_panel(run_span)
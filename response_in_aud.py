@@ -1,69 +1,53 @@
 import streamlit as st
-import google.generativeai as gen_ai
-from PIL import Image
-import os
-from gtts import gTTS
-import base64
-import re
-from datetime import datetime
-
-# Configure Gemini API
-gen_ai.configure(api_key="")
-gemini = gen_ai.GenerativeModel("gemini-1.5-flash")
-
-def upload_image_to_gemini(image_path):
-    uploaded_file = gen_ai.upload_file(path=image_path, display_name=os.path.basename(image_path))
-    return uploaded_file
-
-# Helper functions for text to speech and cleaning markdown
-def strip_markdown(text):
-    """
-    Removes Markdown syntax, leaving plain text.
-    """
-    text = re.sub(r"[*_`~]", "", text)
-    return text
 
-def text_to_speech(text, autoplay=True):
+from common.chat_stream import stream_reply
+from common.chat_view import render_history
+from common.description_cache import description_cache
+from common.image_input import ImageInput
+from common.image_prep import PrepConfig, preprocess
+from common.scratch import scratch
+from common.services import get_model, resume_conversation, save_image, speak, text_to_speech, upload_image_to_gemini
+from common.tracing import render_panel, tracer
+
+# Times this script run; render_panel() at the bottom of the page ends it
+run_span = tracer.begin("page.run")
+
+gemini = get_model("gemini-1.5-flash")
+
+# Downscale photos before they are uploaded; set to None to send originals
+IMAGE_PREP = PrepConfig(max_side=1536, format="JPEG", quality=85)
+
+# Answer repeated questions about the same image from the shared response cache (False opts out)
+RESPONSE_CACHE = True
+
+# Sweeps orphaned scratch files and temp files older versions left in the working directory
+scratch.start()
+
+# Number of recent chat messages rendered on every rerun; older ones are collapsed
+HISTORY_WINDOW = 10
+
+def render_message(index, item, recent):
     """
-    Converts text to speech and displays an audio player.
-    Args:
-        text (str): Text to convert to speech
-        autoplay (bool): Whether to autoplay the audio
+    Renders a (role, message) pair from the chat history.
+    Audio is only prepared for recent messages.
     """
-    plain_text = strip_markdown(text)
-    
-    # Generate unique filename using timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    audio_file_path = f"audio_{timestamp}.mp3"
-    
-    # Generate audio
-    tts = gTTS(text=plain_text, lang='en')
-    tts.save(audio_file_path)
-    
-    # Read audio content
-    with open(audio_file_path, 'rb') as audio_file:
-        audio_bytes = audio_file.read()
-    
-    # Convert to base64 for embedding
-    audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
-    
-    # Display audio player
-    st.markdown(f"""
-        <audio autoplay="{str(autoplay).lower()}" controls>
-            <source src="data:audio/mp3;base64,{audio_base64}" type="audio/mp3">
-        </audio>
-        """, unsafe_allow_html=True)
+    role, message = item
+    with st.chat_message(role):
+        st.markdown(message)
+
+        # Convert assistant's responses to speech
+        if role == "assistant" and recent:
+            text_to_speech(message, autoplay=False)
 
 # Streamlit UI
 st.title("📸 Gemini Pro - Image ChatBot")
 
 # Initialize chat session and history in Streamlit session state
-if "chat_session" not in st.session_state:
-    st.session_state.chat_session = gemini.start_chat(history=[])
+# Resume this tab's saved conversation without calling the model; the history moves to
+# disk once it outgrows the session's memory budget
 if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
-if "image_description_done" not in st.session_state:
-    st.session_state.image_description_done = False  # Track if the image description step is completed
+    saved, st.session_state.chat_history, st.session_state.chat_session = resume_conversation(gemini, RESPONSE_CACHE)
+    st.session_state.image_description_done = bool(saved and saved.description)
 
 # Step 1: Select Input Method
 st.subheader("Step 1: Choose Image Input Method")
@@ -71,45 +55,45 @@ input_method = st.radio("Select how you want to provide an image:", ("Upload Ima
 
 uploaded_image = None
 captured_image = None
-image_path = None
+image_input = None
 
 # Handle user selection
 if input_method == "Upload Image":
     uploaded_image = st.file_uploader("Upload an image", type=["png", "jpg", "jpeg"])
     if uploaded_image:
-        # Save uploaded image to a temporary path
-        temp_path = f"temp_uploaded_image.{uploaded_image.name.split('.')[-1]}"
-        with open(temp_path, "wb") as f:
-            f.write(uploaded_image.getbuffer())
-        image_path = temp_path
+        # Keep the uploaded image in memory
+        image_input = ImageInput.from_upload(uploaded_image)
 elif input_method == "Capture Image":
     captured_image = st.camera_input("Capture an image using your camera")
     if captured_image:
-        # Save captured image to a temporary path
-        image_path = "temp_captured_image.png"
-        with open(image_path, "wb") as f:
-            f.write(captured_image.getbuffer())
+        # Keep the captured image in memory
+        image_input = ImageInput.from_upload(captured_image, name="captured_image.png")
 
 # Process the image
-if image_path:
+if image_input:
+    # Downscale and re-encode the image before it is displayed and uploaded
+    image_input, prep_stats = preprocess(image_input, IMAGE_PREP)
+
     # Display the image
-    image = Image.open(image_path)
-    st.image(image, caption="Uploaded/Captured Image", use_column_width=True)
+    st.image(image_input.data, caption="Uploaded/Captured Image", use_column_width=True)
+    if prep_stats:
+        st.caption(prep_stats.summary)
 
     # Step 2: Upload to Gemini
     st.subheader("Step 2: Uploading the Image to Gemini")
     with st.spinner("Uploading the image..."):
-        gemini_file = upload_image_to_gemini(image_path)
+        gemini_file = upload_image_to_gemini(image_input)
     st.success(f"Image uploaded successfully as: {gemini_file.uri}")
 
     # Step 3: Automatically Describe the Image (only once)
     if not st.session_state.image_description_done:
         st.subheader("Step 3: Gemini Describes the Image")
         with st.spinner("Generating a description..."):
-            description_response = gemini.generate_content([gemini_file, "What is in the image?"])
-        description_text = description_response.text
+            # Served from the cache when this image was already described
+            description_text = description_cache.describe(gemini, gemini_file, image_input.digest)
         st.session_state.chat_history.append(("assistant", description_text))  # Save to chat history
         st.session_state.image_description_done = True  # Mark description as completed
+        save_image(gemini, image_input, gemini_file, description_text)  # Lets this tab resume the chat
         st.write("**Image Description:**")
         st.markdown(description_text)
 
@@ -119,14 +103,8 @@ if image_path:
     # Step 4: Chat about the Image
     st.subheader("Step 4: Chat about the Image")
 
-    # Display the chat history
-    for role, message in st.session_state.chat_history:
-        with st.chat_message(role):
-            st.markdown(message)
-
-            # Convert assistant's responses to speech
-            if role == "assistant":
-                text_to_speech(message, autoplay=False)
+    # Display the chat history, collapsing older messages
+    render_history(st.session_state.chat_history, render_message, window=HISTORY_WINDOW)
 
     # User input for questions about the image
     user_prompt = st.chat_input("Ask Gemini-Pro about the image...")
@@ -135,20 +113,18 @@ if image_path:
         st.session_state.chat_history.append(("user", user_prompt))
         st.chat_message("user").markdown(user_prompt)
 
-        # Send message to Gemini with the image and user's question
-        gemini_response = st.session_state.chat_session.send_message([gemini_file, user_prompt])
-        response_text = gemini_response.text
-
-        # Add Gemini's response to chat history and display it
-        st.session_state.chat_history.append(("assistant", response_text))
+        # Stream Gemini's answer to the image and user's question as it is generated
         with st.chat_message("assistant"):
-            st.markdown(response_text)
+            response_text, _ = stream_reply(st.session_state.chat_session, [gemini_file, user_prompt])
+
+            # Add Gemini's response to chat history once it is complete, unless it was dropped
+            if response_text is not None:
+                st.session_state.chat_history.append(("assistant", response_text))
 
-            # Convert Gemini's response to speech
-            text_to_speech(response_text, autoplay=True)
+                # Speak the response sentence by sentence so playback starts right away
+                speak(response_text)
 else:
     st.info("Please select and provide an image to proceed.")
 
-# Clean up temporary files
-if image_path:
-    os.remove(image_path)
+# Optional latency panel (p50/p95 per stage) in the sidebar
+render_panel(run_span)
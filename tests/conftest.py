@@ -0,0 +1,12 @@
+import pytest
+from google.generativeai import GenerativeModel
+
+from tests.sdk_fakes import FakeClient
+
+
+@pytest.fixture
+def sdk_model():
+    """A real GenerativeModel (and so real ChatSessions and streams) on a FakeClient."""
+    model = GenerativeModel("gemini-test")
+    model._client = FakeClient()
+    return model
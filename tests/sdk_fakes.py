@@ -0,0 +1,40 @@
+"""Real SDK responses and chat sessions on a scripted client, without network access."""
+from google.generativeai import protos
+
+STOP = protos.Candidate.FinishReason.STOP
+SAFETY = protos.Candidate.FinishReason.SAFETY
+RECITATION = protos.Candidate.FinishReason.RECITATION
+MAX_TOKENS = protos.Candidate.FinishReason.MAX_TOKENS
+
+
+def chunk(text, finish_reason=None):
+    """One streamed GenerateContentResponse chunk with `text`."""
+    candidate = protos.Candidate(content=protos.Content(role="model", parts=[protos.Part(text=text)]))
+    if finish_reason is not None:
+        candidate.finish_reason = finish_reason
+    return protos.GenerateContentResponse(candidates=[candidate])
+
+
+def answer(*pieces, finish_reason=STOP):
+    """The chunks of a streamed answer made of `pieces`, ending with `finish_reason`."""
+    return [chunk(piece) for piece in pieces[:-1]] + [chunk(pieces[-1], finish_reason)]
+
+
+class FakeClient:
+    """
+    Stands in for the SDK's generative service client: each call returns the
+    next scripted answer, a list of chunks (or an iterable raising mid-stream).
+    """
+
+    def __init__(self):
+        self.answers = []
+        self.requests = []
+
+    def stream_generate_content(self, request, **kwargs):
+        self.requests.append(request)
+        return iter(self.answers.pop(0))
+
+    def generate_content(self, request, **kwargs):
+        self.requests.append(request)
+        (response,) = self.answers.pop(0)
+        return response
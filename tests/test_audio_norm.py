@@ -0,0 +1,100 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from common.audio_norm import AudioNormalizer, PolyphaseResampler
+
+OUT_RATE = 16000
+TONE_HZ = 440
+SECONDS = 1.0
+
+
+def tone(rate, seconds=SECONDS, frequency=TONE_HZ, amplitude=0.5):
+    t = np.arange(int(rate * seconds)) / rate
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def fake_frame(samples, rate, channels, format_name):
+    """
+    A stand-in for av.AudioFrame holding `samples` (mono float32) on every
+    channel, shaped like PyAV's to_ndarray(): (channels, n) for planar
+    formats, (1, n * channels) interleaved for packed ones.
+    """
+    planar = format_name.endswith("p")
+    if format_name.startswith("s16"):
+        data = np.round(samples * np.iinfo(np.int16).max).astype(np.int16)
+    else:
+        data = samples.astype(np.float32)
+    data = np.repeat(data[None, :], channels, axis=0)
+    if not planar:
+        data = data.T.reshape(1, -1)
+    return SimpleNamespace(
+        to_ndarray=lambda: data,
+        sample_rate=rate,
+        layout=SimpleNamespace(channels=[object()] * channels),
+        format=SimpleNamespace(name=format_name, is_planar=planar),
+    )
+
+
+def peak_frequency(samples, rate):
+    spectrum = np.abs(np.fft.rfft(samples.astype(np.float64)))
+    return np.fft.rfftfreq(len(samples), 1 / rate)[np.argmax(spectrum)]
+
+
+def stream(normalizer, signal, rate, channels, format_name, frame_samples):
+    outputs = []
+    for start in range(0, len(signal), frame_samples):
+        block = signal[start:start + frame_samples]
+        outputs.append(normalizer.process(fake_frame(block, rate, channels, format_name)).copy())
+    return np.concatenate(outputs)
+
+
+@pytest.mark.parametrize(
+    "rate, channels, format_name",
+    [
+        (48000, 2, "s16"),  # browser default: packed stereo int16
+        (44100, 2, "fltp"),  # planar float
+        (16000, 1, "s16"),  # already at the target rate
+        (8000, 1, "s16"),  # telephone-band input is upsampled
+    ],
+)
+def test_streamed_frames_keep_duration_and_pitch(rate, channels, format_name):
+    normalizer = AudioNormalizer(out_rate=OUT_RATE)
+    # 10 ms frames, like WebRTC delivers them
+    pcm = stream(normalizer, tone(rate), rate, channels, format_name, rate // 100)
+
+    assert pcm.dtype == np.int16
+    assert abs(len(pcm) - int(OUT_RATE * SECONDS)) <= 1
+    assert abs(peak_frequency(pcm, OUT_RATE) - TONE_HZ) <= 1.0
+    # The level survives downmixing and resampling (0.5 full scale)
+    steady = pcm[OUT_RATE // 10:].astype(np.float64) / 32767
+    assert np.sqrt(np.mean(steady ** 2)) == pytest.approx(0.5 / np.sqrt(2), rel=0.05)
+
+
+@pytest.mark.parametrize("in_rate, out_rate", [(48000, 16000), (44100, 16000), (8000, 16000)])
+def test_resampler_is_continuous_across_blocks(in_rate, out_rate):
+    signal = tone(in_rate)
+    whole = PolyphaseResampler(in_rate, out_rate, max_block=len(signal)).process(signal).copy()
+
+    resampler = PolyphaseResampler(in_rate, out_rate)
+    rng = np.random.default_rng(0)
+    pieces, start = [], 0
+    while start < len(signal):
+        size = int(rng.integers(1, 2000))
+        pieces.append(resampler.process(signal[start:start + size]).copy())
+        start += size
+    streamed = np.concatenate(pieces)
+
+    assert len(streamed) == len(whole)
+    np.testing.assert_allclose(streamed, whole, atol=1e-5)
+    assert abs(peak_frequency(streamed, out_rate) - TONE_HZ) <= 1.0
+
+
+@pytest.mark.parametrize("rate", [48000, 16000])
+def test_frames_longer_than_max_block(rate):
+    normalizer = AudioNormalizer(out_rate=OUT_RATE, max_block=256)
+    pcm = stream(normalizer, tone(rate), rate, 2, "s16", 4096)
+
+    assert abs(len(pcm) - int(OUT_RATE * SECONDS)) <= 1
+    assert abs(peak_frequency(pcm, OUT_RATE) - TONE_HZ) <= 1.0
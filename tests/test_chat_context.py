@@ -0,0 +1,31 @@
+from common.chat_context import BoundedChat
+from tests.sdk_fakes import SAFETY, answer
+
+
+def texts(chat):
+    return [content.parts[0].text for content in chat.history]
+
+
+def test_partly_read_stream_does_not_break_the_chat(sdk_model):
+    chat = BoundedChat(sdk_model)
+    sdk_model._client.answers.append(answer("A cat ", "on a ", "mat."))
+    response = chat.send_message("What is it?", stream=True)
+    next(iter(response))  # e.g. a rerun stopped the page here
+
+    sdk_model._client.answers.append(answer("It is grey."))
+    chat.send_message("What colour is it?", stream=True).resolve()
+
+    assert texts(chat) == ["What colour is it?", "It is grey."]
+
+
+def test_blocked_answer_does_not_break_the_chat(sdk_model):
+    chat = BoundedChat(sdk_model)
+    sdk_model._client.answers.append(answer("The first half of an ans", finish_reason=SAFETY))
+    chat.send_message("What is it?", stream=True).resolve()
+
+    chat.record_turn("What colour is it?", "Grey.")
+    sdk_model._client.answers.append(answer("A grey cat."))
+
+    assert chat.speculate([])("Is it a cat?") == "A grey cat."
+    sent = sdk_model._client.requests[-1].contents
+    assert [content.parts[-1].text for content in sent] == ["What colour is it?", "Grey.", "Is it a cat?"]
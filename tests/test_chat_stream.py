@@ -0,0 +1,66 @@
+import pytest
+import streamlit as st
+
+from common.chat_context import BoundedChat
+from common.chat_stream import stream_reply
+from tests.sdk_fakes import SAFETY, answer, chunk
+
+
+class Rerun(BaseException):
+    """Stands in for the exception Streamlit raises to stop a script for a rerun."""
+
+
+def broken_stream(*pieces):
+    yield from (chunk(piece) for piece in pieces)
+    raise ConnectionResetError("connection reset by peer")
+
+
+def ask_again(chat, model):
+    model._client.answers.append(answer("Fine ", "now."))
+    text, _ = stream_reply(chat, "And now?", show_stats=False)
+    assert text == "Fine now."
+    assert [content.parts[0].text for content in chat.history] == ["And now?", "Fine now."]
+
+
+def test_complete_answer_is_returned(sdk_model):
+    chat = BoundedChat(sdk_model)
+    sdk_model._client.answers.append(answer("A cat ", "on a mat."))
+
+    text, stats = stream_reply(chat, "What is it?", show_stats=False)
+
+    assert text == "A cat on a mat."
+    assert stats.total_time >= 0
+    assert len(chat.history) == 2
+
+
+def test_blocked_answer_is_dropped(sdk_model):
+    chat = BoundedChat(sdk_model)
+    sdk_model._client.answers.append(answer("The first half of an ans", finish_reason=SAFETY))
+
+    assert stream_reply(chat, "What is it?", show_stats=False) == (None, None)
+    assert chat.history == []
+    ask_again(chat, sdk_model)
+
+
+def test_answer_broken_off_by_a_network_error_is_dropped(sdk_model):
+    chat = BoundedChat(sdk_model)
+    sdk_model._client.answers.append(broken_stream("The first half "))
+
+    assert stream_reply(chat, "What is it?", show_stats=False) == (None, None)
+    ask_again(chat, sdk_model)
+
+
+def test_answer_interrupted_by_a_rerun_is_dropped(sdk_model, monkeypatch):
+    chat = BoundedChat(sdk_model)
+    sdk_model._client.answers.append(answer("The first half ", "never shown."))
+
+    class Placeholder:
+        def markdown(self, text):
+            raise Rerun()
+
+    monkeypatch.setattr(st, "empty", Placeholder)
+    with pytest.raises(Rerun):
+        stream_reply(chat, "What is it?", show_stats=False)
+    monkeypatch.undo()
+
+    ask_again(chat, sdk_model)
@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+
+from common import conversation_store as conversation_module
+from common.conversation_store import ConversationStore
+
+
+@pytest.fixture
+def live_sessions(monkeypatch):
+    """Session ids that count as having a connected tab."""
+    live = set()
+    monkeypatch.setattr(conversation_module, "_is_live", lambda session_id: session_id in live)
+    return live
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ConversationStore(str(tmp_path / "conversations.db"), flush_interval=0.01)
+
+
+def saved_turns(store, conversation_id):
+    store.flush()
+    return store.load_turns(conversation_id, 0, 100)
+
+
+def test_a_conversation_open_in_a_live_tab_is_not_shared(store, live_sessions):
+    live_sessions.update({"tab-a", "tab-b"})
+    assert store.claim("chat", "tab-a")
+    # A duplicated tab or a shared link gets refused, so it forks a new conversation
+    assert not store.claim("chat", "tab-b")
+
+    first = store.log("chat")
+    first.session_id = "tab-a"
+    duplicate = store.log("chat")
+    duplicate.session_id = "tab-b"
+    first.append(0, "user", "What is in the image?")
+    duplicate.append(0, "user", "Something else entirely")
+    store.reset("chat", "tab-b")
+
+    assert saved_turns(store, "chat") == [("user", "What is in the image?")]
+
+
+def test_a_closed_tab_hands_its_conversation_over(store, live_sessions):
+    live_sessions.add("old-tab")
+    assert store.claim("chat", "old-tab")
+    live_sessions.discard("old-tab")  # closed, or reconnected as a new session
+    assert store.claim("chat", "new-tab")
+    store.save_turn("chat", 0, "user", "hello again", "new-tab")
+    assert saved_turns(store, "chat") == [("user", "hello again")]
+
+
+def test_saved_turns_are_never_overwritten(store, live_sessions):
+    store.save_turn("chat", 0, "user", "first", "tab-a")
+    store.save_turn("chat", 0, "user", "second", "tab-a")
+    assert saved_turns(store, "chat") == [("user", "first")]
+
+    # Starting over frees the positions again
+    store.reset("chat", "tab-a")
+    store.save_turn("chat", 0, "user", "new image", "tab-a")
+    assert saved_turns(store, "chat") == [("user", "new image")]
+
+
+class StalledConnection:
+    """A connection whose writer thread stalls on conversation "busy" and fails on "broken"."""
+
+    def __init__(self, db, release):
+        self.db = db
+        self.release = release
+
+    def execute(self, statement, params=()):
+        if threading.current_thread().name != "conversation-writer":
+            return self.db.execute(statement, params)
+        if "broken" in params:
+            raise ValueError("not a sqlite3.Error")
+        if "busy" in params:
+            self.release.wait(5)
+        return self.db.execute(statement, params)
+
+    def __enter__(self):
+        return self.db.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self.db.__exit__(*exc_info)
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+
+def test_loading_does_not_wait_for_other_conversations(store):
+    release = threading.Event()
+    connect = store._connect
+    store._connect = lambda: StalledConnection(connect(), release)
+    store.save_turn("broken", 0, "user", "lost", "tab-b")
+    store.flush()  # the writer survives the failed batch
+    store.save_turn("mine", 0, "user", "hello", "tab-a")
+    store.flush()
+    store.save_turn("busy", 0, "user", "slow disk", "tab-c")
+
+    start = time.perf_counter()
+    conversation = store.load("mine")
+    elapsed = time.perf_counter() - start
+    release.set()
+
+    assert elapsed < 1.0
+    assert conversation.turns == 1
+    assert store.load("busy").turns == 1
+    assert store.load("broken") is None
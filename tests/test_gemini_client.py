@@ -0,0 +1,66 @@
+import threading
+import time
+
+import pytest
+
+from common.gemini_client import GeminiClient
+
+
+def test_hung_calls_keep_their_slots_until_their_threads_return():
+    client = GeminiClient(max_in_flight=2, per_session=2, max_retries=0, timeout=0.2)
+    release = threading.Event()
+    results = {}
+
+    def hang():
+        release.wait(5)
+
+    def hung_call(name):
+        try:
+            client.call(hang, session_id=name)
+        except TimeoutError:
+            results[name] = "timed out"
+
+    hung = [threading.Thread(target=hung_call, args=(f"hung-{i}",)) for i in range(2)]
+    for thread in hung:
+        thread.start()
+    for thread in hung:
+        thread.join()
+    assert results == {"hung-0": "timed out", "hung-1": "timed out"}
+
+    # Both worker threads are still busy: a new call waits for a slot instead of
+    # timing out while queued for a thread, and runs once one returns
+    threading.Timer(0.3, release.set).start()
+    start = time.perf_counter()
+    assert client.call(lambda: "answer", session_id="other") == "answer"
+    assert time.perf_counter() - start >= 0.25
+
+
+def test_timed_out_calls_are_not_retried():
+    client = GeminiClient(max_in_flight=2, per_session=1, max_retries=4, base_delay=0.0, timeout=0.2)
+    release = threading.Event()
+    calls = []
+
+    def hang():
+        calls.append(1)
+        release.wait(3)
+
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        client.call(hang, session_id="user")
+    release.set()
+
+    assert time.perf_counter() - start < 1.0
+    assert len(calls) == 1
+
+
+def test_sdk_calls_get_the_timeout_as_their_request_deadline():
+    client = GeminiClient(timeout=7.0)
+
+    def generate_content(contents, request_options=None):
+        return request_options
+
+    def upload_file(path, mime_type=None):
+        return mime_type
+
+    assert client.call(generate_content, "hi", session_id="user") == {"timeout": 7.0}
+    assert client.call(upload_file, "cat.png", session_id="user") is None
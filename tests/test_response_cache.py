@@ -0,0 +1,110 @@
+import pytest
+
+from common.chat_context import BoundedChat
+from common.response_cache import ResponseCache
+from tests.sdk_fakes import MAX_TOKENS, RECITATION, SAFETY, answer
+
+DIFFERENT = [
+    (
+        "Can you solve question 3 on the worksheet step by step?",
+        "Can you solve question 4 on the worksheet step by step?",
+    ),
+    ("Why is the sky blue in this photo?", "Why isn't the sky blue in this photo?"),
+    ("Solve question three", "Solve question 4"),
+    ("Why can't I see the moon?", "Why can I see the moon?"),
+    ("Is 3 bigger than 4?", "Is 4 bigger than 3?"),
+    ("What color is the car on the left?", "What color is the car on the right?"),
+    ("Who is the man in the picture?", "Who is the woman in the picture?"),
+    ("Is the answer correct?", "Is the answer incorrect?"),
+    ("Is the dog chasing the cat?", "Is the cat chasing the dog?"),
+    ("What is in the box?", "What is on the box?"),
+    ("Who is this for?", "Who is this?"),
+    (
+        "Can you explain what the bar chart at the top of the worksheet shows about rainfall in March?",
+        "Can you explain what the bar chart at the top of the worksheet shows about rainfall in May?",
+    ),
+]
+SAME = [
+    ("What's in this picture?", "What is in this picture?"),
+    ("Can you explain the diagram?", "Could you explain this diagram please?"),
+    ("Solve question 3 step by step", "Can you solve question 3 step by step?"),
+    ("Solve question three", "solve question 3"),
+    ("What is the main idea of this page?", "What's the main idea of the page?"),
+    ("Summarize the text in the image", "Can you summarize the text in this image?"),
+    ("Explain the graph", "Explain this graph"),
+    ("What colour is the car?", "What color is the car?"),
+]
+
+
+@pytest.mark.parametrize("cached, asked", DIFFERENT)
+def test_different_questions_miss(cached, asked):
+    cache = ResponseCache()
+    cache.put("image", cached, "answer")
+
+    assert cache.get("image", asked) is None
+
+
+@pytest.mark.parametrize("cached, asked", SAME)
+def test_rephrased_questions_hit(cached, asked):
+    cache = ResponseCache()
+    cache.put("image", cached, "answer")
+
+    assert cache.get("image", asked) == "answer"
+
+
+def test_answers_are_kept_apart_per_bucket():
+    cache = ResponseCache()
+    cache.put("image-1", "What is in this picture?", "a cat")
+
+    assert cache.get("image-2", "What is in this picture?") is None
+
+
+
+class RecordingCache(ResponseCache):
+    """A ResponseCache that records the answers put into it."""
+
+    def __init__(self):
+        super().__init__()
+        self.answers = []
+
+    def put(self, bucket, question, text):
+        self.answers.append(text)
+        super().put(bucket, question, text)
+
+
+@pytest.fixture
+def cached():
+    return RecordingCache()
+
+
+@pytest.mark.parametrize("finish_reason", [SAFETY, RECITATION, MAX_TOKENS])
+def test_streamed_answers_cut_short_are_not_cached(sdk_model, cached, finish_reason):
+    chat = BoundedChat(sdk_model, response_cache=cached)
+    sdk_model._client.answers.append(answer("The first half ", "of an ans", finish_reason=finish_reason))
+    for _ in chat.send_message("What is it?", stream=True):
+        pass
+
+    assert cached.answers == []
+
+
+def test_answers_cut_short_are_not_cached(sdk_model, cached):
+    chat = BoundedChat(sdk_model, response_cache=cached)
+    sdk_model._client.answers.append(answer("The first half of an ans", finish_reason=MAX_TOKENS))
+    assert chat.send_message("What is it?").text == "The first half of an ans"
+
+    sdk_model._client.answers.append(answer("The first half of an ans", finish_reason=SAFETY))
+    with pytest.raises(ValueError):
+        chat.speculate([])("What colour is it?")
+
+    assert cached.answers == []
+
+
+def test_finished_answers_are_cached(sdk_model, cached):
+    chat = BoundedChat(sdk_model, response_cache=cached)
+    sdk_model._client.answers.append(answer("A cat ", "on a mat."))
+    for _ in chat.send_message("What is it?", stream=True):
+        pass
+    sdk_model._client.answers.append(answer("Grey."))
+    chat.speculate([])("What colour is it?")
+
+    assert cached.answers == ["A cat on a mat.", "Grey."]
@@ -0,0 +1,29 @@
+import os
+
+from common.scratch import ScratchSpace
+
+LEFTOVERS = [
+    "audio_20240101_120000.mp3",
+    "temp_uploaded_image.PNG",
+    "temp_captured_image.png",
+    "3f2b8c1e-9d4a-4c6b-8e2f-1a2b3c4d5e6f_cat photo.jpg",
+]
+OTHER_FILES = [
+    "3f2b8c1e-9d4a-4c6b-8e2f-1a2b3c4d5e6f_notes.txt",
+    "3f2b8c1e-9d4a-4c6b-8e2f-1a2b3c4d5e6f_data.csv",
+    "temp_uploaded_image.py",
+    "photo.png",
+]
+
+
+def test_sweep_legacy_only_removes_old_page_leftovers(tmp_path):
+    for name in LEFTOVERS + OTHER_FILES:
+        path = tmp_path / name
+        path.touch()
+        os.utime(path, (0, 0))
+    (tmp_path / "audio_20990101_120000.mp3").touch()  # recent: still in use
+
+    removed = ScratchSpace(str(tmp_path / "scratch")).sweep_legacy(str(tmp_path))
+
+    assert removed == len(LEFTOVERS)
+    assert sorted(os.listdir(tmp_path)) == sorted(OTHER_FILES + ["audio_20990101_120000.mp3"])
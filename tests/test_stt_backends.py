@@ -0,0 +1,21 @@
+import sys
+
+from common import stt_backends
+
+
+def test_local_engine_that_cannot_load_falls_back_to_google(monkeypatch):
+    monkeypatch.setattr(stt_backends, "_instances", {})
+    monkeypatch.setitem(sys.modules, "vosk", None)  # not installed
+    monkeypatch.setenv("STT_BACKEND", "vosk")
+
+    backend = stt_backends.get_backend()
+
+    assert isinstance(backend, stt_backends.GoogleSTT)
+    assert stt_backends.get_backend("google") is backend
+    assert stt_backends.get_backend() is backend
+
+
+def test_unknown_engine_falls_back_to_google(monkeypatch):
+    monkeypatch.setattr(stt_backends, "_instances", {})
+
+    assert isinstance(stt_backends.get_backend("whisper"), stt_backends.GoogleSTT)
@@ -0,0 +1,59 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip("streamlit_webrtc")
+
+from common import voice_pipeline  # noqa: E402
+
+
+class SyncPool:
+    """Runs transcriptions on the calling thread, so they are finished before add_done_callback."""
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class FakeBackend:
+    def transcribe(self, utterance, sample_rate):
+        if utterance == "offline":
+            raise ConnectionError("network is down")
+        return f"said {utterance}"
+
+
+class FakeSegmenter:
+    def __init__(self, utterance):
+        self.utterance = utterance
+
+    def flush(self):
+        return self.utterance
+
+    def push(self, samples):
+        return None
+
+
+def stop_in_thread(pipeline):
+    thread = threading.Thread(target=pipeline.stop, daemon=True)
+    thread.start()
+    thread.join(timeout=5)
+    return not thread.is_alive()
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    monkeypatch.setattr(voice_pipeline, "transcription_pool", SyncPool())
+    return voice_pipeline.VoicePipeline(backend=FakeBackend())
+
+
+@pytest.mark.parametrize("utterance, transcripts", [("hello", ["said hello"]), ("offline", [])])
+def test_stop_does_not_deadlock_when_recognition_finishes_immediately(pipeline, utterance, transcripts):
+    pipeline.segmenter = FakeSegmenter(utterance)
+    pipeline.start()
+    assert stop_in_thread(pipeline)
+    assert pipeline.poll() == transcripts